@@ -0,0 +1,73 @@
+import logging as log
+import time
+
+BLOCKING = 'blocking'
+BACKOFF = 'backoff'
+POLL = 'poll'
+MODES = (BLOCKING, BACKOFF, POLL)
+
+
+class Acquisition:
+    '''
+    How DepthAI.capture waits for the packets of a pipeline.
+
+    - 'blocking': get_available_nnet_and_data_packets(blocking=True) waits in depthai until packets
+      are available. Falls back to 'backoff' for a pipeline (or depthai version) without it
+    - 'backoff': the poll is non-blocking and every empty poll in a row sleeps twice as long as the
+      previous one, from min_delay up to max_delay, so packets are picked up at most max_delay late
+    - 'poll': the poll is repeated straight away, spinning a core while no packets are available
+
+    max_delay should be a fraction of the interval between the frames expected from the device; for
+    a stream at max_fps, for_fps() bounds it at half the interval.
+    '''
+
+    def __init__(self, mode: str = BLOCKING, max_delay: float = 1 / 60, min_delay: float = 0.0005,
+                 factor: float = 2.0):
+        if mode not in MODES:
+            raise ValueError(f'Unknown acquisition mode {mode}, expected one of {", ".join(MODES)}')
+        self.mode = mode
+        self.max_delay = max(max_delay, min_delay)
+        self.min_delay = min_delay
+        self.factor = factor
+        self.__delay = min_delay
+        self.__waits = 0
+        self.__waited = 0.0
+
+    @staticmethod
+    def for_fps(mode: str, fps: float, min_delay: float = 0.0005, fraction: float = 0.5) -> 'Acquisition':
+        '''The acquisition for a stream of fps frames per second, backing off to fraction of its interval.'''
+        return Acquisition(mode, fraction / fps if fps > 0 else 1 / 60, min_delay)
+
+    @property
+    def blocking(self) -> bool:
+        return self.mode == BLOCKING
+
+    @property
+    def stats(self) -> dict:
+        return {'mode': self.mode, 'waits': self.__waits, 'waited_seconds': round(self.__waited, 3)}
+
+    def poll(self, pipeline) -> tuple:
+        '''The (nnet_packets, data_packets) of the pipeline, waiting for them in 'blocking' mode.'''
+        if self.mode != BLOCKING:
+            return pipeline.get_available_nnet_and_data_packets()
+        try:
+            return pipeline.get_available_nnet_and_data_packets(blocking=True)
+        except TypeError:
+            log.warning('The pipeline cannot wait for packets, backing off on empty polls instead')
+            self.mode = BACKOFF
+            return pipeline.get_available_nnet_and_data_packets()
+
+    def idle(self) -> float:
+        '''Wait after an empty poll, returns the seconds slept.'''
+        if self.mode == POLL:
+            return 0.0
+        delay = self.__delay
+        time.sleep(delay)
+        self.__delay = min(delay * self.factor, self.max_delay)
+        self.__waits += 1
+        self.__waited += delay
+        return delay
+
+    def active(self) -> None:
+        '''Packets were polled, the next empty poll backs off from min_delay again.'''
+        self.__delay = self.min_delay
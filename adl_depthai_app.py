@@ -1,54 +1,598 @@
 import logging as log
+import os
 import sys
 import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
 
-from datariver.things.edge_thing import EdgeThing
-from datariver.utils import write_tag
-from depthai_helpers.cli_utils import parse_args
-from depthai_wrapper import DepthAI
-from config import DepthAIConfig
+from frame_queue import DropPolicy, FrameQueue, QueueClosed
+from startup_timing import startup_timer
+
+# The depthai, Data River and analytics modules are imported where they are first needed, so the
+# Data River can be brought up on a separate thread while the device boots.
 
 PROPERTIES_FILE = './etc/config/properties.json'
+APP_CONFIG_FILE = './etc/config/app.json'
+TRACE_RECORD_ENV_VAR = 'DEPTHAI_TRACE_RECORD'
+TRACE_REPLAY_ENV_VAR = 'DEPTHAI_TRACE_REPLAY'
+TRACE_REPLAY_SPEED_ENV_VAR = 'DEPTHAI_TRACE_REPLAY_SPEED'
 
 log.basicConfig(format='[ %(levelname)s ] %(message)s',
                 level=log.INFO, stream=sys.stdout)
 
-def init_edge_thing():
+DEFAULT_STREAM_ID = 'mcclean.home.oakd-1'
+DEFAULT_ENGINE_ID = 'oakd-1'
+
+
+def load_properties() -> dict:
     with open(PROPERTIES_FILE) as f:
-        properties_str = json.load(f)
-        properties_str = json.dumps(properties_str) if properties_str is not None else None
+        return json.load(f)
+
+
+def init_edge_thing(properties : dict = None):
+    from datariver.things.edge_thing import EdgeThing
+
+    if properties is None:
+        properties = load_properties()
+    properties_str = json.dumps(properties) if properties is not None else None
 
     return EdgeThing(properties_str=properties_str,
-                     tag_groups=['com.vision.data/DepthDetectionBox'],
+                     tag_groups=['com.vision.data/DepthDetectionBox', 'com.vision.data/Occupancy',
+                                 'com.vision.data/Health'],
                      thing_cls=['com.vision.data/DepthAI'])
 
 
+def start_edge_thing() -> Future:
+    '''Create the EdgeThing on a background thread, the Future resolves to it.'''
+    def create():
+        with startup_timer.phase('thing'):
+            return init_edge_thing()
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='datariver-init')
+    future = executor.submit(create)
+    executor.shutdown(wait=False)
+    return future
+
+
+DEFAULT_APP_CONFIG = {
+    'detection': {
+        'threshold': 0.5,
+        'labels': None,
+    },
+    'runtime_config': {
+        'enabled': False,
+        'file': './etc/config/runtime.json',
+        'interval': 1.0,
+    },
+    'publish_queue': {
+        'size': 4,
+        'drop_policy': DropPolicy.DROP_OLDEST.value,
+    },
+    'occupancy': {
+        'enabled': False,
+        'distance_threshold': 1.5,
+        'class_label': 'person',
+        'grid_above': 100,
+    },
+    'tracker': {
+        'enabled': False,
+        'iou_weight': 0.5,
+        'min_iou': 0.1,
+        'max_distance': 0.75,
+        'max_speed': 1.5,
+        'reid_window': 2.0,
+        'min_hits': 1,
+    },
+    'publish_policy': {
+        'enabled': False,
+        'max_rate': None,
+        'heartbeat': 1.0,
+        'position_tolerance': 0.05,
+        'box_tolerance': 0.01,
+    },
+    'batching': {
+        'enabled': False,
+        'max_frames': 10,
+        'window_ms': 100,
+        'latency_cap_ms': 0,
+    },
+    'devices': {
+        'enabled': False,
+        'ids': 'auto',
+        'publish': 'shared',
+        'stats_interval': 30.0,
+    },
+    'rate_control': {
+        'enabled': False,
+        'min_fps': 5.0,
+        'max_fps': None,
+        'target_lag_ms': 200,
+        'max_backlog': 2,
+        'decrease': 0.75,
+        'increase': 1.0,
+        'interval': 1.0,
+    },
+    'roi_depth': {
+        'enabled': False,
+        'output': 'dist',
+        'bins': 48,
+        'stride': 8,
+        'min_depth': 0.2,
+        'max_depth': 10.0,
+        'padding': 0.3,
+        'percentile': 25.0,
+        'min_valid_ratio': 0.1,
+    },
+    'video': {
+        'segment_mb': 256,
+        'segment_minutes': 10,
+        'max_segments': 24,
+        'max_total_mb': None,
+        'buffer_kb': 1024,
+        'queue_mb': 32,
+    },
+    'journal': {
+        'enabled': False,
+        'directory': 'var/journal',
+        'segment_mb': 64,
+        'segment_minutes': 60,
+        'max_segments': 48,
+        'max_total_mb': None,
+        'flush_seconds': 5,
+    },
+    'acquisition': {
+        'mode': 'blocking',
+        'min_backoff_ms': 0.5,
+        'max_backoff_fraction': 0.5,
+    },
+    'pairing': {
+        'mode': 'latest',
+        'window': 16,
+        'tolerance_ms': 15,
+    },
+    'second_stage': {
+        'enabled': False,
+        'engine': 'openvino',
+        'model': None,
+        'device': 'MYRIAD',
+        'input_width': 64,
+        'input_height': 128,
+        'channels_last': False,
+        'interpolation': 'bilinear',
+        'padding': 0.0,
+        'max_batch': 16,
+        'class_label': 'person',
+        'min_probability': 0.5,
+        'decode': 'classes',
+        'labels': None,
+        'threshold': 0.5,
+        'key': 'attributes',
+    },
+    'metrics': {
+        'enabled': True,
+        'host': '127.0.0.1',
+        'port': 9108,
+        'health_interval': 0,
+    },
+}
+
+
+def load_app_config(path : str = APP_CONFIG_FILE) -> dict:
+    '''Load the application settings, any setting missing from the file takes its default value.'''
+    app_config = {section: dict(values) for section, values in DEFAULT_APP_CONFIG.items()}
+    if os.path.exists(path):
+        with open(path) as f:
+            for section, values in json.load(f).items():
+                app_config.setdefault(section, {}).update(values)
+    return app_config
+
+
+def init_runtime_config(app_config : dict, config : 'DepthAIConfig' = None) -> 'RuntimeConfig':
+    '''
+    The watcher of the runtime settings file, None when disabled. Its overrides are applied to the
+    settings to start with: its app_config is to be used in place of app_config, and the pipeline
+    config of config (when given) is replaced with the overridden one.
+    '''
+    runtime_settings = app_config['runtime_config']
+    if not runtime_settings['enabled']:
+        return None
+    from runtime_config import RuntimeConfig
+
+    log.info(f'Watching {runtime_settings["file"]} for changes of the settings')
+    runtime_config = RuntimeConfig(runtime_settings['file'], app_config,
+                                   config.config if config is not None else None, float(runtime_settings['interval']))
+    if config is not None:
+        config.config = runtime_config.pipeline
+    return runtime_config
+
+
+def apply_runtime_change(runtime_config : 'RuntimeConfig', change : 'RuntimeChange', config : 'DepthAIConfig',
+                         depthai : 'DepthAI' = None, publishers : list = ()) -> None:
+    '''
+    Apply a change of the runtime settings polled from runtime_config to the depthai and publishers,
+    either may be missing in a process that only captures or only publishes. The host stages whose
+    settings changed are rebuilt and swapped in between frames, the device pipeline only when one of
+    its settings changed; runtime_config is told which pipeline config is in effect after it.
+    '''
+    app_config = change.app_config
+    sections = {name.split('.')[0] for name in change.live}
+    if depthai is not None:
+        changes = {}
+        if 'detection' in sections:
+            changes['threshold'] = float(app_config['detection']['threshold'])
+            changes['labels'] = app_config['detection']['labels'] or config.labels
+        stages = {}
+        if 'tracker' in sections:
+            stages['track'] = init_tracker(app_config, config)
+        if 'roi_depth' in sections:
+            stages['roi_depth'] = init_roi_depth(app_config, config)
+        if 'second_stage' in sections:
+            stages['second_stage'] = init_second_stage(app_config, config)
+        if stages:
+            changes['stages'] = stages
+        if change.rebuild:
+            changes['pipeline'] = change.pipeline
+        if changes:
+            depthai.reconfigure(changes, runtime_config.pipeline_applied)
+    for publisher in publishers:
+        publisher.reconfigure(app_config)
+
+
+def init_stages(app_config : dict, config : 'DepthAIConfig', video_recorder : 'VideoRecorder' = None) -> list:
+    '''The enabled host stages of the capture; the video_recorder, ROI depth, second stage and tracker.'''
+    stages = [video_recorder, init_roi_depth(app_config, config), init_second_stage(app_config, config),
+              init_tracker(app_config, config)]
+    return [stage for stage in stages if stage is not None]
+
+
+def init_tracker(app_config : dict, config : 'DepthAIConfig' = None) -> 'TrackerStage':
+    '''
+    The stage that fills in the obj_id of the boxes, None when tracking is disabled. It takes the ids of
+    the device tracklets when the object_tracker of config is enabled.
+    '''
+    from analytics.tracker import Tracker, TrackerStage
+
+    tracker_config = app_config['tracker']
+    if not tracker_config['enabled']:
+        return None
+    tracker = Tracker(float(tracker_config['iou_weight']), float(tracker_config['min_iou']),
+                      float(tracker_config['max_distance']), float(tracker_config['max_speed']),
+                      float(tracker_config['reid_window']), int(tracker_config['min_hits']))
+    return TrackerStage(tracker, getattr(config, 'enable_object_tracker', False))
+
+
+def init_rate_controller(app_config : dict, config : 'DepthAIConfig') -> 'RateController':
+    '''
+    The controller lowering the frame rate processed when the host lags behind, None when disabled.
+    Unless max_fps is set the rate is capped at the max_fps of the previewout stream, or 30.
+    '''
+    from rate_control import RateController
+
+    rate_config = app_config['rate_control']
+    if not rate_config['enabled']:
+        return None
+    max_fps = rate_config['max_fps']
+    if max_fps is None and hasattr(config, 'stream_max_fps'):
+        max_fps = config.stream_max_fps('previewout')
+    return RateController(float(rate_config['min_fps']), float(max_fps or 30.0),
+                          float(rate_config['target_lag_ms']) / 1000.0, int(rate_config['max_backlog']),
+                          float(rate_config['decrease']), float(rate_config['increase']),
+                          float(rate_config['interval']))
+
+
+def init_acquisition(app_config : dict, config : 'DepthAIConfig') -> 'Acquisition':
+    '''
+    How the capture waits for packets. Empty polls back off up to max_backoff_fraction of the frame
+    interval of the previewout stream (at its max_fps, or 30).
+    '''
+    from acquisition import Acquisition
+
+    acquisition_config = app_config['acquisition']
+    max_fps = config.stream_max_fps('previewout') if hasattr(config, 'stream_max_fps') else None
+    return Acquisition.for_fps(acquisition_config['mode'], float(max_fps or 30.0),
+                               float(acquisition_config['min_backoff_ms']) / 1000.0,
+                               float(acquisition_config['max_backoff_fraction']))
+
+
+def init_pairer(app_config : dict) -> 'PacketPairer':
+    '''The reorder buffer pairing the nnet results with their previewout frames.'''
+    from packet_pairing import PacketPairer
+
+    pairing_config = app_config['pairing']
+    return PacketPairer(int(pairing_config['window']), float(pairing_config['tolerance_ms']) / 1000.0)
+
+
+def init_second_stage(app_config : dict, config : 'DepthAIConfig') -> 'SecondStage':
+    '''
+    The second-stage model run on the crops of the boxes, None when disabled. The model defaults to
+    the blob of cnn_model2 and the labels to those of its json.
+    '''
+    stage_config = app_config['second_stage']
+    if not stage_config['enabled']:
+        return None
+    from analytics.second_stage import CropBatcher, OpenCVEngine, OpenVinoEngine, SecondStage
+
+    model = stage_config['model'] or getattr(config, 'blob_file2', '')
+    if not model:
+        raise ValueError('second_stage is enabled but neither its model nor -cnn2 is set')
+    engine_name = stage_config['engine']
+    if engine_name == 'openvino':
+        engine = OpenVinoEngine(model, stage_config['device'])
+    elif engine_name == 'opencv':
+        engine = OpenCVEngine(model)
+    else:
+        raise ValueError(f'Unknown second_stage engine {engine_name}, expected openvino or opencv')
+    log.info(f'Running the second stage {model} with {engine_name}')
+    batcher = CropBatcher(int(stage_config['input_width']), int(stage_config['input_height']),
+                          float(stage_config['padding']), bool(stage_config['channels_last']),
+                          stage_config['interpolation'], int(stage_config['max_batch']))
+    return SecondStage(engine, batcher, stage_config['labels'] or getattr(config, 'labels2', None),
+                       stage_config['decode'], float(stage_config['threshold']), stage_config['key'],
+                       stage_config['class_label'], float(stage_config['min_probability']))
+
+
+def init_roi_depth(app_config : dict, config : 'DepthAIConfig') -> 'RoiDepthStage':
+    '''The host stage computing the box distances from depth_raw, None when disabled.'''
+    from analytics.roi_depth import RoiDepth, RoiDepthStage
+
+    roi_config = app_config['roi_depth']
+    if not roi_config['enabled']:
+        return None
+    if 'depth_raw' not in getattr(config, 'stream_names', ['depth_raw']):
+        log.warning('roi_depth is enabled but the depth_raw stream is not, the device distances are used')
+    roi_depth = RoiDepth(int(roi_config['bins']), int(roi_config['stride']), float(roi_config['min_depth']),
+                         float(roi_config['max_depth']), float(roi_config['padding']),
+                         float(roi_config['percentile']), getattr(config, 'nn2_depth', None))
+    return RoiDepthStage(roi_depth, roi_config['output'], float(roi_config['min_valid_ratio']),
+                         getattr(config, 'field_of_view', None) or 71.86)
+
+
+def init_video_recorder(app_config : dict, config : 'DepthAIConfig', suffix : str = '') -> 'VideoRecorder':
+    '''
+    The recorder of the video stream when recording was requested with --video, None otherwise. The
+    suffix is added to the stem of the segment file names, to tell the devices apart.
+    '''
+    from video_recorder import VideoRecorder
+
+    video_file = getattr(config, 'video_file', None)
+    if not video_file:
+        return None
+    if suffix:
+        path = Path(video_file)
+        video_file = str(path.with_name(f'{path.stem}-{suffix}{path.suffix}'))
+    video_config = app_config['video']
+    max_total_mb = video_config['max_total_mb']
+    log.info(f'Recording the video stream to {video_file} segments')
+    return VideoRecorder(video_file, int(float(video_config['segment_mb']) * (1 << 20)),
+                         float(video_config['segment_minutes']) * 60.0, video_config['max_segments'],
+                         int(float(max_total_mb) * (1 << 20)) if max_total_mb is not None else None,
+                         int(video_config['buffer_kb']) << 10, int(float(video_config['queue_mb']) * (1 << 20)))
+
+
+def init_journal(app_config : dict, suffix : str = '') -> 'DetectionJournal':
+    '''
+    The journal of the detections when enabled, None otherwise. The suffix is added to the prefix of
+    the segment file names, to keep the journals of several devices apart.
+    '''
+    journal_config = app_config['journal']
+    if not journal_config['enabled']:
+        return None
+    from detection_journal import DetectionJournal
+
+    max_total_mb = journal_config['max_total_mb']
+    prefix = f'detections-{suffix}' if suffix else 'detections'
+    log.info(f'Journaling the detections to {journal_config["directory"]}/{prefix}-*')
+    return DetectionJournal(journal_config['directory'], prefix, int(float(journal_config['segment_mb']) * (1 << 20)),
+                            float(journal_config['segment_minutes']) * 60.0, journal_config['max_segments'],
+                            int(float(max_total_mb) * (1 << 20)) if max_total_mb is not None else None,
+                            float(journal_config['flush_seconds']))
+
+
+def init_metrics_server(app_config : dict, port_offset : int = 0) -> 'MetricsServer':
+    '''Serve the Prometheus metrics at the configured host and port (plus port_offset), None when disabled.'''
+    from metrics import MetricsServer, registry
+
+    metrics_config = app_config['metrics']
+    if not metrics_config['enabled']:
+        return None
+    try:
+        return MetricsServer(registry, metrics_config['host'], int(metrics_config['port']) + port_offset)
+    except OSError as e:
+        log.warning(f'Could not serve the metrics on port {int(metrics_config["port"]) + port_offset}: {e}')
+        return None
+
+
+def init_health_reporter(app_config : dict, thing, engine_id : str, stream_id : str) -> 'HealthReporter':
+    '''Write Health samples to the thing every health_interval seconds, None when it is 0.'''
+    from datariver.health import HealthReporter
+    from metrics import registry
+
+    interval = app_config['metrics']['health_interval']
+    if not interval:
+        return None
+    return HealthReporter(thing, registry, engine_id, stream_id, float(interval))
+
+
+def init_depthai(config : 'DepthAIConfig', model_label : str, stages : list = (),
+                 rate_controller : 'RateController' = None, acquisition : 'Acquisition' = None,
+                 pairing : str = 'latest', pairer : 'PacketPairer' = None, threshold : float = 0.5,
+                 labels : 'List[str]' = None) -> 'DepthAI':
+    '''
+    Create the DepthAI packet source. When DEPTHAI_TRACE_REPLAY names a trace file the packets are
+    replayed from it instead of the device (at DEPTHAI_TRACE_REPLAY_SPEED, 0 is as fast as possible).
+    When DEPTHAI_TRACE_RECORD names a file the device packets are also recorded to it.
+    '''
+    from depthai_replay import ReplayPipeline, TraceRecorder
+    from depthai_wrapper import DepthAI
+
+    replay_file = os.getenv(TRACE_REPLAY_ENV_VAR)
+    if replay_file:
+        speed = float(os.getenv(TRACE_REPLAY_SPEED_ENV_VAR, '1.0'))
+        log.info(f'Replaying DepthAI packets from {replay_file} at speed {speed}')
+        return DepthAI(config, DEFAULT_STREAM_ID, DEFAULT_ENGINE_ID, model_label,
+                       pipeline=ReplayPipeline(replay_file, speed=speed), yield_frames=False, stages=stages,
+                       rate_controller=rate_controller, acquisition=acquisition, pairing=pairing, pairer=pairer,
+                       threshold=threshold, labels=labels)
+
+    record_file = os.getenv(TRACE_RECORD_ENV_VAR)
+    recorder = None
+    if record_file:
+        log.info(f'Recording DepthAI packets to {record_file}')
+        recorder = TraceRecorder(record_file, labels=config.labels)
+    return DepthAI(config, DEFAULT_STREAM_ID, DEFAULT_ENGINE_ID, model_label, trace_recorder=recorder,
+                   yield_frames=False, stages=stages, rate_controller=rate_controller, acquisition=acquisition,
+                   pairing=pairing, pairer=pairer, threshold=threshold, labels=labels)
+
+
 class Main:
+    '''
+    Captures from the DepthAI and publishes to the Data River on separate threads joined by a
+    bounded FrameQueue, so a slow Data River write does not stall draining the device. With rate
+    control enabled the lag from polling a frame to publishing it lowers the frame rate processed.
+
+    The EdgeThing is created on a background thread while the device initializes, unless the
+    Future of one already being created (see start_edge_thing) is given.
+
+    With runtime_config enabled the changes of the runtime settings file are applied between frames.
+    '''
 
-    def __init__(self, config : DepthAIConfig, model_label : str):
-        self.__depthai = DepthAI(config, 'mcclean.home.oakd-1', 'oakd-1', model_label, )
-        self.__edge_thing = init_edge_thing()
+    def __init__(self, config : 'DepthAIConfig', model_label : str, app_config : dict = None,
+                 edge_thing : Future = None):
+        self.__app_config = app_config if app_config is not None else load_app_config()
+        self.__config = config
+        self.__runtime_config = init_runtime_config(self.__app_config, config)
+        if self.__runtime_config is not None:
+            self.__app_config = self.__runtime_config.app_config
+        edge_thing = edge_thing if edge_thing is not None else start_edge_thing()
+        queue_config = self.__app_config['publish_queue']
+        self.__queue = FrameQueue(int(queue_config['size']), DropPolicy(queue_config['drop_policy']))
+        self.__rate_controller = init_rate_controller(self.__app_config, config)
+        self.__video_recorder = init_video_recorder(self.__app_config, config)
+        self.__depthai = init_depthai(config, model_label,
+                                      init_stages(self.__app_config, config, self.__video_recorder),
+                                      self.__rate_controller, init_acquisition(self.__app_config, config),
+                                      self.__app_config['pairing']['mode'], init_pairer(self.__app_config),
+                                      float(self.__app_config['detection']['threshold']),
+                                      self.__app_config['detection']['labels'])
+        with startup_timer.phase('thing wait'):
+            self.__edge_thing = edge_thing.result()
+        from datariver.publisher import Publisher
+        self.__publisher = Publisher(self.__edge_thing.thing, self.__app_config, init_journal(self.__app_config))
 
+        from metrics import registry
+        stream_id = self.__depthai.stream_id
+        self.__lag = registry.histogram('depthai_frame_lag_seconds', 'Seconds from polling a frame to publishing it',
+                                        ('stream',)).labels(stream=stream_id)
+        if self.__rate_controller is not None:
+            registry.function('depthai_target_fps', 'Frames per second processed under rate control',
+                              lambda: self.__rate_controller.rate, stream=stream_id)
+        registry.function('depthai_publish_queue_depth', 'Frames waiting in the publish queue',
+                          lambda: self.__queue.depth, stream=stream_id)
+        registry.function('depthai_publish_queue_dropped_total', 'Frames dropped by the publish queue',
+                          lambda: self.__queue.dropped, kind='counter', stream=stream_id)
+        if self.__video_recorder is not None:
+            registry.function('depthai_video_dropped_total', 'Encoded video packets the recorder dropped',
+                              lambda: self.__video_recorder.stats['dropped'], kind='counter', stream=stream_id)
+        self.__metrics_server = init_metrics_server(self.__app_config)
+        self.__health = init_health_reporter(self.__app_config, self.__edge_thing.thing,
+                                             self.__depthai.engine_id, stream_id)
 
-    def __publish_frame(self, frame, boxes):
-        write_tag(self.__edge_thing.thing, 'DetectionBoxData', boxes.dr_data)
+    @property
+    def queue_stats(self) -> dict:
+        '''Depth and dropped frame counters of the publish queue'''
+        return self.__queue.stats
+
+    @property
+    def publish_stats(self) -> dict:
+        '''Published and suppressed sample counters of the publish policy'''
+        return self.__publisher.stats
+
+    def __publish_frame(self, frame, boxes, polled_at, captured_at, backlog):
+        self.__publisher.publish(boxes, captured_at)
+        lag = time.monotonic() - polled_at
+        self.__lag.observe(lag)
+        if self.__rate_controller is not None:
+            self.__rate_controller.observe(lag, backlog + self.__queue.depth)
+        if startup_timer.mark('first detection'):
+            startup_timer.log_report()
+
+
+    def __reconfigure(self):
+        change = self.__runtime_config.poll()
+        if change is None:
+            return
+        try:
+            apply_runtime_change(self.__runtime_config, change, self.__config, self.__depthai, (self.__publisher,))
+        except Exception:
+            log.exception('Applying the runtime settings failed')
+
+
+    def __capture(self):
+        try:
+            for frame, results in self.__depthai.capture():
+                startup_timer.mark('first frame')
+                self.__queue.put((frame, results, self.__depthai.polled_at, self.__depthai.captured_at,
+                                  self.__depthai.backlog))
+                if self.__runtime_config is not None:
+                    self.__reconfigure()
+        except QueueClosed:
+            pass
+        except Exception:
+            log.exception('Capture from the DepthAI failed')
+        finally:
+            self.__queue.close()
 
 
     def run(self):
+        capture_thread = threading.Thread(target=self.__capture, name='depthai-capture', daemon=True)
         try:
             log.info('Setup complete, processing frames')
-            for frame, results in self.__depthai.capture():
-                self.__publish_frame(frame, results)
+            capture_thread.start()
+            for frame, results, polled_at, captured_at, backlog in self.__queue:
+                self.__publish_frame(frame, results, polled_at, captured_at, backlog)
         finally:
+            self.__queue.close()
+            capture_thread.join(timeout=1.0)
+            log.info(f'Publish queue: {self.queue_stats}')
+            log.info(f'Acquisition: {self.__depthai.acquisition_stats}')
+            if self.__depthai.pairing_stats:
+                log.info(f'Pairing: {self.__depthai.pairing_stats}')
+            self.__publisher.close()
+            log.info(f'Publish policy: {self.publish_stats}')
+            if self.__publisher.batch_stats:
+                log.info(f'Batched writes: {self.__publisher.batch_stats}')
+            if self.__rate_controller is not None:
+                log.info(f'Rate control: {self.__rate_controller.stats}')
+            if self.__video_recorder is not None:
+                self.__video_recorder.close()
+                log.info(f'Video recording: {self.__video_recorder.stats}')
+            if self.__health is not None:
+                self.__health.close()
+            if self.__metrics_server is not None:
+                self.__metrics_server.close()
             del self.__depthai
 
 
 if __name__ == '__main__':
+    from depthai_helpers.cli_utils import parse_args
+
     try:
         args = vars(parse_args())
     except:
         log.error('Problem parsing the command line arguments')
-    config = DepthAIConfig(args)
-    main = Main(config, 'people')
+    app_config = load_app_config()
+    if app_config['devices']['enabled']:
+        from multi_device import MultiDeviceMain
+        main = MultiDeviceMain(args, 'people', app_config)
+    else:
+        edge_thing = start_edge_thing()
+        with startup_timer.phase('import'):
+            from config import DepthAIConfig
+            import depthai_wrapper
+        with startup_timer.phase('config'):
+            config = DepthAIConfig(args)
+        main = Main(config, 'people', app_config, edge_thing)
     main.run()
 
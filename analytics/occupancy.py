@@ -0,0 +1,95 @@
+from typing import List
+
+import numpy as np
+
+from analytics.spatial_grid import SpatialGrid
+from datacls import DetectionBatch
+
+
+class OccupancyResult:
+    '''
+    The people count and social distancing analysis of a frame. people are the indices of the boxes
+    included in the distance analysis, violations the (k, 2) box indices of the pairs closer than the
+    threshold. distances is the full pairwise matrix between people, None when a SpatialGrid was used.
+    '''
+
+    def __init__(self, count: int, people: np.ndarray, violations: np.ndarray, violation_distances: np.ndarray,
+                 min_distance: float, distance_threshold: float, distances: np.ndarray = None):
+        self.count = count
+        self.people = people
+        self.violations = violations
+        self.violation_distances = violation_distances
+        self.min_distance = min_distance
+        self.distance_threshold = distance_threshold
+        self.distances = distances
+
+
+def pairwise_distances(positions: np.ndarray) -> np.ndarray:
+    '''The (n, n) matrix of euclidean distances between (n, 3) positions.'''
+    diff = positions[:, None, :] - positions[None, :, :]
+    return np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+
+
+class OccupancyEngine:
+    '''
+    Counts the people in a frame and computes the distance between every pair of them from the
+    dist_x/dist_y/dist_z of their boxes. Pairs closer than distance_threshold (metres) are violations.
+
+    Only boxes whose class is class_label are people, when the labels do not include class_label every
+    box is. Boxes without a depth measurement (all distances 0) are counted but left out of the
+    distance analysis.
+
+    With more than grid_above people the all-pairs matrix is replaced by a SpatialGrid with cells of
+    distance_threshold that is updated incrementally between frames. In that case min_distance only
+    considers people in neighbouring cells and is -1.0 when there are none.
+    '''
+
+    def __init__(self, distance_threshold: float = 1.5, class_label: str = 'person', grid_above: int = 100):
+        self.distance_threshold = distance_threshold
+        self.class_label = class_label
+        self.grid_above = grid_above
+        self.__grid = None
+
+    def __person_mask(self, batch: DetectionBatch) -> np.ndarray:
+        labels = batch.labels or []
+        if self.class_label is None or self.class_label not in labels:
+            return np.ones(len(batch), dtype=bool)
+        return batch.class_id == labels.index(self.class_label)
+
+    def analyze(self, batch: DetectionBatch) -> OccupancyResult:
+        is_person = self.__person_mask(batch)
+        positions = batch.positions
+        has_position = np.any(positions != 0.0, axis=1)
+        people = np.flatnonzero(is_person & has_position)
+        count = int(np.count_nonzero(is_person))
+        if self.grid_above is not None and len(people) > self.grid_above:
+            return self.__analyze_grid(batch, people, positions, count)
+
+        distances = pairwise_distances(positions[people])
+        a, b = np.triu_indices(len(people), 1)
+        pair_distances = distances[a, b]
+        close = pair_distances < self.distance_threshold
+        violations = np.stack((people[a[close]], people[b[close]]), axis=1)
+        min_distance = float(pair_distances.min()) if len(pair_distances) > 0 else -1.0
+        return OccupancyResult(count, people, violations, pair_distances[close], min_distance,
+                               self.distance_threshold, distances)
+
+    def __analyze_grid(self, batch: DetectionBatch, people: np.ndarray, positions: np.ndarray,
+                       count: int) -> OccupancyResult:
+        if self.__grid is None or self.__grid.cell_size != self.distance_threshold:
+            self.__grid = SpatialGrid(self.distance_threshold)
+        # Tracked boxes keep their obj_id between frames, which lets the grid move only the people
+        # that changed cell. Without ids the box index is the best key there is.
+        obj_ids = batch.obj_id[people]
+        keys = people
+        if np.all(obj_ids != 0) and len(np.unique(obj_ids)) == len(obj_ids):
+            keys = obj_ids
+        self.__grid.update(keys.tolist(), positions[people])
+        pairs = self.__grid.pairs_within(self.distance_threshold)
+
+        index_of = dict(zip(keys.tolist(), people.tolist()))
+        violations = np.array([[index_of[a], index_of[b]] for a, b in zip(pairs.a, pairs.b)],
+                              dtype=np.int64).reshape(-1, 2)
+        violations.sort(axis=1)
+        return OccupancyResult(count, people, violations, pairs.distances, pairs.min_distance,
+                               self.distance_threshold)
@@ -0,0 +1,189 @@
+import json
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from capture_stages import CaptureStage
+
+# The depth statistics of the ROI of every box; median and percentile depth in metres (NaN when the
+# ROI has no valid pixels) and the ratio of the ROI pixels with a valid depth.
+RoiDepthStats = namedtuple('RoiDepthStats', ['median', 'percentile', 'valid_ratio'])
+
+
+class RoiDepth:
+    '''
+    Robust depth statistics over the box ROIs of a depth_raw frame (uint16 millimetres, 0 is no depth).
+
+    The depth frame is subsampled by stride and every valid pixel is put in one of bins depth bins,
+    spaced logarithmically between min_depth and max_depth as the stereo depth error grows with the
+    distance. A summed-area table of each bin's pixel counts is built once per frame in reused
+    buffers, the depth histogram of any rectangle is then four lookups per bin. The median and
+    percentile of every box are interpolated within their bin from the histograms of all the boxes
+    at once, so the cost of a frame hardly depends on the number of boxes.
+
+    Boxes are in the normalized coordinates of the NN input; nn2depth (depthai's
+    get_nn_to_depth_bbox_mapping, with off_x, off_y, max_w and max_h in depth pixels) maps them to
+    the depth frame, without it they are taken to cover the whole frame. Each side of a box is
+    shrunk by padding (a fraction of its size) to leave out the background around a person.
+    '''
+
+    def __init__(self, bins: int = 48, stride: int = 8, min_depth: float = 0.2, max_depth: float = 10.0,
+                 padding: float = 0.3, percentile: float = 25.0, nn2depth: dict = None):
+        if bins < 2 or stride < 1 or not 0 < min_depth < max_depth:
+            raise ValueError('RoiDepth needs bins >= 2, stride >= 1 and 0 < min_depth < max_depth')
+        self.bins = bins
+        self.stride = stride
+        self.padding = padding
+        self.percentile = percentile
+        self.nn2depth = nn2depth
+        self.edges = np.geomspace(min_depth * 1000.0, max_depth * 1000.0, bins + 1)
+        self.__shape = None
+        self.__depth_shape = None
+        self.__sat = None
+        self.__flat = None
+
+    def __buffers(self, shape: tuple) -> None:
+        if shape == self.__shape:
+            return
+        h, w = shape
+        self.__shape = shape
+        self.__sat = np.zeros((self.bins, h + 1, w + 1), dtype=np.int32)
+        # The offset of pixel (y, x) in the (bin, y + 1, x + 1) cell of the flattened table.
+        ys, xs = np.mgrid[0:h, 0:w]
+        self.__flat = ((ys + 1) * (w + 1) + xs + 1).ravel()
+
+    def build(self, depth: np.ndarray) -> None:
+        '''Build the per-bin summed-area tables of a depth_raw frame.'''
+        depth = np.asarray(depth)
+        self.__depth_shape = depth.shape
+        sampled = depth[::self.stride, ::self.stride]
+        self.__buffers(sampled.shape)
+        sat = self.__sat
+        sat.fill(0)
+        values = sampled.ravel()
+        bins = np.searchsorted(self.edges, values, side='right') - 1
+        valid = (values > 0) & (bins >= 0) & (bins < self.bins)
+        plane = sat.shape[1] * sat.shape[2]
+        sat.reshape(-1)[bins[valid] * plane + self.__flat[valid]] = 1
+        np.cumsum(sat, axis=1, out=sat)
+        np.cumsum(sat, axis=2, out=sat)
+
+    def rois(self, x1: np.ndarray, y1: np.ndarray, x2: np.ndarray, y2: np.ndarray) -> tuple:
+        '''The (top, left, bottom, right) summed-area table indices of the padded box ROIs.'''
+        depth_h, depth_w = self.__depth_shape
+        if self.nn2depth is not None:
+            off_x, off_y = self.nn2depth['off_x'], self.nn2depth['off_y']
+            scale_x, scale_y = self.nn2depth['max_w'], self.nn2depth['max_h']
+        else:
+            off_x, off_y, scale_x, scale_y = 0.0, 0.0, depth_w, depth_h
+        pad_x = (x2 - x1) * self.padding / 2
+        pad_y = (y2 - y1) * self.padding / 2
+        h, w = self.__shape
+        to_cells = lambda v, offset, scale, cells: np.clip(
+            np.round((offset + v * scale) / self.stride), 0, cells).astype(np.int64)
+        left = to_cells(x1 + pad_x, off_x, scale_x, w)
+        right = to_cells(x2 - pad_x, off_x, scale_x, w)
+        top = to_cells(y1 + pad_y, off_y, scale_y, h)
+        bottom = to_cells(y2 - pad_y, off_y, scale_y, h)
+        return top, left, np.maximum(bottom, top), np.maximum(right, left)
+
+    def stats(self, x1, y1, x2, y2) -> RoiDepthStats:
+        '''The depth statistics of the boxes in the frame last built, as arrays with a value per box.'''
+        x1, y1, x2, y2 = (np.asarray(v, dtype=np.float64) for v in (x1, y1, x2, y2))
+        n = len(x1)
+        if n == 0:
+            empty = np.zeros(0)
+            return RoiDepthStats(empty, empty, empty)
+        top, left, bottom, right = self.rois(x1, y1, x2, y2)
+        sat = self.__sat
+        # (n, bins) pixel counts of every box
+        counts = (sat[:, bottom, right] - sat[:, top, right] - sat[:, bottom, left] + sat[:, top, left]).T
+        valid = counts.sum(axis=1)
+        area = (bottom - top) * (right - left)
+        valid_ratio = np.divide(valid, area, out=np.zeros(n), where=area > 0)
+        return RoiDepthStats(self.__quantile(counts, valid, 0.5), self.__quantile(counts, valid, self.percentile / 100.0),
+                             valid_ratio)
+
+    def __quantile(self, counts: np.ndarray, valid: np.ndarray, q: float) -> np.ndarray:
+        '''The q-quantile depth in metres of every box, interpolated linearly within its bin.'''
+        cumulative = np.cumsum(counts, axis=1)
+        rank = q * valid
+        bin_index = np.minimum((cumulative < rank[:, None]).sum(axis=1), self.bins - 1)
+        rows = np.arange(len(valid))
+        before = np.where(bin_index > 0, cumulative[rows, np.maximum(bin_index - 1, 0)], 0)
+        in_bin = counts[rows, bin_index]
+        fraction = np.divide(rank - before, in_bin, out=np.full(len(valid), 0.5), where=in_bin > 0)
+        lower, upper = self.edges[bin_index], self.edges[bin_index + 1]
+        depth = (lower + (upper - lower) * np.clip(fraction, 0.0, 1.0)) / 1000.0
+        return np.where(valid > 0, depth, np.nan)
+
+
+class RoiDepthStage(CaptureStage):
+    '''
+    Fills the distances of the boxes of a frame from the latest depth_raw frame with RoiDepth, as a
+    stage of DepthAI.capture() (frames before the first depth_raw frame keep their distances).
+
+    - output 'dist': dist_z is replaced by the median depth of the ROI and dist_x/dist_y are scaled
+      to it, for boxes with at least min_valid_ratio of valid pixels; the others keep the device's
+    - output 'meta': the median, percentile and valid ratio are written to the meta of every box as
+      JSON ({"depth": {"median": .., "p25": .., "valid": ..}}) and the distances are left alone
+
+    Without device distances dist_x/dist_y are computed from the box centre and hfov, the horizontal
+    field of view of the depth camera in degrees.
+    '''
+
+    name = 'roi_depth'
+    streams = ('depth_raw',)
+
+    def __init__(self, roi_depth: RoiDepth, output: str = 'dist', min_valid_ratio: float = 0.1,
+                 hfov: float = 71.86):
+        if output not in ('dist', 'meta'):
+            raise ValueError(f'Unknown RoiDepthStage output {output}, expected dist or meta')
+        self.roi_depth = roi_depth
+        self.output = output
+        self.min_valid_ratio = min_valid_ratio
+        self.hfov = hfov
+        self.__depth = None
+
+    def packet(self, packet) -> None:
+        self.__depth = packet.getData()
+
+    def process(self, batch, frame_packet, timestamp: float) -> None:
+        if self.__depth is not None:
+            self.apply(batch, self.__depth)
+
+    def reset(self) -> None:
+        self.__depth = None
+
+    def apply(self, batch, depth: np.ndarray) -> RoiDepthStats:
+        '''Update the boxes of a DetectionBatch from a depth_raw frame, returns their statistics.'''
+        if len(batch) == 0:
+            return RoiDepthStats(np.zeros(0), np.zeros(0), np.zeros(0))
+        self.roi_depth.build(depth)
+        stats = self.roi_depth.stats(batch.x1, batch.y1, batch.x2, batch.y2)
+        if self.output == 'meta':
+            key = f'p{self.roi_depth.percentile:g}'
+            batch.set_strings('meta', [
+                json.dumps({'depth': {'median': None if math.isnan(m) else round(m, 3),
+                                      key: None if math.isnan(p) else round(p, 3), 'valid': round(v, 3)}})
+                for m, p, v in zip(stats.median.tolist(), stats.percentile.tolist(), stats.valid_ratio.tolist())])
+            return stats
+
+        use = (stats.valid_ratio >= self.min_valid_ratio) & ~np.isnan(stats.median)
+        dist_x, dist_y, dist_z = batch.dist_x, batch.dist_y, batch.dist_z
+        device = use & (dist_z > 0)
+        scale = np.divide(stats.median, dist_z, out=np.ones(len(batch)), where=device)
+        dist_x[device] *= scale[device]
+        dist_y[device] *= scale[device]
+        # Without a device distance project the box centre at the median depth.
+        host = use & ~device
+        if host.any():
+            h, w = np.asarray(depth).shape
+            focal = (w / 2) / math.tan(math.radians(self.hfov) / 2)
+            centre_x = (batch.x1 + batch.x2) / 2
+            centre_y = (batch.y1 + batch.y2) / 2
+            dist_x[host] = (centre_x[host] - 0.5) * w * stats.median[host] / focal
+            dist_y[host] = (0.5 - centre_y[host]) * h * stats.median[host] / focal
+        dist_z[use] = stats.median[use]
+        return stats
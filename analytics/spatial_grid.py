@@ -0,0 +1,129 @@
+from collections import namedtuple
+from typing import Hashable, Iterable
+
+import numpy as np
+
+# Cell offsets visited from every entry, half of the 3x3 neighbourhood plus the cell itself, so
+# that every pair of neighbouring cells is only compared once.
+_FORWARD_NEIGHBOURS = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+_CELL_BITS = 32
+
+# The result of a SpatialGrid query; the keys of both entries of the pairs found, their distances
+# and the smallest distance between any two entries that were compared (-1.0 if none were).
+GridPairs = namedtuple('GridPairs', ['a', 'b', 'distances', 'min_distance'])
+
+
+class SpatialGrid:
+    '''
+    A uniform grid (spatial hash) over the floor plane (dist_x, dist_z) of 3D positions.
+
+    Every entry is hashed to its cell and the entries are kept sorted by cell, so the entries of a
+    neighbouring cell are found with a binary search and all candidate pairs are generated with
+    NumPy. Entries are keyed (by object id, or box index) and update() is incremental; the entries
+    that stay in their cells keep their sorted order, those removed are dropped from it and only the
+    added entries and those that changed cell are sorted and merged in with a binary search.
+
+    Distance queries only compare entries in the same or neighbouring cells, so they are exact for
+    distances up to cell_size.
+    '''
+
+    def __init__(self, cell_size: float):
+        if cell_size <= 0:
+            raise ValueError('SpatialGrid cell_size must be positive')
+        self.__cell_size = cell_size
+        self.__keys = []
+        self.__positions = np.zeros((0, 3))
+        self.__hashes = np.zeros(0, dtype=np.int64)
+        self.__order = np.zeros(0, dtype=np.int64)
+        self.__sorted_hashes = np.zeros(0, dtype=np.int64)
+        self.__moved = 0
+
+    @property
+    def cell_size(self) -> float:
+        return self.__cell_size
+
+    @property
+    def moved(self) -> int:
+        '''Number of entries that changed cell (or were added) in the last update'''
+        return self.__moved
+
+    def __len__(self) -> int:
+        return len(self.__keys)
+
+    def __hash(self, positions: np.ndarray) -> np.ndarray:
+        cells = np.floor(positions[:, [0, 2]] / self.__cell_size).astype(np.int64)
+        return (cells[:, 0] << _CELL_BITS) + cells[:, 1]
+
+    def update(self, keys: Iterable[Hashable], positions: np.ndarray) -> None:
+        '''Make the index hold exactly the given entries at their (n, 3) positions.'''
+        keys = list(keys)
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        hashes = self.__hash(positions)
+        if keys == self.__keys:
+            slots = np.arange(len(keys))
+        else:
+            index = {key: slot for slot, key in enumerate(keys)}
+            slots = np.fromiter((index.get(key, -1) for key in self.__keys), dtype=np.int64,
+                                count=len(self.__keys))
+        # The new slot of every previous entry (-1 when removed), and the entries still in their cell.
+        survived = slots >= 0
+        stays = np.zeros(len(keys), dtype=bool)
+        stays[slots[survived]] = hashes[slots[survived]] == self.__hashes[survived]
+        inserted = np.flatnonzero(~stays)
+        self.__moved = len(inserted)
+        self.__keys = keys
+        self.__positions = positions
+        self.__hashes = hashes
+        if self.__moved == 0 and len(keys) == len(self.__order):
+            self.__order = slots[self.__order]
+            return
+        # The entries that stayed are still sorted in the previous order, the added and moved ones are
+        # sorted on their own and merged in.
+        kept = slots[self.__order]
+        kept = kept[kept >= 0]
+        kept = kept[stays[kept]]
+        inserted = inserted[np.argsort(hashes[inserted], kind='stable')]
+        self.__order = np.insert(kept, np.searchsorted(hashes[kept], hashes[inserted], 'right'), inserted)
+        self.__sorted_hashes = hashes[self.__order]
+
+    def clear(self) -> None:
+        self.update([], np.zeros((0, 3)))
+
+    def pairs_within(self, distance: float = None) -> GridPairs:
+        '''All the pairs of entries closer than distance (defaults to cell_size, must not exceed it).'''
+        distance = self.__cell_size if distance is None else distance
+        if distance > self.__cell_size:
+            raise ValueError(f'SpatialGrid can only answer queries up to its cell size {self.__cell_size}')
+        n = len(self.__keys)
+        a_slots, b_slots, distances = [], [], []
+        min_distance = np.inf
+        entries = np.arange(n)
+        for dx, dz in _FORWARD_NEIGHBOURS:
+            target = self.__hashes + ((dx << _CELL_BITS) + dz)
+            start = np.searchsorted(self.__sorted_hashes, target, 'left')
+            counts = np.searchsorted(self.__sorted_hashes, target, 'right') - start
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            a = np.repeat(entries, counts)
+            first = np.cumsum(counts) - counts
+            b = self.__order[np.repeat(start - first, counts) + np.arange(total)]
+            if dx == 0 and dz == 0:
+                keep = a < b
+                a, b = a[keep], b[keep]
+                if len(a) == 0:
+                    continue
+            d = np.linalg.norm(self.__positions[a] - self.__positions[b], axis=1)
+            min_distance = min(min_distance, float(d.min()))
+            close = d < distance
+            a_slots.append(a[close])
+            b_slots.append(b[close])
+            distances.append(d[close])
+
+        if len(distances) == 0:
+            return GridPairs([], [], np.zeros(0), -1.0)
+        a = np.concatenate(a_slots).tolist()
+        b = np.concatenate(b_slots).tolist()
+        keys = self.__keys
+        return GridPairs([keys[i] for i in a], [keys[i] for i in b], np.concatenate(distances),
+                         min_distance if min_distance != np.inf else -1.0)
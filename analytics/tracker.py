@@ -0,0 +1,342 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from capture_stages import CaptureStage
+from datacls import DetectionBatch
+from depthai_decode import decode_tracklets
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+# Cost of a pair that is not allowed to match, any assignment at or above it is discarded.
+_GATED = 1e6
+
+# A device tracklet; its id, label, status ('NEW', 'TRACKED' or 'LOST') and box in the same
+# normalized coordinates as the detections.
+Tracklet = namedtuple('Tracklet', ['id', 'label', 'status', 'x1', 'y1', 'x2', 'y2'])
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    '''The (n, m) intersection over union of (n, 4) and (m, 4) boxes given as x1, y1, x2, y2.'''
+    boxes_a = boxes_a[:, None, :]
+    boxes_b = boxes_b[None, :, :]
+    width = np.clip(np.minimum(boxes_a[..., 2], boxes_b[..., 2]) - np.maximum(boxes_a[..., 0], boxes_b[..., 0]), 0, None)
+    height = np.clip(np.minimum(boxes_a[..., 3], boxes_b[..., 3]) - np.maximum(boxes_a[..., 1], boxes_b[..., 1]), 0, None)
+    intersection = width * height
+    area_a = (boxes_a[..., 2] - boxes_a[..., 0]) * (boxes_a[..., 3] - boxes_a[..., 1])
+    area_b = (boxes_b[..., 2] - boxes_b[..., 0]) * (boxes_b[..., 3] - boxes_b[..., 1])
+    union = area_a + area_b - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection, dtype=np.float64), where=union > 0)
+
+
+def _hungarian(cost: np.ndarray) -> tuple:
+    '''
+    Minimum cost assignment of the rows of a (n, m) cost matrix with n <= m, the shortest augmenting
+    path form of the Hungarian algorithm with the inner loop over the columns vectorized.
+    '''
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            j1 = int(np.argmin(np.where(free, minv[1:], np.inf))) + 1
+            delta = minv[j1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[~used] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0 != 0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    cols = np.flatnonzero(p[1:])
+    rows = p[1:][cols] - 1
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def assign(cost: np.ndarray) -> tuple:
+    '''
+    The (rows, cols) of the minimum cost assignment of a (n, m) cost matrix, leaving out the pairs
+    whose cost is gated. Uses scipy when it is installed.
+    '''
+    if cost.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    # When every row (or column, whichever there are fewer of) has a different cheapest partner the
+    # sum of the minima is a lower bound that is reached, the usual case between consecutive frames.
+    if cost.shape[0] <= cost.shape[1]:
+        rows, cols = np.arange(cost.shape[0]), np.argmin(cost, axis=1)
+        unique = len(np.unique(cols)) == len(cols)
+    else:
+        rows, cols = np.argmin(cost, axis=0), np.arange(cost.shape[1])
+        unique = len(np.unique(rows)) == len(rows)
+        order = np.argsort(rows)
+        rows, cols = rows[order], cols[order]
+    if not unique:
+        if linear_sum_assignment is not None:
+            rows, cols = linear_sum_assignment(cost)
+        elif cost.shape[0] <= cost.shape[1]:
+            rows, cols = _hungarian(cost)
+        else:
+            cols, rows = _hungarian(cost.T)
+            order = np.argsort(rows)
+            rows, cols = rows[order], cols[order]
+    keep = cost[rows, cols] < _GATED
+    return rows[keep], cols[keep]
+
+
+class Tracker:
+    '''
+    Assigns persistent ids (obj_id, starting at 1) to the detection boxes of consecutive frames.
+
+    Every track predicts where its box and dist_x/y/z position are from its last velocity, no further
+    than one frame interval (the time since the previous update) past the frame it was last seen in.
+    The detections are matched to the tracks with an optimal assignment over a cost matrix mixing the
+    IoU with the predicted box and the 3D distance to the predicted position (iou_weight is the share
+    of the IoU term). A detection can only match a track of the same class that either overlaps it by
+    at least min_iou or is closer than max_distance metres.
+
+    A track is active while it was matched in the previous update, otherwise it is kept as lost for
+    reid_window seconds, during which a detection that did not match any active track can
+    re-identify it; by its position only, within max_distance plus max_speed metres per second it
+    has been lost. Tracks are reported once they
+    were matched in min_hits frames, before that their boxes get obj_id 0.
+    '''
+
+    # Per track state, one array per field like DetectionBatch, (name, dtype, width)
+    TRACK_FIELDS = (('id', np.int64, 1), ('class_id', np.int32, 1), ('hits', np.int64, 1),
+                    ('missed', np.int64, 1), ('first_seen', np.float64, 1), ('last_seen', np.float64, 1),
+                    ('box', np.float64, 4), ('box_velocity', np.float64, 4),
+                    ('position', np.float64, 3), ('velocity', np.float64, 3))
+
+    def __init__(self, iou_weight: float = 0.5, min_iou: float = 0.1, max_distance: float = 0.75,
+                 max_speed: float = 1.5, reid_window: float = 2.0, min_hits: int = 1, smoothing: float = 0.5):
+        self.iou_weight = iou_weight
+        self.min_iou = min_iou
+        self.max_distance = max_distance
+        self.max_speed = max_speed
+        self.reid_window = reid_window
+        self.min_hits = min_hits
+        self.smoothing = smoothing
+        self.__next_id = 1
+        self.__last_update = None
+        self.__tracks = {name: np.zeros((0, width) if width > 1 else 0, dtype=dtype)
+                         for name, dtype, width in Tracker.TRACK_FIELDS}
+        self.__reidentified = 0
+
+    def __len__(self) -> int:
+        return len(self.__tracks['id'])
+
+    @property
+    def next_id(self) -> int:
+        '''The id the next new track gets, set it to continue the ids of another tracker'''
+        return self.__next_id
+
+    @next_id.setter
+    def next_id(self, next_id: int) -> None:
+        self.__next_id = int(next_id)
+
+    @property
+    def stats(self) -> dict:
+        '''Number of active and lost tracks, of ids issued and of lost tracks re-identified'''
+        active = int(np.count_nonzero(self.__tracks['missed'] == 0))
+        return {
+            'active': active,
+            'lost': len(self) - active,
+            'ids_issued': self.__next_id - 1,
+            'reidentified': self.__reidentified,
+        }
+
+    def dwell_times(self, ids: np.ndarray) -> np.ndarray:
+        '''Seconds between the first and the last time each of the given track ids was seen, 0 if unknown.'''
+        ids = np.asarray(ids)
+        dwell = np.zeros(len(ids))
+        if len(self) == 0:
+            return dwell
+        tracks = self.__tracks
+        # Track ids are issued in increasing order and stay sorted as tracks expire.
+        slots = np.minimum(np.searchsorted(tracks['id'], ids), len(self) - 1)
+        known = tracks['id'][slots] == ids
+        dwell[known] = tracks['last_seen'][slots[known]] - tracks['first_seen'][slots[known]]
+        return dwell
+
+    def __cost(self, tracks: np.ndarray, boxes: np.ndarray, positions: np.ndarray, class_ids: np.ndarray,
+               predicted_boxes: np.ndarray, predicted_positions: np.ndarray, max_distance: np.ndarray,
+               use_iou: bool) -> np.ndarray:
+        track_positions = predicted_positions[tracks]
+        diff = track_positions[:, None, :] - positions[None, :, :]
+        distance = np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+        has_position = np.any(self.__tracks['position'][tracks] != 0.0, axis=1)[:, None] \
+            & np.any(positions != 0.0, axis=1)[None, :]
+        max_distance = max_distance[:, None]
+        near = has_position & (distance < max_distance)
+        distance_cost = np.where(has_position, np.minimum(distance / max_distance, 1.0), 1.0)
+        if use_iou:
+            iou = iou_matrix(predicted_boxes[tracks], boxes)
+            cost = self.iou_weight * (1.0 - iou) + (1.0 - self.iou_weight) * distance_cost
+            allowed = near | (iou >= self.min_iou)
+        else:
+            cost = distance_cost
+            allowed = near
+        allowed &= self.__tracks['class_id'][tracks][:, None] == class_ids[None, :]
+        return np.where(allowed, cost, _GATED)
+
+    def update(self, batch: DetectionBatch, timestamp: float = None) -> np.ndarray:
+        '''
+        Match the boxes of the next frame to the tracks, set their obj_id in the batch and return them.
+        timestamp is the capture time of the frame in seconds, defaults to now.
+        '''
+        now = time.monotonic() if timestamp is None else timestamp
+        n = len(batch)
+        boxes = np.column_stack((batch.x1, batch.y1, batch.x2, batch.y2)).astype(np.float64)
+        positions = batch.positions
+        class_ids = batch.class_id
+        slots = np.full(n, -1, dtype=np.int64)
+        tracks = self.__tracks
+        interval = now - self.__last_update if self.__last_update is not None else 0.0
+        self.__last_update = now
+
+        if len(self) > 0 and n > 0:
+            elapsed = (now - tracks['last_seen'])[:, None]
+            # A lost track is not extrapolated past the frame after it was last seen, its reach grows instead.
+            horizon = np.clip(elapsed, 0.0, max(interval, 0.0))
+            predicted_boxes = tracks['box'] + tracks['box_velocity'] * horizon
+            predicted_positions = tracks['position'] + tracks['velocity'] * horizon
+            active = np.flatnonzero(tracks['missed'] == 0)
+            lost = np.flatnonzero(tracks['missed'] > 0)
+            # Active tracks first, the lost ones only get the detections no active track wanted.
+            rows, cols = assign(self.__cost(active, boxes, positions, class_ids, predicted_boxes, predicted_positions,
+                                            np.full(len(active), self.max_distance), True))
+            slots[cols] = active[rows]
+            unmatched = np.flatnonzero(slots < 0)
+            if len(lost) > 0 and len(unmatched) > 0:
+                reach = self.max_distance + self.max_speed * elapsed[lost, 0]
+                rows, cols = assign(self.__cost(lost, boxes[unmatched], positions[unmatched], class_ids[unmatched],
+                                                predicted_boxes, predicted_positions, reach, False))
+                slots[unmatched[cols]] = lost[rows]
+                self.__reidentified += len(rows)
+
+        tracks['missed'] += 1
+        matched = np.flatnonzero(slots >= 0)
+        if len(matched) > 0:
+            self.__matched(slots[matched], boxes[matched], positions[matched], now)
+
+        new = np.flatnonzero(slots < 0)
+        if len(new) > 0:
+            start = len(self)
+            added = {
+                'id': np.arange(self.__next_id, self.__next_id + len(new)),
+                'class_id': class_ids[new],
+                'hits': np.ones(len(new)),
+                'missed': np.zeros(len(new)),
+                'first_seen': np.full(len(new), now),
+                'last_seen': np.full(len(new), now),
+                'box': boxes[new],
+                'box_velocity': np.zeros((len(new), 4)),
+                'position': positions[new],
+                'velocity': np.zeros((len(new), 3)),
+            }
+            for name, values in added.items():
+                tracks[name] = np.concatenate((tracks[name], values.astype(tracks[name].dtype)))
+            self.__next_id += len(new)
+            slots[new] = np.arange(start, start + len(new))
+
+        ids = np.where(tracks['hits'][slots] >= self.min_hits, tracks['id'][slots], 0)
+        self.__expire(now)
+        batch.obj_id[:] = ids
+        return ids
+
+    def __matched(self, slots: np.ndarray, boxes: np.ndarray, positions: np.ndarray, now: float) -> None:
+        tracks = self.__tracks
+        elapsed = (now - tracks['last_seen'][slots])[:, None]
+        moving = elapsed[:, 0] > 0
+        if np.any(moving):
+            moved, dt = slots[moving], elapsed[moving]
+            has_position = np.any(positions[moving] != 0.0, axis=1) & np.any(tracks['position'][moved] != 0.0, axis=1)
+            box_velocity = (boxes[moving] - tracks['box'][moved]) / dt
+            velocity = np.where(has_position[:, None], (positions[moving] - tracks['position'][moved]) / dt, 0.0)
+            # The first velocity of a track is taken as is, later ones are smoothed.
+            weight = np.where(tracks['hits'][moved] > 1, self.smoothing, 1.0)[:, None]
+            tracks['box_velocity'][moved] = weight * box_velocity + (1.0 - weight) * tracks['box_velocity'][moved]
+            tracks['velocity'][moved] = weight * velocity + (1.0 - weight) * tracks['velocity'][moved]
+        tracks['box'][slots] = boxes
+        tracks['position'][slots] = positions
+        tracks['hits'][slots] += 1
+        tracks['missed'][slots] = 0
+        tracks['last_seen'][slots] = now
+
+    def __expire(self, now: float) -> None:
+        keep = now - self.__tracks['last_seen'] <= self.reid_window
+        if np.all(keep):
+            return
+        for name, values in self.__tracks.items():
+            self.__tracks[name] = values[keep]
+
+    def apply_tracklets(self, batch: DetectionBatch, tracklets: list) -> np.ndarray:
+        '''
+        Set the obj_id of the boxes from the tracklets of the device object_tracker stream instead of
+        tracking on the host; every box gets the id (plus 1, as 0 means untracked) of the tracklet of
+        its class it overlaps most, or 0. LOST tracklets are ignored.
+        '''
+        tracklets = [t for t in tracklets if t.status != 'LOST']
+        ids = np.zeros(len(batch), dtype=np.int64)
+        if len(tracklets) > 0 and len(batch) > 0:
+            tracklet_boxes = np.array([(t.x1, t.y1, t.x2, t.y2) for t in tracklets], dtype=np.float64)
+            tracklet_labels = np.array([t.label for t in tracklets], dtype=np.int32)
+            boxes = np.column_stack((batch.x1, batch.y1, batch.x2, batch.y2)).astype(np.float64)
+            iou = iou_matrix(tracklet_boxes, boxes)
+            allowed = (iou >= self.min_iou) & (tracklet_labels[:, None] == batch.class_id[None, :])
+            rows, cols = assign(np.where(allowed, 1.0 - iou, _GATED))
+            ids[cols] = np.array([tracklets[r].id + 1 for r in rows.tolist()], dtype=np.int64)
+        batch.obj_id[:] = ids
+        return ids
+
+
+class TrackerStage(CaptureStage):
+    '''
+    Sets the obj_id of the boxes of every frame with a Tracker, as a stage of DepthAI.capture(). With
+    tracklets the ids are those of the latest tracklets of the device object_tracker stream, otherwise
+    the boxes are tracked on the host. A stage replacing another continues its ids.
+    '''
+
+    name = 'track'
+
+    def __init__(self, tracker: Tracker, tracklets: bool = False):
+        self.tracker = tracker
+        self.streams = ('object_tracker',) if tracklets else ()
+        self.__tracklets = []
+
+    def packet(self, packet) -> None:
+        self.__tracklets = decode_tracklets(packet)
+
+    def process(self, batch: DetectionBatch, frame_packet, timestamp: float) -> None:
+        if self.streams:
+            self.tracker.apply_tracklets(batch, self.__tracklets)
+        else:
+            self.tracker.update(batch, timestamp)
+
+    def replaces(self, previous: CaptureStage) -> None:
+        if isinstance(previous, TrackerStage):
+            self.tracker.next_id = max(self.tracker.next_id, previous.tracker.next_id)
+
+    def reset(self) -> None:
+        self.__tracklets = []
@@ -0,0 +1,84 @@
+'''
+Measures the per-call overhead of the preconditions decorator.
+
+The same function is timed undecorated, checked with inspect.getcallargs on every call (how the
+decorator bound the arguments before), checked with the bindings precompiled at decoration time,
+and decorated while preconditions are disabled (python -O or DISABLE_PRECONDITIONS).
+
+Run from the root of the repository:
+    python -m benchmarks.bench_preconditions --output bench_preconditions.json
+'''
+import argparse
+import inspect
+import json
+import sys
+import timeit
+from functools import wraps
+
+from decorators import contracts
+
+
+def target(id: str, contextId: str, description: str = '') -> int:
+    return len(id) + len(contextId) + len(description)
+
+
+CONDITIONS = (lambda id: id is not None and len(id) > 0,
+              lambda contextId: contextId is not None and len(contextId) > 0)
+
+
+def getcallargs_preconditions(*conditions):
+    '''The argument binding the decorator used before it was precompiled.'''
+    names = [inspect.getfullargspec(c).args for c in conditions]
+
+    def decorate(f):
+        @wraps(f)
+        def g(*a, **kw):
+            args = inspect.getcallargs(f, *a, **kw)
+            for c, app_args in zip(conditions, names):
+                if not c(*[args[aa] for aa in app_args]):
+                    raise contracts.PreconditionError(f'Precondition failed in call {g}')
+            return f(*a, **kw)
+        return g
+    return decorate
+
+
+def decorated(enabled: bool):
+    previous, contracts.enabled = contracts.enabled, enabled
+    try:
+        return contracts.preconditions(*CONDITIONS)(target)
+    finally:
+        contracts.enabled = previous
+
+
+def bench(f, number: int, repeat: int) -> dict:
+    calls = {
+        'positional': lambda: f('thing', 'context'),
+        'keyword': lambda: f(id='thing', contextId='context', description='a thing'),
+    }
+    return {name: round(1e9 * min(timeit.repeat(call, number=number, repeat=repeat)) / number, 1)
+            for name, call in calls.items()}
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the per-call overhead of the preconditions decorator')
+    parser.add_argument('-o', '--output', default='bench_preconditions.json', help='File to write the JSON results to')
+    parser.add_argument('-n', '--number', type=int, default=100000, help='Calls per timing')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='Timings per mode, the fastest is reported')
+    args = parser.parse_args(argv)
+
+    modes = {
+        'undecorated': target,
+        'getcallargs': getcallargs_preconditions(*CONDITIONS)(target),
+        'precompiled': decorated(True),
+        'disabled': decorated(False),
+    }
+    results = {name: bench(f, args.number, args.repeat) for name, f in modes.items()}
+    baseline = results['undecorated']
+    for name, r in results.items():
+        print(f'{name:12s} ' + '  '.join(f'{call} {ns:8.1f} ns (+{ns - baseline[call]:7.1f})' for call, ns in r.items()))
+    with open(args.output, 'w') as f:
+        json.dump({'parameters': vars(args), 'results_ns_per_call': results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
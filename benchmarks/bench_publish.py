@@ -0,0 +1,262 @@
+'''
+End-to-end benchmark of the capture -> encode -> publish path of adl_depthai_app.
+
+The DepthAI wrapper replays synthetic packet traces through a ReplayPipeline and its frames are
+published by the Publisher of the application, set up from the application configuration as Main
+sets them up. Every stage is timed separately by the depthai_stage_seconds series of the run;
+packet polling, NN output decoding, building the detection boxes, the host stages, the journal and
+the publish, plus the CHW -> HWC merge when the frames are materialized. The sweep covers the
+number of people per frame and the frame rate, the results are written as JSON so they can be
+diffed between releases.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_publish --output bench_publish.json
+'''
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks import datariver_standin
+from metrics import Histogram
+
+# The depthai_stage_seconds stages of DepthAI.capture() and of the Publisher, besides the host stages.
+CAPTURE_STAGES = ('poll', 'wait', 'decode', 'encode')
+PUBLISH_STAGES = ('journal', 'publish')
+LABELS = ['background', 'person']
+FRAME_SHAPE = (3, 300, 300)
+
+
+def synthetic_trace(path: str, people: int, fps: float, frames: int) -> None:
+    '''Write a trace of frames previewout packets each paired with a nnet packet of people detections.'''
+    from depthai_replay import TraceRecorder, ReplayNNetPacket, ReplayDataPacket, NNET_FIELDS
+
+    rng = np.random.default_rng(people)
+    frame = rng.integers(0, 255, FRAME_SHAPE, dtype=np.uint8)
+    recorder = TraceRecorder(path, labels=LABELS, compress=False)
+    for i in range(frames):
+        rows = np.zeros((people + 1, len(NNET_FIELDS)), dtype=np.float32)
+        left, top = rng.uniform(0.0, 0.8, people), rng.uniform(0.0, 0.5, people)
+        rows[:people, 1] = 1
+        rows[:people, 2] = np.sort(rng.uniform(0.5, 1.0, people))[::-1]
+        rows[:people, 3] = left
+        rows[:people, 4] = top
+        rows[:people, 5] = left + 0.1
+        rows[:people, 6] = top + 0.4
+        rows[:people, 7] = rng.uniform(-3.0, 3.0, people)
+        rows[:people, 8] = rng.uniform(-0.5, 0.5, people)
+        rows[:people, 9] = rng.uniform(0.5, 8.0, people)
+        rows[people, 0] = -1
+        timestamp = i / fps
+        recorder.record([ReplayNNetPacket(rows, i, timestamp)],
+                        [ReplayDataPacket('previewout', frame, i, timestamp)],
+                        timestamp=timestamp)
+    recorder.close()
+
+
+def _percentiles(values, scale: float) -> dict:
+    if len(values) == 0:
+        return {'p50': None, 'p99': None, 'mean': None}
+    values = np.asarray(values) * scale
+    return {
+        'p50': round(float(np.percentile(values, 50)), 3),
+        'p99': round(float(np.percentile(values, 99)), 3),
+        'mean': round(float(np.mean(values)), 3),
+    }
+
+
+_RUNS = itertools.count()
+
+
+class StageTimer(Histogram):
+    '''A depthai_stage_seconds series that also keeps every observation, for exact percentiles.'''
+
+    def __init__(self):
+        super().__init__()
+        self.values = []
+
+    def observe(self, value: float) -> None:
+        super().observe(value)
+        self.values.append(value)
+
+
+def run(trace: str, speed: float, max_frames: int, thing, app_config: dict, track_allocations: bool = False,
+        materialize_frames: bool = False, batch_frames: int = 1) -> dict:
+    '''
+    Drive DepthAI.capture() over a trace and publish every frame it yields with a Publisher, as Main
+    does, with the host stages and publishing settings of app_config (rate control left out). The
+    stages are timed by the depthai_stage_seconds series of the run, the bench adds the time spent in
+    capture() and publish() per frame and, with materialize_frames, building the interleaved image of
+    the frame as a consumer of the frames would. With batch_frames above 1 the detections are written
+    in DetectionBoxBatch samples of that many frames.
+    '''
+    from adl_depthai_app import init_acquisition, init_pairer, init_stages
+    from capture_stages import STAGE_ORDER
+    from datariver.publisher import Publisher
+    from depthai_replay import ReplayPipeline, TraceConfig
+    from depthai_wrapper import DepthAI, EMPTY_POLLS
+    from metrics import registry
+
+    app_config = {section: dict(values) for section, values in app_config.items()}
+    app_config['batching'].update(enabled=batch_frames > 1, max_frames=batch_frames)
+    pipeline = ReplayPipeline(trace, speed=speed)
+    config = TraceConfig(pipeline.labels, pipeline.nnet_fields)
+    # Every run reports to series of its own.
+    stream_id = f'bench-{next(_RUNS)}'
+    timers = {stage: StageTimer() for stage in CAPTURE_STAGES + STAGE_ORDER + PUBLISH_STAGES}
+    stage_seconds = registry.get('depthai_stage_seconds')
+    for stage, timer in timers.items():
+        stage_seconds.add(timer, stream=stream_id, stage=stage)
+    depthai = DepthAI(config, stream_id, 'bench', 'people', pipeline=pipeline, yield_frames=materialize_frames,
+                      stages=init_stages(app_config, config), acquisition=init_acquisition(app_config, config),
+                      pairing=app_config['pairing']['mode'], pairer=init_pairer(app_config),
+                      threshold=float(app_config['detection']['threshold']),
+                      labels=app_config['detection']['labels'])
+    publisher = Publisher(thing, app_config)
+    timings = {'capture_call': [], 'merge': [], 'publish_call': []}
+    latencies = []
+    allocations = []
+    frame_num = 0
+    writes = getattr(thing, 'writes', None)
+
+    frames = depthai.capture()
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    while frame_num < max_frames:
+        if track_allocations:
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+        t = time.perf_counter()
+        item = next(frames, None)
+        if item is None:
+            break
+        frame, boxes = item
+        captured = time.perf_counter()
+        if materialize_frames:
+            frame.image
+        merged = time.perf_counter()
+        publisher.publish(boxes, depthai.captured_at)
+        published = time.perf_counter()
+        if track_allocations:
+            _, peak = tracemalloc.get_traced_memory()
+            allocations.append(peak - base)
+
+        timings['capture_call'].append(captured - t)
+        if materialize_frames:
+            timings['merge'].append(merged - captured)
+        timings['publish_call'].append(published - merged)
+        latencies.append(time.monotonic() - depthai.polled_at)
+        frame_num += 1
+        del frame, item
+
+    frames.close()
+    publisher.close()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    timings.update((stage, timer.values) for stage, timer in timers.items())
+    return {
+        'frames': frame_num,
+        'batch_frames': batch_frames,
+        'writes': thing.writes - writes if writes is not None else None,
+        'empty_polls': int(EMPTY_POLLS.labels(stream=stream_id).value),
+        'throughput_fps': round(frame_num / elapsed, 2) if elapsed > 0 else None,
+        'cpu_ms_per_frame': round(1000.0 * cpu / frame_num, 4) if frame_num > 0 else None,
+        'latency_ms': _percentiles(latencies, 1e3),
+        'stages_us': {stage: _percentiles(values, 1e6) for stage, values in timings.items() if len(values) > 0},
+        'alloc_peak_bytes_per_frame': _percentiles(allocations, 1.0) if track_allocations else None,
+    }
+
+
+def sweep(people_counts, frame_rates, frames: int, duration: float, thing, app_config: dict,
+          materialize_frames: bool, batch_sizes=(1,)) -> list:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        for people in people_counts:
+            trace = os.path.join(tmp, f'people{people}.dait')
+            synthetic_trace(trace, people, max(frame_rates), frames)
+            result = run(trace, 0.0, frames, thing, app_config, materialize_frames=materialize_frames)
+            result.update({'mode': 'throughput', 'people': people, 'target_fps': None})
+            results.append(result)
+            for batch_frames in batch_sizes:
+                if batch_frames <= 1:
+                    continue
+                batched = run(trace, 0.0, frames, thing, app_config, materialize_frames=materialize_frames,
+                              batch_frames=batch_frames)
+                batched.update({'mode': 'batched', 'people': people, 'target_fps': None})
+                results.append(batched)
+
+            tracemalloc.start()
+            allocations = run(trace, 0.0, min(frames, 200), thing, app_config, track_allocations=True,
+                              materialize_frames=materialize_frames)
+            tracemalloc.stop()
+            result['alloc_peak_bytes_per_frame'] = allocations['alloc_peak_bytes_per_frame']
+
+            for fps in frame_rates:
+                trace = os.path.join(tmp, f'people{people}_fps{fps}.dait')
+                realtime_frames = max(1, int(fps * duration))
+                synthetic_trace(trace, people, fps, realtime_frames)
+                result = run(trace, 1.0, realtime_frames, thing, app_config, materialize_frames=materialize_frames)
+                result.update({'mode': 'realtime', 'people': people, 'target_fps': fps})
+                results.append(result)
+    return results
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the capture -> encode -> publish path')
+    parser.add_argument('-o', '--output', default='bench_publish.json', help='File to write the JSON results to')
+    parser.add_argument('-p', '--people', type=int, nargs='+', default=[0, 1, 5, 10, 20, 50],
+                        help='People per frame to sweep')
+    parser.add_argument('-r', '--fps', type=float, nargs='+', default=[15.0, 30.0, 60.0],
+                        help='Frame rates to sweep in real time mode')
+    parser.add_argument('-n', '--frames', type=int, default=1000, help='Frames per throughput run')
+    parser.add_argument('-d', '--duration', type=float, default=5.0, help='Seconds per real time run')
+    parser.add_argument('--materialize-frames', action='store_true',
+                        help='Build the interleaved image of every frame, as a consumer of the frames would')
+    parser.add_argument('-b', '--batch', type=int, nargs='+', default=[1, 5, 10],
+                        help='Frames per DetectionBoxBatch write to sweep in throughput mode, 1 writes every frame')
+    parser.add_argument('-c', '--app-config', default=None,
+                        help='Application configuration to set the host stages and the publishing up from, '
+                             'the one of adl_depthai_app by default')
+    parser.add_argument('--datariver', action='store_true',
+                        help='Publish through the installed Edge SDK instead of the in-process stand-in')
+    args = parser.parse_args(argv)
+
+    standin = datariver_standin.install(force=not args.datariver)
+    if standin:
+        thing = datariver_standin.Thing()
+    else:
+        from adl_depthai_app import init_edge_thing
+        thing = init_edge_thing().thing
+    from adl_depthai_app import APP_CONFIG_FILE, load_app_config
+    app_config = load_app_config(args.app_config or APP_CONFIG_FILE)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'datariver_standin': standin,
+            'frame_shape': FRAME_SHAPE,
+            'materialize_frames': args.materialize_frames,
+            'app_config': app_config,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': sweep(args.people, args.fps, args.frames, args.duration, thing, app_config,
+                         args.materialize_frames, args.batch),
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f'Wrote {len(report["results"])} results to {args.output}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,96 @@
+'''
+Compares decoding DepthDetectionBox samples one field at a time into PyDepthDetectionBoxData objects
+(the getattr/setattr copy iot_safe_copy does) with DetectionBoxReader decoding them into columns.
+
+The samples of several cameras are built with the in-process Data River stand-in, as a subscriber
+draining its input every frame interval would receive them.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_reader --output bench_reader.json
+'''
+import argparse
+import json
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from benchmarks import datariver_standin
+
+datariver_standin.install()
+
+from adlinktech.datariver import FlowState
+from datacls import DetectionBatch, PyDepthDetectionBox, PyDepthDetectionBoxData
+from datariver.reader import BOX_FIELDS, DetectionBoxReader
+
+Sample = namedtuple('Sample', ['data', 'flow_id', 'flow_state', 'timestamp'])
+
+
+def make_samples(cameras: int, people: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    samples = []
+    for camera in range(cameras):
+        batch = DetectionBatch(people, ['bg', 'person'])
+        x1, y1 = rng.uniform(0, 0.8, people), rng.uniform(0, 0.8, people)
+        batch.extend(people, obj_id=np.arange(people), class_id=1, x1=x1, y1=y1, x2=x1 + 0.1, y2=y1 + 0.2,
+                     probability=rng.uniform(0.5, 1.0, people), dist_x=rng.normal(0, 2, people),
+                     dist_y=rng.normal(0, 0.1, people), dist_z=rng.uniform(1, 8, people))
+        boxes = PyDepthDetectionBox(f'oakd-{camera}', f'camera-{camera}', 1, batch)
+        samples.append(Sample(boxes.dr_data, f'camera-{camera}', FlowState.ALIVE, time.time()))
+    return samples
+
+
+def decode_per_field(samples) -> list:
+    kinds = dict(BOX_FIELDS)
+    frames = []
+    for sample in samples:
+        fields = {nvp.name: nvp.value for nvp in sample.data}
+        boxes = []
+        for item in fields['data'].nvp_seq:
+            box = PyDepthDetectionBoxData()
+            for nvp in item.value.nvp_seq:
+                setattr(box, nvp.name, getattr(nvp.value, kinds[nvp.name]))
+            boxes.append(box)
+        frames.append((fields['stream_id'].string, fields['frame_id'].uint32, boxes))
+    return frames
+
+
+def bench(cameras: int, people: int, reads: int) -> dict:
+    samples = make_samples(cameras, people)
+    reader = DetectionBoxReader(None)
+    timings = {'per_field': [], 'columnar': []}
+    for _ in range(reads):
+        t = time.perf_counter()
+        decode_per_field(samples)
+        timings['per_field'].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        columns = reader.decode(samples)
+        timings['columnar'].append(time.perf_counter() - t)
+
+    if len(columns) != cameras * people:
+        raise AssertionError(f'Decoded {len(columns)} boxes, expected {cameras * people}')
+    result = {name: round(1e6 * float(np.median(values)), 2) for name, values in timings.items()}
+    result.update({'cameras': cameras, 'people': people})
+    return result
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Benchmark decoding DepthDetectionBox samples')
+    parser.add_argument('-o', '--output', default='bench_reader.json', help='File to write the JSON results to')
+    parser.add_argument('-c', '--cameras', type=int, nargs='+', default=[1, 4, 8], help='Samples per read')
+    parser.add_argument('-p', '--people', type=int, nargs='+', default=[5, 20, 50], help='Boxes per sample')
+    parser.add_argument('-n', '--reads', type=int, default=50, help='Reads per configuration')
+    args = parser.parse_args(argv)
+
+    results = [bench(cameras, people, args.reads) for cameras in args.cameras for people in args.people]
+    for r in results:
+        print(f'{r["cameras"]:2d} cameras {r["people"]:3d} people: per field {r["per_field"]:10.1f} us  '
+              f'columnar {r["columnar"]:10.1f} us')
+    with open(args.output, 'w') as f:
+        json.dump({'parameters': vars(args), 'results_us': results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,94 @@
+'''
+Compares the all-pairs distance check with the SpatialGrid index for social distancing violations.
+
+For every people count a room is sized to keep the density constant, the people then take small
+random steps between frames. The grid is timed both rebuilt from scratch and updated incrementally.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_spatial_grid --output bench_spatial_grid.json
+'''
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from benchmarks import datariver_standin
+
+# analytics.occupancy pulls in datacls, which needs a Data River binding to import.
+datariver_standin.install()
+
+from analytics.occupancy import pairwise_distances
+from analytics.spatial_grid import SpatialGrid
+
+
+def brute_force(positions: np.ndarray, threshold: float) -> set:
+    distances = pairwise_distances(positions)
+    a, b = np.triu_indices(len(positions), 1)
+    close = distances[a, b] < threshold
+    return set(zip(a[close].tolist(), b[close].tolist()))
+
+
+def grid_pairs(grid: SpatialGrid, threshold: float) -> set:
+    pairs = grid.pairs_within(threshold)
+    return set((min(a, b), max(a, b)) for a, b in zip(pairs.a, pairs.b))
+
+
+def bench(people: int, threshold: float, density: float, frames: int, step: float, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    side = np.sqrt(people / density)
+    positions = np.column_stack((rng.uniform(0, side, people), rng.uniform(-0.5, 0.5, people),
+                                 rng.uniform(0, side, people)))
+    keys = list(range(people))
+    incremental = SpatialGrid(threshold)
+    timings = {'brute_force': [], 'grid_rebuild': [], 'grid_incremental': []}
+    violations = 0
+    for _ in range(frames):
+        positions[:, [0, 2]] += rng.normal(0, step, (people, 2))
+
+        t = time.perf_counter()
+        expected = brute_force(positions, threshold)
+        timings['brute_force'].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        rebuilt = SpatialGrid(threshold)
+        rebuilt.update(keys, positions)
+        grid_pairs(rebuilt, threshold)
+        timings['grid_rebuild'].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        incremental.update(keys, positions)
+        found = grid_pairs(incremental, threshold)
+        timings['grid_incremental'].append(time.perf_counter() - t)
+
+        if found != expected:
+            raise AssertionError(f'SpatialGrid found {len(found)} violations, brute force {len(expected)}')
+        violations += len(expected)
+
+    result = {name: round(1e6 * float(np.median(values)), 2) for name, values in timings.items()}
+    result.update({'people': people, 'violations_per_frame': violations / frames})
+    return result
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Benchmark SpatialGrid against the all-pairs distance check')
+    parser.add_argument('-o', '--output', default='bench_spatial_grid.json', help='File to write the JSON results to')
+    parser.add_argument('-p', '--people', type=int, nargs='+', default=[10, 25, 50, 100, 200, 350, 500],
+                        help='People counts to compare')
+    parser.add_argument('-t', '--threshold', type=float, default=1.5, help='Distancing threshold in metres')
+    parser.add_argument('-d', '--density', type=float, default=0.25, help='People per square metre')
+    parser.add_argument('-n', '--frames', type=int, default=50, help='Frames per people count')
+    parser.add_argument('-s', '--step', type=float, default=0.05, help='Standard deviation of a step in metres')
+    args = parser.parse_args(argv)
+
+    results = [bench(people, args.threshold, args.density, args.frames, args.step) for people in args.people]
+    for r in results:
+        print(f'{r["people"]:4d} people: brute force {r["brute_force"]:10.1f} us  '
+              f'grid rebuild {r["grid_rebuild"]:10.1f} us  grid incremental {r["grid_incremental"]:10.1f} us')
+    with open(args.output, 'w') as f:
+        json.dump({'parameters': vars(args), 'results_us': results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,157 @@
+'''
+An in-process stand-in for the parts of adlinktech.datariver used by this application, so the
+capture -> encode -> publish path can be benchmarked on machines without the Edge SDK.
+
+The stand-in mirrors the ownership semantics of the native binding; IotNvp copies the IotValue it
+is given and Thing.write walks (serializes) the whole sample.
+'''
+import sys
+import types
+
+_KINDS = ('int8', 'uint8', 'int16', 'uint16', 'int32', 'uint32', 'int64', 'uint64',
+          'float32', 'float64', 'boolean', 'string', 'nvp_seq', 'byte_seq',
+          'int32_seq', 'uint32_seq', 'float32_seq', 'float64_seq', 'string_seq')
+
+
+class IotValue:
+    __slots__ = ('_kind', '_value')
+
+    def __init__(self):
+        self._kind = None
+        self._value = None
+
+    def __copy__(self):
+        copy = IotValue()
+        copy._kind = self._kind
+        copy._value = self._value
+        return copy
+
+
+def _value_property(kind):
+    def getter(self):
+        return self._value
+
+    def setter(self, value):
+        self._kind = kind
+        self._value = value
+
+    return property(getter, setter)
+
+
+for _kind in _KINDS:
+    setattr(IotValue, _kind, _value_property(_kind))
+
+
+class IotNvp:
+    __slots__ = ('name', '_value')
+
+    def __init__(self, name: str = '', value: IotValue = None):
+        self.name = name
+        self._value = value.__copy__() if value is not None else IotValue()
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value.__copy__()
+
+
+class IotNvpSeq(list):
+    def push_back(self, nvp):
+        self.append(nvp)
+
+
+def IotByteSeq_from_buffer(buffer):
+    return bytes(buffer)
+
+
+def as_nvp_seq(obj):
+    return obj.dr_data
+
+
+class FlowState:
+    ALIVE = 0
+    DISCONNECTED = 1
+    PURGED = 2
+
+
+def _serialized_size(seq) -> int:
+    size = 0
+    for nvp in seq:
+        value = nvp.value
+        size += len(nvp.name)
+        if value._kind == 'nvp_seq':
+            size += _serialized_size(value._value)
+        elif value._kind == 'string':
+            size += len(value._value)
+        else:
+            size += 8
+    return size
+
+
+class Thing:
+    '''Records what was written to each output.'''
+
+    def __init__(self):
+        self.writes = 0
+        self.bytes_written = 0
+
+    def write(self, output, *args):
+        data = args[-1]
+        self.writes += 1
+        self.bytes_written += _serialized_size(data)
+
+
+class DataRiver:
+    @staticmethod
+    def get_instance(config_uri=None):
+        return DataRiver()
+
+    def add_tag_group_registry(self, registry):
+        pass
+
+    def add_thing_class_registry(self, registry):
+        pass
+
+    def create_thing(self, properties):
+        return Thing()
+
+    def close(self):
+        pass
+
+
+class JSonTagGroupRegistry:
+    def register_tag_groups_from_uri(self, uri):
+        pass
+
+
+class JSonThingClassRegistry:
+    def register_thing_classes_from_uri(self, uri):
+        pass
+
+
+class JSonThingProperties:
+    def read_properties_from_string(self, properties):
+        pass
+
+
+def install(force: bool = False) -> bool:
+    '''
+    Register this stand-in as adlinktech.datariver. Unless force is set the real binding is used
+    when it is importable. Returns True when the stand-in is in use.
+    '''
+    if not force:
+        try:
+            import adlinktech.datariver
+            return False
+        except ImportError:
+            pass
+    module = sys.modules[__name__]
+    package = types.ModuleType('adlinktech')
+    package.__path__ = []
+    package.datariver = module
+    sys.modules['adlinktech'] = package
+    sys.modules['adlinktech.datariver'] = module
+    return True
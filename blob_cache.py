@@ -0,0 +1,278 @@
+import hashlib
+import importlib
+import json
+import logging as log
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+BLOB_CACHE_ENV_VAR = 'DEPTHAI_BLOB_CACHE'
+BLOB_CACHE_MAX_MB_ENV_VAR = 'DEPTHAI_BLOB_CACHE_MAX_MB'
+BLOB_COMPILER_ENV_VAR = 'DEPTHAI_BLOB_COMPILER'
+DEFAULT_BLOB_CACHE_DIR = '~/.cache/adl-depthai/blobs'
+DEFAULT_BLOB_CACHE_MAX_MB = 512
+
+# Bump when the compiler changes in a way that makes previously compiled blobs unusable.
+CACHE_FORMAT_VERSION = 1
+
+# A compiler builds the blob of model for the given resources into output and returns whether it
+# succeeded; compiler(model, shaves, cmx_slices, nn_engines, output) -> bool
+Compiler = Callable[[str, int, int, int, str], bool]
+
+
+def depthai_compiler(model: str, shaves: int, cmx_slices: int, nn_engines: int, output: str) -> bool:
+    '''Compile the blob with depthai.download_blob, which takes the shaves and cmx slices per NN engine.'''
+    import depthai
+
+    ret = depthai.download_blob((model, shaves // nn_engines, cmx_slices // nn_engines, nn_engines, output))
+    log.info(f'Blob download result {str(ret)}')
+    return ret == 0
+
+
+def copy_compiler(source_dir: str) -> Compiler:
+    '''
+    A local stand-in for the compiler that copies <source_dir>/<model>.sh<shaves>cmx<cmx_slices>NCE<nn_engines>
+    (or <source_dir>/<model>.blob when there is no such file), for offline provisioning and testing.
+    '''
+    def compile_blob(model: str, shaves: int, cmx_slices: int, nn_engines: int, output: str) -> bool:
+        source = Path(source_dir) / f'{model}.sh{shaves}cmx{cmx_slices}NCE{nn_engines}'
+        if not source.exists():
+            source = Path(source_dir) / f'{model}.blob'
+        if not source.exists():
+            log.error(f'No blob for {model} in {source_dir}')
+            return False
+        shutil.copyfile(source, output)
+        return True
+
+    return compile_blob
+
+
+def load_compiler(spec: str = None) -> Compiler:
+    '''
+    The compiler named by spec; 'depthai' (the default), 'copy:<directory>' for copy_compiler, or
+    '<module>:<function>' for any other callable with the Compiler signature.
+    '''
+    if spec is None or spec == 'depthai':
+        return depthai_compiler
+    kind, _, argument = spec.partition(':')
+    if kind == 'copy':
+        return copy_compiler(argument)
+    if not argument:
+        raise ValueError(f'Blob compiler must be depthai, copy:<directory> or <module>:<function>, not {spec}')
+    return getattr(importlib.import_module(kind), argument)
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def blob_key(model: str, shaves: int, cmx_slices: int, nn_engines: int, model_digest: str = '') -> str:
+    '''
+    The cache key of a compiled blob; a hash of the model, the digest of its files (so a changed model
+    is recompiled) and the resources it is compiled for.
+    '''
+    key = json.dumps({'model': model, 'model_digest': model_digest, 'shaves': int(shaves),
+                      'cmx_slices': int(cmx_slices), 'nn_engines': int(nn_engines),
+                      'version': CACHE_FORMAT_VERSION}, sort_keys=True)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class BlobCache:
+    '''
+    A content-addressed cache of compiled blobs. Every blob is stored under the hash of what it was
+    compiled from (see blob_key) next to a JSON sidecar with the SHA-256 and size of the blob, which
+    are checked whenever it is used; entries that fail the check are removed and compiled again.
+
+    The cache is bounded to max_bytes, least recently used blobs (by file modification time, updated
+    on every hit) are evicted first. Writes go through a temporary file so a crash never leaves a
+    partial blob in the cache.
+    '''
+
+    def __init__(self, directory: str = None, max_bytes: int = None, compiler: Compiler = None):
+        directory = directory or os.getenv(BLOB_CACHE_ENV_VAR) or DEFAULT_BLOB_CACHE_DIR
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv(BLOB_CACHE_MAX_MB_ENV_VAR, DEFAULT_BLOB_CACHE_MAX_MB)) * 1024 * 1024)
+        self.directory = Path(directory).expanduser()
+        self.max_bytes = max_bytes
+        self.compiler = compiler if compiler is not None else load_compiler(os.getenv(BLOB_COMPILER_ENV_VAR))
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def __paths(self, key: str) -> (Path, Path):
+        return self.directory / f'{key}.blob', self.directory / f'{key}.json'
+
+    def __remove(self, key: str) -> None:
+        for path in self.__paths(key):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def entries(self) -> List[dict]:
+        '''The metadata of every blob in the cache, least recently used first.'''
+        entries = []
+        for meta_path in self.directory.glob('*.json'):
+            blob_path = meta_path.with_suffix('.blob')
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                meta['last_used'] = blob_path.stat().st_mtime
+            except (OSError, ValueError):
+                continue
+            meta['key'] = meta_path.stem
+            meta['path'] = str(blob_path)
+            entries.append(meta)
+        return sorted(entries, key=lambda entry: entry['last_used'])
+
+    @property
+    def size(self) -> int:
+        return sum(entry['size'] for entry in self.entries())
+
+    def verify(self, key: str) -> bool:
+        '''Whether the blob of key is in the cache with the size and SHA-256 it was stored with.'''
+        blob_path, meta_path = self.__paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            return blob_path.stat().st_size == meta['size'] and file_digest(blob_path) == meta['sha256']
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def get(self, key: str) -> str:
+        '''The path of the blob of key, None on a miss. A corrupt entry is removed and is a miss.'''
+        blob_path, meta_path = self.__paths(key)
+        if not meta_path.exists():
+            return None
+        if not self.verify(key):
+            log.warning(f'Blob cache entry {key} failed its integrity check, removing it')
+            self.__remove(key)
+            return None
+        os.utime(blob_path)
+        return str(blob_path)
+
+    def put(self, key: str, blob_file: str, meta: dict = None) -> str:
+        '''Copy blob_file into the cache as the blob of key, evicting old blobs to stay within max_bytes.'''
+        blob_path, meta_path = self.__paths(key)
+        meta = dict(meta or {})
+        meta.update({'sha256': file_digest(blob_file), 'size': os.path.getsize(blob_file), 'created': time.time()})
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(blob_file, tmp)
+            os.replace(tmp, blob_path)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f, indent=2, sort_keys=True)
+        os.replace(tmp, meta_path)
+        self.evict(keep=key)
+        return str(blob_path)
+
+    def evict(self, keep: str = None) -> List[str]:
+        '''Remove least recently used blobs until the cache fits in max_bytes, returns their keys.'''
+        entries = self.entries()
+        total = sum(entry['size'] for entry in entries)
+        evicted = []
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry['key'] == keep:
+                continue
+            self.__remove(entry['key'])
+            total -= entry['size']
+            evicted.append(entry['key'])
+            log.info(f'Evicted blob {entry.get("model")} {entry["key"]} from the blob cache')
+        return evicted
+
+    def get_or_compile(self, model: str, shaves: int, cmx_slices: int, nn_engines: int,
+                       model_file: str = None) -> str:
+        '''
+        The path of the blob of model compiled for the given resources, compiling it into the cache on a
+        miss. model_file (e.g. the default blob of the model) is hashed into the key when it exists.
+        Returns None when the compiler fails.
+        '''
+        model_digest = file_digest(model_file) if model_file and Path(model_file).is_file() else ''
+        key = blob_key(model, shaves, cmx_slices, nn_engines, model_digest)
+        path = self.get(key)
+        if path is not None:
+            log.info(f'Blob cache hit for {model} compiled for {shaves} shaves, {cmx_slices} cmx_slices '
+                     f'and {nn_engines} NN_engines')
+            return path
+
+        log.info(f'Compiling {model} for {shaves} shaves, {cmx_slices} cmx_slices and {nn_engines} NN_engines')
+        with tempfile.TemporaryDirectory(dir=self.directory) as tmp:
+            output = os.path.join(tmp, 'compiled.blob')
+            started = time.monotonic()
+            if not self.compiler(model, shaves, cmx_slices, nn_engines, output) or not os.path.exists(output):
+                return None
+            meta = {'model': model, 'model_digest': model_digest, 'shaves': shaves, 'cmx_slices': cmx_slices,
+                    'nn_engines': nn_engines, 'compile_seconds': round(time.monotonic() - started, 3)}
+            return self.put(key, output, meta)
+
+
+def parse_blob_config(spec: str) -> dict:
+    '''A configuration to precompile given as <model>:<shaves>:<cmx_slices>:<nn_engines>'''
+    try:
+        model, shaves, cmx_slices, nn_engines = spec.split(':')
+        return {'model': model, 'shaves': int(shaves), 'cmx_slices': int(cmx_slices), 'nn_engines': int(nn_engines)}
+    except ValueError:
+        raise ValueError(f'Blob configuration must be <model>:<shaves>:<cmx_slices>:<nn_engines>, not {spec}')
+
+
+def precompile(cache: BlobCache, configs: List[dict]) -> List[dict]:
+    '''Populate the cache with the blobs of every configuration, returns the result of each.'''
+    from depthai_utils import get_model_files
+
+    results = []
+    for blob_config in configs:
+        model_file, _ = get_model_files(False, blob_config['model'])
+        path = cache.get_or_compile(blob_config['model'], blob_config['shaves'], blob_config['cmx_slices'],
+                                    blob_config['nn_engines'], model_file)
+        results.append(dict(blob_config, path=path, ok=path is not None))
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    log.basicConfig(format='[ %(levelname)s ] %(message)s', level=log.INFO, stream=sys.stdout)
+    parser = argparse.ArgumentParser(description='Manage the cache of compiled DepthAI blobs')
+    parser.add_argument('-d', '--directory', help=f'Cache directory, defaults to ${BLOB_CACHE_ENV_VAR} or '
+                                                  f'{DEFAULT_BLOB_CACHE_DIR}')
+    parser.add_argument('-m', '--max-mb', type=float, help=f'Cache size limit in MB, defaults to '
+                                                           f'${BLOB_CACHE_MAX_MB_ENV_VAR} or {DEFAULT_BLOB_CACHE_MAX_MB}')
+    parser.add_argument('-c', '--compiler', help='depthai (default), copy:<directory> or <module>:<function>')
+    commands = parser.add_subparsers(dest='command', required=True)
+    precompile_parser = commands.add_parser('precompile', help='Compile blobs into the cache')
+    precompile_parser.add_argument('configs', nargs='*', metavar='MODEL:SHAVES:CMX:ENGINES',
+                                   help='Configurations to compile, e.g. mobilenet-ssd:14:14:2')
+    precompile_parser.add_argument('-f', '--file', help='JSON file with a list of {model, shaves, cmx_slices, '
+                                                        'nn_engines} configurations')
+    commands.add_parser('list', help='List the cached blobs, least recently used first')
+    commands.add_parser('verify', help='Check every cached blob and remove the corrupt ones')
+    args = parser.parse_args()
+
+    cache = BlobCache(args.directory, int(args.max_mb * 1024 * 1024) if args.max_mb is not None else None,
+                      load_compiler(args.compiler or os.getenv(BLOB_COMPILER_ENV_VAR)))
+    if args.command == 'precompile':
+        configs = [parse_blob_config(spec) for spec in args.configs]
+        if args.file:
+            with open(args.file) as f:
+                configs.extend(json.load(f))
+        results = precompile(cache, configs)
+        print(json.dumps(results, indent=2))
+        sys.exit(0 if all(result['ok'] for result in results) else 1)
+    elif args.command == 'list':
+        print(json.dumps(cache.entries(), indent=2))
+    elif args.command == 'verify':
+        corrupt = [entry['key'] for entry in cache.entries() if cache.get(entry['key']) is None]
+        print(json.dumps({'entries': len(cache.entries()), 'removed': corrupt}, indent=2))
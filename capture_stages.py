@@ -0,0 +1,55 @@
+from typing import Dict, Iterable, List
+
+# The order the stages are applied to the boxes of a frame in; the ROI depth sets the distances the
+# second stage and the tracker see. Stages of other names are applied after these.
+STAGE_ORDER = ('video', 'roi_depth', 'second_stage', 'track')
+
+
+class CaptureStage:
+    '''
+    An optional host stage of DepthAI.capture(). It is given the packets of its data streams as they
+    are polled, and unless per_frame is False it is applied to the boxes of every frame yielded. The
+    name is the stage label of depthai_stage_seconds, and what DepthAI.reconfigure() replaces it by.
+    '''
+
+    name = None
+    # The data streams whose packets the stage takes, e.g. depth_raw.
+    streams = ()
+    # Whether the stage reads the previewout data of the frames, which are then kept when not yielded.
+    needs_frames = False
+    # Whether the stage is applied to the boxes of every frame, rather than only taking packets.
+    per_frame = True
+
+    def packet(self, packet) -> None:
+        '''Take a polled packet of one of the streams.'''
+        pass
+
+    def process(self, batch: 'DetectionBatch', frame_packet, timestamp: float) -> None:
+        '''
+        Update the boxes of a frame captured at timestamp (device seconds). frame_packet is its
+        previewout packet, None when it was not kept or has not arrived.
+        '''
+        pass
+
+    def replaces(self, previous: 'CaptureStage') -> None:
+        '''Carry the state that must outlive a change of the settings over from the stage of the same name.'''
+        pass
+
+    def reset(self) -> None:
+        '''Forget the packets taken, the device pipeline was rebuilt.'''
+        pass
+
+
+def ordered(stages: Iterable[CaptureStage]) -> List[CaptureStage]:
+    '''The stages in STAGE_ORDER.'''
+    rank = {name: i for i, name in enumerate(STAGE_ORDER)}
+    return sorted(stages, key=lambda stage: rank.get(stage.name, len(STAGE_ORDER)))
+
+
+def by_stream(stages: Iterable[CaptureStage]) -> Dict[str, List[CaptureStage]]:
+    '''The stages taking the packets of each data stream.'''
+    streams = {}
+    for stage in stages:
+        for stream in stage.streams:
+            streams.setdefault(stream, []).append(stage)
+    return streams
@@ -1,13 +1,14 @@
 import logging as log
 import json
+import os
 from pathlib import Path
 
 import consts.resource_paths
 from depthai import get_nn_to_depth_bbox_mapping
 from depthai_helpers.cli_utils import PrintColors
-from depthai_helpers.mobilenet_ssd_handler import decode_mobilenet_ssd, show_mobilenet_ssd
 from depthai_helpers import utils
 
+from blob_cache import BlobCache
 from depthai_utils import get_model_files
 
 class DepthAIConfig:
@@ -52,6 +53,24 @@ class DepthAIConfig:
     def record_video(self) -> bool:
         return self.video is not None
 
+    @property
+    def decode_nn(self):
+        # mobilenet_ssd_handler pulls in OpenCV, it is only imported when the decoder is asked for.
+        from depthai_helpers.mobilenet_ssd_handler import decode_mobilenet_ssd
+        return decode_mobilenet_ssd
+
+    @property
+    def show_nn(self):
+        from depthai_helpers.mobilenet_ssd_handler import show_mobilenet_ssd
+        return show_mobilenet_ssd
+
+    def stream_max_fps(self, name : str) -> float:
+        '''The max_fps requested for a stream, None when it is not set or the stream is not enabled.'''
+        for stream in self.stream_list:
+            if isinstance(stream, dict) and stream.get('name') == name:
+                return stream.get('max_fps')
+        return None
+
     @property
     def enable_object_tracker(self):
         return 'object_tracker' in self.stream_names
@@ -80,8 +99,6 @@ class DepthAIConfig:
         self.calc_dist_to_bb = True
         if self.disable_depth:
             self.calc_dist_to_bb = False
-        self.decode_nn = decode_mobilenet_ssd
-        self.show_nn = show_mobilenet_ssd
         if self.cnn_model:
             self.blob_file, self.blob_file_config = get_model_files(self.calc_dist_to_bb, self.cnn_model)
         if not Path(self.blob_file).exists():
@@ -92,7 +109,7 @@ class DepthAIConfig:
             raise FileNotFoundError
         self.blob_file2 = ""
         self.blob_file_config2 = ""
-        self.cnn_model2 = None
+        self.labels2 = None
         if self.cnn_model2:
             log.info(f"Using CNN2: {self.cnn_model2}")
             self.blob_file2, self.blob_file_config2 = get_model_files(False, self.cnn_model2)
@@ -103,6 +120,8 @@ class DepthAIConfig:
                 log.error(
                     f'{PrintColors.WARNING.value}NN2 json not found in {self. blob_file_config2}{PrintColors.ENDC.value}')
                 raise FileNotFoundError
+            with open(self.blob_file_config2) as f:
+                self.labels2 = json.load(f).get('mappings', {}).get('labels')
         with open(self.blob_file_config) as f:
             data = json.load(f)
         try:
@@ -155,8 +174,9 @@ class DepthAIConfig:
                 {
                     'blob_file': self.blob_file,
                     'blob_file_config': self.blob_file_config,
-                    'blob_file2': self.blob_file2,
-                    'blob_file_config2': self.blob_file_config2,
+                    # The second stage runs on the host, on the crops of the detections (analytics.second_stage).
+                    'blob_file2': '',
+                    'blob_file_config2': '',
                     'calc_dist_to_bb': self.calc_dist_to_bb,
                     'keep_aspect_ratio': not self.full_fov_nn,
                     'camera_input': self.cnn_camera,
@@ -235,41 +255,25 @@ class DepthAIConfig:
                         f'{PrintColors.RED.value}shaves and cmx_slices must be an even number when using 2 neural compute engines{PrintColors.ENDC.value}')
                     raise ValueError(
                         'DepthAIConfig: shaves and cmx_slices must be an even number when using 2 neural compute engines')
-                shave_nr_opt = int(self.shaves / 2)
-                cmx_slices_opt = int(self.cmx_slices / 2)
+            cache = BlobCache()
+            blob_file = cache.get_or_compile(self.cnn_model, int(self.shaves), int(self.cmx_slices),
+                                             int(self.NN_engines), self.blob_file)
+            if blob_file is None:
+                log.warning(
+                    f'{PrintColors.WARNING.value}Model compile failed. Failing back to default.{PrintColors.ENDC.value}')
+                self.default_blob = True
             else:
-                shave_nr_opt = int(self.shaves)
-                cmx_slices_opt = int(self.cmx_slices)
-            outblob_file = f'b{self.blob_file}.sh{str(self.shaves)}cmx{str(self.cmx_slices)}NCE{str(self.NN_engines)}'
-            if not Path(outblob_file).exists():
-                log.info(
-                    f'{PrintColors.RED.value}Compiling model for {str(self.shaves)} shaves, {str(self.cmx_slices)} cmx_slices and {str(config.NN_engines)} NN_engines{PrintColors.ENDC.value}')
-                ret = depthai.download_blob((self.cnn_model, shave_nr_opt, cmx_slices_opt, self.NN_engines, outblob_file))
-                log.info(f'Blob download result {str(ret)}')
-                if (ret != 0):
+                self.blob_file = blob_file
+
+            if self.cnn_model2:
+                blob_file2 = cache.get_or_compile(self.cnn_model2, int(self.shaves), int(self.cmx_slices),
+                                                  int(self.NN_engines), self.blob_file2)
+                if blob_file2 is None:
                     log.warning(
-                        f'{PrintColors.WARNING.value}Model compile failed. Failing back to default.{PrintColors.ENDC.value}')
+                        f'{PrintColors.WARNING.value}Model2 compile failed. Failing back to default.{PrintColors.ENDC.value}')
                     self.default_blob = True
                 else:
-                    self.blob_file = outblob_file
-            else:
-                log.info(
-                    f'{PrintColors.GREEN.value}Compiled mode found: compiled for {str(self.shaves)} shaves, {str(self.cmx_slices)} and {str(self.NN_engines)} NN_engines{PrintColors.ENDC.value}')
-                self.blob_file = outblob_file
-
-            if self.cnn_model2:
-                outblob_file = f'b{self.blob_file2}.sh{str(self.shaves)}cmx{str(self.cmx_slices)}NCE{str(self.NN_engines)}'
-                if (not Path(outblob_file).exists()):
-                    log.info(
-                        f'{PrintColors.RED.value}Compiling model2 for {str(self.shaves)} shaves, {str(self.cmx_slices)} cmx_slices and {str(self.NN_engines)} NN_engines{PrintColors.ENDC.value}')
-                    ret = depthai.download_blob((self.cnn_model2, shave_nr_opt, cmx_slices_opt, self.NN_engines, outblob_file))
-                    log.info(f'Blob download result {str(ret)}')
-                    if (ret != 0):
-                        log.warning(
-                            f'{PrintColors.WARNING.value}Model2 compile failed. Failing back to default.{PrintColors.ENDC.value}')
-                        self.default_blob = True
-                    else:
-                       self.blob_file2 = outblob_file
+                    self.blob_file2 = blob_file2
         if self.default_blob:
             self.shaves = 7
             self.cmx_slices = 7
@@ -277,13 +281,17 @@ class DepthAIConfig:
 
     def __config_recording_file(self):
         # Append video stream if video recording was requested and stream
-        # is not already specified
+        # is not already specified. The segments are written by video_recorder.VideoRecorder next to
+        # the requested file, here only check they can be.
         self.video_file = None
         if self.record_video:
-            # open video file
+            directory = Path(self.video).resolve().parent
             try:
-                video_file = open(self.video, 'wb')
+                directory.mkdir(parents=True, exist_ok=True)
+                if not os.access(directory, os.W_OK):
+                    raise PermissionError(f'{directory} is not writable')
+                self.video_file = self.video
                 self.add_video_stream()
-            except IOError:
-                log.error("Could open video file for writing. Disabled video output stream.")
+            except OSError as e:
+                log.error(f'Could not record video to {self.video}: {e}. Disabled video output stream.')
                 self.remove_video_stream()
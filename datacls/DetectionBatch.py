@@ -0,0 +1,218 @@
+from typing import List
+
+import numpy as np
+
+from adlinktech.datariver import IotValue, IotNvp, IotNvpSeq
+
+
+class DetectionBatch:
+    '''
+    The detection boxes of a frame kept as a struct-of-arrays (one NumPy array per field).
+
+    Appending boxes does not touch the Data River binding, the DepthDetectionBoxData IotNvpSeq is
+    only materialized once by dr_data when the batch is published. The class_label of a box is
+    looked up in labels by class_id unless it was explicitly set.
+    '''
+
+    NUMERIC_FIELDS = (('obj_id', np.int32), ('class_id', np.int32),
+                      ('x1', np.float32), ('y1', np.float32), ('x2', np.float32), ('y2', np.float32),
+                      ('probability', np.float32),
+                      ('dist_x', np.float64), ('dist_y', np.float64), ('dist_z', np.float64))
+    STRING_FIELDS = ('obj_label', 'class_label', 'meta')
+
+    def __init__(self, capacity: int = 16, labels: List[str] = None):
+        self.labels = labels
+        self.__size = 0
+        self.__columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in DetectionBatch.NUMERIC_FIELDS}
+        self.__strings = {name: [] for name in DetectionBatch.STRING_FIELDS}
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def __iter__(self):
+        for i in range(self.__size):
+            yield self.box(i)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.__columns['x1'])
+
+    def column(self, name: str) -> np.ndarray:
+        '''A view of the populated part of a numeric column.'''
+        return self.__columns[name][:self.__size]
+
+    def strings(self, name: str) -> List[str]:
+        return self.__strings[name][:self.__size]
+
+    def set_strings(self, name: str, values: List[str]) -> None:
+        '''Replace the values of a string field (obj_label, class_label or meta) of every box.'''
+        if len(values) != self.__size:
+            raise ValueError(f'Expected {self.__size} {name} values, got {len(values)}')
+        self.__strings[name] = list(values)
+
+    obj_id = property(lambda self: self.column('obj_id'))
+    class_id = property(lambda self: self.column('class_id'))
+    x1 = property(lambda self: self.column('x1'))
+    y1 = property(lambda self: self.column('y1'))
+    x2 = property(lambda self: self.column('x2'))
+    y2 = property(lambda self: self.column('y2'))
+    probability = property(lambda self: self.column('probability'))
+    dist_x = property(lambda self: self.column('dist_x'))
+    dist_y = property(lambda self: self.column('dist_y'))
+    dist_z = property(lambda self: self.column('dist_z'))
+
+    @property
+    def positions(self) -> np.ndarray:
+        '''The (dist_x, dist_y, dist_z) of every box as a (n, 3) array.'''
+        return np.stack((self.dist_x, self.dist_y, self.dist_z), axis=1)
+
+    def __reserve(self, size: int) -> None:
+        capacity = self.capacity
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        for name, column in self.__columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.__size] = column[:self.__size]
+            self.__columns[name] = grown
+
+    def clear(self) -> None:
+        '''Remove all the boxes, keeping the allocated arrays for reuse.'''
+        self.__size = 0
+        for values in self.__strings.values():
+            values.clear()
+
+    def append(self, obj_id=0, obj_label='', class_id=0, class_label=None, x1=0.0, y1=0.0, x2=0.0, y2=0.0,
+               probability=0.0, meta='', dist_x=0.0, dist_y=0.0, dist_z=0.0) -> None:
+        i = self.__size
+        self.__reserve(i + 1)
+        columns = self.__columns
+        columns['obj_id'][i] = obj_id
+        columns['class_id'][i] = class_id
+        columns['x1'][i] = x1
+        columns['y1'][i] = y1
+        columns['x2'][i] = x2
+        columns['y2'][i] = y2
+        columns['probability'][i] = probability
+        columns['dist_x'][i] = dist_x
+        columns['dist_y'][i] = dist_y
+        columns['dist_z'][i] = dist_z
+        self.__strings['obj_label'].append(obj_label if obj_label is not None else '')
+        self.__strings['class_label'].append(class_label)
+        self.__strings['meta'].append(meta if meta is not None else '')
+        self.__size = i + 1
+
+    def append_box(self, box) -> None:
+        '''Append a PyDetectionBoxData (or PyDepthDetectionBoxData) to the batch.'''
+        self.append(box.obj_id, box.obj_label, box.class_id, box.class_label, box.x1, box.y1, box.x2, box.y2,
+                    box.probability, box.meta,
+                    getattr(box, 'dist_x', 0.0), getattr(box, 'dist_y', 0.0), getattr(box, 'dist_z', 0.0))
+
+    def extend(self, count: int, **columns) -> None:
+        '''
+        Append count boxes at once, the keyword arguments are arrays (or scalars) for the numeric fields
+        and lists for the string fields. Missing fields are filled with their defaults.
+        '''
+        if count <= 0:
+            return
+        start = self.__size
+        self.__reserve(start + count)
+        for name, column in self.__columns.items():
+            column[start:start + count] = columns.get(name, 0)
+        for name, values in self.__strings.items():
+            default = None if name == 'class_label' else ''
+            values.extend(columns.get(name, [default] * count))
+        self.__size = start + count
+
+    def select(self, index) -> 'DetectionBatch':
+        '''A new batch with the boxes selected by a boolean mask or index array.'''
+        index = np.arange(self.__size)[index]
+        batch = DetectionBatch(max(len(index), 1), self.labels)
+        columns = {name: self.column(name)[index] for name in self.__columns}
+        for name in self.__strings:
+            values = self.__strings[name]
+            columns[name] = [values[i] for i in index.tolist()]
+        batch.extend(len(index), **columns)
+        return batch
+
+    def __label_for(self, class_id: int) -> str:
+        labels = self.labels or []
+        return labels[class_id] if 0 <= class_id < len(labels) else ''
+
+    def class_labels(self) -> List[str]:
+        class_ids = self.column('class_id').tolist()
+        return [label if label is not None else self.__label_for(c)
+                for label, c in zip(self.__strings['class_label'], class_ids)]
+
+    def box(self, i: int):
+        '''The i-th box as a PyDepthDetectionBoxData.'''
+        from .PyDetectionBox import PyDepthDetectionBoxData
+
+        if not 0 <= i < self.__size:
+            raise IndexError(f'Box {i} out of range for a batch of {self.__size}')
+        columns = self.__columns
+        class_id = int(columns['class_id'][i])
+        class_label = self.__strings['class_label'][i]
+        return PyDepthDetectionBoxData(int(columns['obj_id'][i]), self.__strings['obj_label'][i], class_id,
+                                       class_label if class_label is not None else self.__label_for(class_id),
+                                       float(columns['x1'][i]), float(columns['y1'][i]),
+                                       float(columns['x2'][i]), float(columns['y2'][i]),
+                                       float(columns['probability'][i]), self.__strings['meta'][i],
+                                       float(columns['dist_x'][i]), float(columns['dist_y'][i]),
+                                       float(columns['dist_z'][i]))
+
+    @property
+    def dr_data(self) -> IotNvpSeq:
+        '''
+        Materialize the DepthDetectionBoxData sequence. A single scratch IotValue per field is reused
+        for every box as IotNvp copies the value it is given.
+        '''
+        n = self.__size
+        data = IotNvpSeq()
+        if n == 0:
+            return data
+        obj_id, obj_label, class_id, class_label = IotValue(), IotValue(), IotValue(), IotValue()
+        x1, y1, x2, y2 = IotValue(), IotValue(), IotValue(), IotValue()
+        probability, meta = IotValue(), IotValue()
+        dist_x, dist_y, dist_z = IotValue(), IotValue(), IotValue()
+        box_value = IotValue()
+
+        columns = {name: self.column(name).tolist() for name in self.__columns}
+        class_labels = self.class_labels()
+        obj_labels = self.__strings['obj_label']
+        metas = self.__strings['meta']
+        for i in range(n):
+            obj_id.int32 = columns['obj_id'][i]
+            obj_label.string = obj_labels[i]
+            class_id.int32 = columns['class_id'][i]
+            class_label.string = class_labels[i]
+            x1.float32 = columns['x1'][i]
+            y1.float32 = columns['y1'][i]
+            x2.float32 = columns['x2'][i]
+            y2.float32 = columns['y2'][i]
+            probability.float32 = columns['probability'][i]
+            meta.string = metas[i]
+            dist_x.float64 = columns['dist_x'][i]
+            dist_y.float64 = columns['dist_y'][i]
+            dist_z.float64 = columns['dist_z'][i]
+
+            box = IotNvpSeq()
+            box.append(IotNvp('obj_id', obj_id))
+            box.append(IotNvp('obj_label', obj_label))
+            box.append(IotNvp('class_id', class_id))
+            box.append(IotNvp('class_label', class_label))
+            box.append(IotNvp('x1', x1))
+            box.append(IotNvp('y1', y1))
+            box.append(IotNvp('x2', x2))
+            box.append(IotNvp('y2', y2))
+            box.append(IotNvp('probability', probability))
+            box.append(IotNvp('meta', meta))
+            box.append(IotNvp('dist_x', dist_x))
+            box.append(IotNvp('dist_y', dist_y))
+            box.append(IotNvp('dist_z', dist_z))
+
+            box_value.nvp_seq = box
+            it = IotNvp()
+            it.value = box_value
+            data.push_back(it)
+        return data
@@ -1,5 +1,7 @@
 from adlinktech.datariver import IotValue, IotNvp, IotNvpSeq, IotByteSeq_from_buffer
 
+from .DetectionBatch import DetectionBatch
+
 class PyDetectionBoxData:
     def __init__(self, obj_id = 0, obj_label = '', class_id = 0, class_label = '', x1 = 0.0, y1 = 0.0, x2 = 0.0, y2 = 0.0, probability = 0.0, meta = ''):
         self.__obj_id = IotValue()
@@ -220,6 +222,11 @@ class PyDetectionBox:
                 obj_id, obj_label, class_id, class_label, x1, y1, x2, y2, probability, meta):
         self.add_data(PyDetectionBoxData(obj_id, obj_label, class_id, class_label, x1, y1, x2, y2, probability, meta))
 
+    @property
+    def data(self) -> IotNvpSeq:
+        '''The sequence of detection box data'''
+        return self.__data
+
     @property
     def dr_data(self) -> IotNvpSeq:
         data = IotNvpSeq()
@@ -227,16 +234,39 @@ class PyDetectionBox:
         data.append(IotNvp('stream_id', self.__stream_id))
         data.append(IotNvp('frame_id', self.__frame_id))
         dbox_value = IotValue()
-        dbox_value.nvp_seq = self.__data
+        dbox_value.nvp_seq = self.data
         data.append(IotNvp('data', dbox_value))
         return data
 
 
 class PyDepthDetectionBox(PyDetectionBox):
+    '''
+    The boxes are kept in a DetectionBatch, the DepthDetectionBoxData sequence is only built when
+    the sample is published (dr_data).
+    '''
+
+    def __init__(self, engine_id='', stream_id='', frame_id=0, batch: DetectionBatch = None):
+        super().__init__(engine_id, stream_id, frame_id)
+        self.__batch = batch if batch is not None else DetectionBatch()
+
+    @property
+    def batch(self) -> DetectionBatch:
+        return self.__batch
+
+    @batch.setter
+    def batch(self, value: DetectionBatch):
+        self.__batch = value
+
+    def add_data(self, value: PyDetectionBoxData):
+        self.__batch.append_box(value)
 
     def add_box(self,
                 obj_id, obj_label, class_id, class_label, x1, y1, x2, y2, probability, meta,
                 dist_x, dist_y, dist_z):
-        self.add_data(PyDepthDetectionBoxData(obj_id, obj_label, class_id, class_label, x1, y1, x2, y2,
-                                              probability, meta, dist_x, dist_y, dist_z))
+        self.__batch.append(obj_id, obj_label, class_id, class_label, x1, y1, x2, y2,
+                            probability, meta, dist_x, dist_y, dist_z)
+
+    @property
+    def data(self) -> IotNvpSeq:
+        return self.__batch.dr_data
 
@@ -0,0 +1,77 @@
+from adlinktech.datariver import IotValue, IotNvp, IotNvpSeq
+
+from .PyDetectionBox import PyDepthDetectionBox
+
+
+class PyDepthDetectionBoxBatch:
+    '''
+    The DepthDetectionBoxBatch tag group; the DepthDetectionBox results of several consecutive frames
+    of one stream, each with its frame_id and capture timestamp, written as a single sample.
+    '''
+
+    def __init__(self, engine_id = '', stream_id = ''):
+        self.__engine_id = IotValue()
+        self.__stream_id = IotValue()
+        self.__frames = []
+
+        self.engine_id = engine_id
+        self.stream_id = stream_id
+
+    @property
+    def engine_id(self):
+        return self.__engine_id.string
+
+    @engine_id.setter
+    def engine_id(self, value):
+        self.__engine_id.string = value
+
+    @property
+    def stream_id(self):
+        return self.__stream_id.string
+
+    @stream_id.setter
+    def stream_id(self, value):
+        self.__stream_id.string = value
+
+    @property
+    def frames(self) -> list:
+        '''The (timestamp, PyDepthDetectionBox) of every frame in the batch, oldest first'''
+        return list(self.__frames)
+
+    def __len__(self) -> int:
+        return len(self.__frames)
+
+    def add_frame(self, boxes: PyDepthDetectionBox, timestamp: float) -> None:
+        self.__frames.append((float(timestamp), boxes))
+
+    def clear(self) -> None:
+        self.__frames = []
+
+    @property
+    def dr_data(self) -> IotNvpSeq:
+        frames = IotNvpSeq()
+        frame_id, timestamp, boxes_value, frame_value = IotValue(), IotValue(), IotValue(), IotValue()
+        for frame_timestamp, boxes in self.__frames:
+            frame_id.uint32 = boxes.frame_id
+            timestamp.float64 = frame_timestamp
+            boxes_value.nvp_seq = boxes.data
+            frame = IotNvpSeq()
+            frame.append(IotNvp('frame_id', frame_id))
+            frame.append(IotNvp('timestamp', timestamp))
+            frame.append(IotNvp('data', boxes_value))
+            frame_value.nvp_seq = frame
+            it = IotNvp()
+            it.value = frame_value
+            frames.push_back(it)
+
+        frame_count = IotValue()
+        frame_count.uint32 = len(self.__frames)
+        frames_value = IotValue()
+        frames_value.nvp_seq = frames
+
+        data = IotNvpSeq()
+        data.append(IotNvp('engine_id', self.__engine_id))
+        data.append(IotNvp('stream_id', self.__stream_id))
+        data.append(IotNvp('frame_count', frame_count))
+        data.append(IotNvp('frames', frames_value))
+        return data
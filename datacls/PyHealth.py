@@ -0,0 +1,30 @@
+from adlinktech.datariver import IotValue, IotNvp, IotNvpSeq
+
+
+class PyHealth:
+    '''
+    The Health tag group; the throughput, latency and device health of a pipeline, written
+    periodically. Every field is an attribute named as its tag, FIELDS gives the IotValue kind.
+    '''
+
+    FIELDS = (('engine_id', 'string'), ('stream_id', 'string'), ('uptime', 'float64'), ('fps', 'float64'),
+              ('frames', 'uint64'), ('empty_polls', 'uint64'), ('dropped', 'uint64'),
+              ('publish_failures', 'uint64'), ('queue_depth', 'uint32'), ('poll_p99', 'float64'),
+              ('publish_p99', 'float64'), ('temperature', 'float64'))
+    DEFAULTS = {'string': '', 'float64': 0.0, 'uint64': 0, 'uint32': 0}
+
+    def __init__(self, engine_id = '', stream_id = '', **values):
+        self.engine_id = engine_id
+        self.stream_id = stream_id
+        for name, kind in PyHealth.FIELDS[2:]:
+            setattr(self, name, values.get(name, PyHealth.DEFAULTS[kind]))
+
+    @property
+    def dr_data(self) -> IotNvpSeq:
+        data = IotNvpSeq()
+        value = IotValue()
+        for name, kind in PyHealth.FIELDS:
+            field = getattr(self, name)
+            setattr(value, kind, field if kind == 'string' else (float(field) if kind == 'float64' else int(field)))
+            data.append(IotNvp(name, value))
+        return data
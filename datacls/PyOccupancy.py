@@ -0,0 +1,125 @@
+import numpy as np
+
+from adlinktech.datariver import IotValue, IotNvp, IotNvpSeq
+
+
+class PyOccupancy:
+    '''
+    The Occupancy tag group; the people count of a frame, the smallest distance between two people
+    and the pairs of people closer than the distancing threshold. The pairs refer to the index of
+    the boxes in the DetectionBoxData sample with the same frame_id.
+    '''
+
+    def __init__(self, engine_id = '', stream_id = '', frame_id = 0, count = 0, min_distance = -1.0,
+                 distance_threshold = 0.0):
+        self.__engine_id = IotValue()
+        self.__stream_id = IotValue()
+        self.__frame_id = IotValue()
+        self.__count = IotValue()
+        self.__min_distance = IotValue()
+        self.__distance_threshold = IotValue()
+        self.__violations = []
+
+        self.engine_id = engine_id
+        self.stream_id = stream_id
+        self.frame_id = frame_id
+        self.count = count
+        self.min_distance = min_distance
+        self.distance_threshold = distance_threshold
+
+    @classmethod
+    def from_result(cls, result, engine_id: str, stream_id: str, frame_id: int) -> 'PyOccupancy':
+        '''Build the sample from an analytics.occupancy.OccupancyResult'''
+        occupancy = cls(engine_id, stream_id, frame_id, result.count, result.min_distance, result.distance_threshold)
+        for (a, b), distance in zip(result.violations.tolist(), np.asarray(result.violation_distances).tolist()):
+            occupancy.add_violation(a, b, distance)
+        return occupancy
+
+    @property
+    def engine_id(self):
+        return self.__engine_id.string
+
+    @engine_id.setter
+    def engine_id(self, value):
+        self.__engine_id.string = value
+
+    @property
+    def stream_id(self):
+        return self.__stream_id.string
+
+    @stream_id.setter
+    def stream_id(self, value):
+        self.__stream_id.string = value
+
+    @property
+    def frame_id(self):
+        return self.__frame_id.uint32
+
+    @frame_id.setter
+    def frame_id(self, value):
+        self.__frame_id.uint32 = value
+
+    @property
+    def count(self):
+        return self.__count.uint32
+
+    @count.setter
+    def count(self, value):
+        self.__count.uint32 = int(value)
+
+    @property
+    def min_distance(self):
+        return self.__min_distance.float64
+
+    @min_distance.setter
+    def min_distance(self, value):
+        self.__min_distance.float64 = float(value)
+
+    @property
+    def distance_threshold(self):
+        return self.__distance_threshold.float64
+
+    @distance_threshold.setter
+    def distance_threshold(self, value):
+        self.__distance_threshold.float64 = float(value)
+
+    @property
+    def violations(self) -> list:
+        '''The (a, b, distance) of every violating pair'''
+        return list(self.__violations)
+
+    def add_violation(self, a: int, b: int, distance: float) -> None:
+        self.__violations.append((int(a), int(b), float(distance)))
+
+    @property
+    def dr_data(self) -> IotNvpSeq:
+        violations = IotNvpSeq()
+        a_value, b_value, distance_value, pair_value = IotValue(), IotValue(), IotValue(), IotValue()
+        for a, b, distance in self.__violations:
+            a_value.int32 = a
+            b_value.int32 = b
+            distance_value.float64 = distance
+            pair = IotNvpSeq()
+            pair.append(IotNvp('a', a_value))
+            pair.append(IotNvp('b', b_value))
+            pair.append(IotNvp('distance', distance_value))
+            pair_value.nvp_seq = pair
+            it = IotNvp()
+            it.value = pair_value
+            violations.push_back(it)
+
+        violation_count = IotValue()
+        violation_count.uint32 = len(self.__violations)
+        violations_value = IotValue()
+        violations_value.nvp_seq = violations
+
+        data = IotNvpSeq()
+        data.append(IotNvp('engine_id', self.__engine_id))
+        data.append(IotNvp('stream_id', self.__stream_id))
+        data.append(IotNvp('frame_id', self.__frame_id))
+        data.append(IotNvp('count', self.__count))
+        data.append(IotNvp('min_distance', self.__min_distance))
+        data.append(IotNvp('distance_threshold', self.__distance_threshold))
+        data.append(IotNvp('violation_count', violation_count))
+        data.append(IotNvp('violations', violations_value))
+        return data
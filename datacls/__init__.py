@@ -1 +1,3 @@
-from .PyDetectionBox import PyDetectionBox, PyDepthDetectionBox, PyDepthDetectionBoxData
\ No newline at end of file
+from .PyDetectionBox import PyDetectionBox, PyDepthDetectionBox, PyDepthDetectionBoxData
+from .DetectionBatch import DetectionBatch
+from .PyOccupancy import PyOccupancy
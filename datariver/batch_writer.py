@@ -0,0 +1,142 @@
+import logging as log
+import threading
+import time
+
+from datacls import PyDepthDetectionBox
+from datacls.PyDetectionBoxBatch import PyDepthDetectionBoxBatch
+from datariver.utils import write_tag
+from metrics import registry
+
+PUBLISH_FAILURES = registry.counter('depthai_publish_failures_total', 'Frames whose publishing failed', ('stream',))
+
+
+class BatchWriter:
+    '''
+    Collects the PyDepthDetectionBox results of consecutive frames and writes them to a Thing as a
+    single DepthDetectionBoxBatch sample, trading a little latency for far fewer Data River writes.
+
+    - max_frames: the batch is written as soon as it holds this many frames
+    - window: the batch is written at the latest this many seconds after its first frame was added,
+      even when no more frames arrive
+    - latency_cap: a frame added as urgent (e.g. one with a distancing violation) is written at the
+      latest this many seconds after it was added, 0 writes it straight away. None treats urgent
+      frames like any other.
+
+    A batch only holds the frames of one stream; a frame of another stream writes the pending batch
+    first. add() and the window timer may write from different threads, the writes are serialized.
+    A batch the timer fails to write is logged, counted in depthai_publish_failures_total and dropped;
+    add() raises the errors of the writes it makes.
+    '''
+
+    def __init__(self, thing, max_frames: int = 10, window: float = 0.1, latency_cap: float = 0.0,
+                 output: str = 'DetectionBoxBatch', flow: str = None):
+        if max_frames < 1:
+            raise ValueError('BatchWriter max_frames must be at least 1')
+        self.__thing = thing
+        self.max_frames = max_frames
+        self.window = window
+        self.latency_cap = latency_cap
+        self.__output = output
+        self.__flow = flow
+        self.__batch = None
+        self.__deadline = None
+        self.__urgent = False
+        self.__closed = False
+        self.__writes = 0
+        self.__frames = 0
+        self.__failed = 0
+        self.__flushes = {'full': 0, 'window': 0, 'urgent': 0, 'stream': 0, 'flush': 0, 'close': 0}
+        self.__lock = threading.Condition()
+        self.__timer = threading.Thread(target=self.__run_timer, name='batch-writer', daemon=True)
+        self.__timer.start()
+
+    @property
+    def stats(self) -> dict:
+        '''Number of writes and frames written, and why the batches were written'''
+        with self.__lock:
+            return {
+                'writes': self.__writes,
+                'frames': self.__frames,
+                'frames_per_write': round(self.__frames / self.__writes, 2) if self.__writes else None,
+                'failed_frames': self.__failed,
+                'pending': len(self.__batch) if self.__batch is not None else 0,
+                'flushes': dict(self.__flushes),
+            }
+
+    def __write(self, reason: str) -> int:
+        batch, self.__batch, self.__deadline = self.__batch, None, None
+        if batch is None or len(batch) == 0:
+            return 0
+        write_tag(self.__thing, self.__output, batch.dr_data, self.__flow)
+        self.__writes += 1
+        self.__frames += len(batch)
+        self.__flushes[reason] += 1
+        return len(batch)
+
+    def __run_timer(self) -> None:
+        with self.__lock:
+            while not self.__closed:
+                if self.__deadline is None:
+                    self.__lock.wait()
+                    continue
+                remaining = self.__deadline - time.monotonic()
+                if remaining > 0:
+                    self.__lock.wait(remaining)
+                    continue
+                batch = self.__batch
+                try:
+                    self.__write('urgent' if self.__urgent else 'window')
+                except Exception:
+                    log.exception(f'Writing a batch of {len(batch)} frames of {batch.stream_id} failed')
+                    PUBLISH_FAILURES.labels(stream=batch.stream_id).inc(len(batch))
+                    self.__failed += len(batch)
+
+    def add(self, boxes: PyDepthDetectionBox, timestamp: float = None, urgent: bool = False) -> int:
+        '''
+        Add the results of a frame, captured at timestamp (seconds since the epoch, defaults to now).
+        Returns the number of frames written by this call.
+        '''
+        timestamp = time.time() if timestamp is None else timestamp
+        now = time.monotonic()
+        written = 0
+        with self.__lock:
+            if self.__closed:
+                raise RuntimeError('BatchWriter is closed')
+            if self.__batch is not None and (self.__batch.engine_id != boxes.engine_id
+                                             or self.__batch.stream_id != boxes.stream_id):
+                written += self.__write('stream')
+            deadline = self.__deadline
+            if self.__batch is None:
+                self.__batch = PyDepthDetectionBoxBatch(boxes.engine_id, boxes.stream_id)
+                deadline = now + self.window if self.window is not None else None
+                self.__urgent = False
+            self.__batch.add_frame(boxes, timestamp)
+
+            if urgent and self.latency_cap is not None:
+                if self.latency_cap <= 0:
+                    return written + self.__write('urgent')
+                if deadline is None or now + self.latency_cap < deadline:
+                    deadline = now + self.latency_cap
+                    self.__urgent = True
+            if len(self.__batch) >= self.max_frames:
+                return written + self.__write('full')
+            # The timer only needs waking when the pending batch got an earlier deadline.
+            if deadline != self.__deadline:
+                self.__deadline = deadline
+                self.__lock.notify()
+        return written
+
+    def flush(self) -> int:
+        '''Write the pending batch now, returns the number of frames written.'''
+        with self.__lock:
+            return self.__write('flush')
+
+    def close(self) -> None:
+        '''Write the pending batch and stop the window timer.'''
+        with self.__lock:
+            if self.__closed:
+                return
+            self.__write('close')
+            self.__closed = True
+            self.__lock.notify()
+        self.__timer.join(timeout=1.0)
@@ -0,0 +1,93 @@
+import logging as log
+import math
+import threading
+import time
+
+from datacls.PyHealth import PyHealth
+from datariver.utils import write_tag
+from metrics import MetricsRegistry
+
+
+class HealthReporter:
+    '''
+    Writes a Health sample for a stream to a Thing every interval seconds, from the metrics the
+    capture and publish stages keep in the registry. The FPS and latency percentiles cover the
+    interval since the previous sample.
+    '''
+
+    def __init__(self, thing, registry: MetricsRegistry, engine_id: str, stream_id: str, interval: float = 10.0,
+                 output: str = 'Health'):
+        self.__thing = thing
+        self.__registry = registry
+        self.__engine_id = engine_id
+        self.__stream_id = stream_id
+        self.__interval = interval
+        self.__output = output
+        self.__started = time.monotonic()
+        self.__last_time = self.__started
+        self.__last_frames = 0.0
+        self.__last_poll = None
+        self.__last_wait = None
+        self.__last_publish = None
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, name='health-reporter', daemon=True)
+        self.__thread.start()
+
+    def __series(self, name: str, **labels):
+        family = self.__registry.get(name)
+        if family is None:
+            return None
+        return family.series.get(tuple(str(labels[n]) for n in family.label_names))
+
+    def __value(self, name: str, **labels) -> float:
+        series = self.__series(name, **labels)
+        value = series.value if series is not None else 0.0
+        return value if not math.isnan(value) else 0.0
+
+    def __p99(self, name: str, since, **labels):
+        '''The p99 of a histogram since the snapshot since, and its current snapshot.'''
+        series = self.__series(name, **labels)
+        if series is None:
+            return -1.0, None
+        p99 = series.quantile(0.99, since)
+        return (p99 if not math.isnan(p99) else -1.0), series.snapshot()
+
+    def sample(self) -> PyHealth:
+        '''The Health sample for the interval since the previous one.'''
+        now = time.monotonic()
+        stream = self.__stream_id
+        frames = self.__value('depthai_frames_total', stream=stream)
+        fps = (frames - self.__last_frames) / (now - self.__last_time) if now > self.__last_time else 0.0
+        self.__last_time, self.__last_frames = now, frames
+        poll_p99, self.__last_poll = self.__p99('depthai_stage_seconds', self.__last_poll, stream=stream, stage='poll')
+        wait_p99, self.__last_wait = self.__p99('depthai_stage_seconds', self.__last_wait, stream=stream, stage='wait')
+        # With the blocking acquisition the polls are observed as waits for the packets.
+        if poll_p99 < 0:
+            poll_p99 = wait_p99
+        publish_p99, self.__last_publish = self.__p99('depthai_stage_seconds', self.__last_publish,
+                                                      stream=stream, stage='publish')
+        temperatures = self.__registry.get('depthai_device_temperature_celsius')
+        temperature = max((t.value for key, t in temperatures.series.items() if key[0] == stream), default=-1.0) \
+            if temperatures is not None else -1.0
+        return PyHealth(self.__engine_id, stream,
+                        uptime=now - self.__started,
+                        fps=fps,
+                        frames=frames,
+                        empty_polls=self.__value('depthai_empty_polls_total', stream=stream),
+                        dropped=self.__value('depthai_publish_queue_dropped_total', stream=stream),
+                        publish_failures=self.__value('depthai_publish_failures_total', stream=stream),
+                        queue_depth=self.__value('depthai_publish_queue_depth', stream=stream),
+                        poll_p99=poll_p99,
+                        publish_p99=publish_p99,
+                        temperature=temperature)
+
+    def __run(self) -> None:
+        while not self.__stop.wait(self.__interval):
+            try:
+                write_tag(self.__thing, self.__output, self.sample().dr_data)
+            except Exception:
+                log.exception('Writing the Health sample failed')
+
+    def close(self) -> None:
+        self.__stop.set()
+        self.__thread.join(timeout=1.0)
@@ -0,0 +1,86 @@
+import time
+
+import numpy as np
+
+
+class PublishPolicy:
+    '''
+    Decides whether a frame's detections should be written to the Data River.
+
+    - max_rate: at most this many samples per second are published (None for no limit)
+    - heartbeat: a sample is always published when none was for this many seconds (None for never)
+    - position_tolerance / box_tolerance: a sample is suppressed when it has the same boxes, of the same
+      classes, as the last published one and none of them moved more than position_tolerance metres
+      (dist_x/y/z) or box_tolerance (x1/y1/x2/y2, fraction of the frame). None disables the delta check.
+
+    Boxes are matched by obj_id when every box has a distinct non-zero id, otherwise by their order
+    when sorted by class and position.
+    '''
+
+    def __init__(self, max_rate: float = None, heartbeat: float = 1.0, position_tolerance: float = 0.05,
+                 box_tolerance: float = 0.01):
+        self.max_rate = max_rate
+        self.heartbeat = heartbeat
+        self.position_tolerance = position_tolerance
+        self.box_tolerance = box_tolerance
+        self.__last_time = None
+        self.__last = None
+        self.__published = 0
+        self.__suppressed_rate = 0
+        self.__suppressed_unchanged = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'published': self.__published,
+            'suppressed_rate': self.__suppressed_rate,
+            'suppressed_unchanged': self.__suppressed_unchanged,
+            'suppressed': self.__suppressed_rate + self.__suppressed_unchanged,
+        }
+
+    @staticmethod
+    def __snapshot(batch) -> tuple:
+        boxes = np.column_stack((batch.x1, batch.y1, batch.x2, batch.y2))
+        positions = batch.positions
+        class_ids = batch.class_id.copy()
+        obj_ids = batch.obj_id
+        if len(obj_ids) > 0 and np.all(obj_ids != 0) and len(np.unique(obj_ids)) == len(obj_ids):
+            order = np.argsort(obj_ids, kind='stable')
+            keys = obj_ids[order]
+        else:
+            order = np.lexsort((boxes[:, 1], boxes[:, 0], class_ids))
+            keys = class_ids[order]
+        return keys, class_ids[order], boxes[order], positions[order]
+
+    def __unchanged(self, snapshot: tuple) -> bool:
+        if self.__last is None or self.position_tolerance is None or self.box_tolerance is None:
+            return False
+        keys, class_ids, boxes, positions = snapshot
+        last_keys, last_class_ids, last_boxes, last_positions = self.__last
+        if len(keys) != len(last_keys) or not np.array_equal(keys, last_keys) \
+                or not np.array_equal(class_ids, last_class_ids):
+            return False
+        if len(keys) == 0:
+            return True
+        moved = np.linalg.norm(positions - last_positions, axis=1)
+        return bool(np.all(moved <= self.position_tolerance)
+                    and np.all(np.abs(boxes - last_boxes) <= self.box_tolerance))
+
+    def should_publish(self, batch, now: float = None) -> bool:
+        '''Whether the DetectionBatch of a frame should be published, updates the policy state if so.'''
+        now = time.monotonic() if now is None else now
+        since_last = None if self.__last_time is None else now - self.__last_time
+        if since_last is not None and self.max_rate and since_last < 1.0 / self.max_rate:
+            self.__suppressed_rate += 1
+            return False
+
+        snapshot = PublishPolicy.__snapshot(batch)
+        heartbeat_due = since_last is None or (self.heartbeat is not None and since_last >= self.heartbeat)
+        if not heartbeat_due and self.__unchanged(snapshot):
+            self.__suppressed_unchanged += 1
+            return False
+
+        self.__last = snapshot
+        self.__last_time = now
+        self.__published += 1
+        return True
@@ -0,0 +1,141 @@
+import logging as log
+import threading
+import time
+
+from analytics.occupancy import OccupancyEngine
+from datacls import PyDepthDetectionBox, PyOccupancy
+from datariver.batch_writer import BatchWriter
+from datariver.publish_policy import PublishPolicy
+from datariver.utils import write_tag
+from metrics import registry
+
+PUBLISH_FAILURES = registry.counter('depthai_publish_failures_total', 'Frames whose publishing failed', ('stream',))
+JOURNAL_FAILURES = registry.counter('depthai_journal_failures_total', 'Frames the detection journal failed to write',
+                                    ('stream',))
+STAGE_SECONDS = registry.histogram('depthai_stage_seconds', 'Seconds spent per frame in each stage', ('stream', 'stage'))
+
+
+class Publisher:
+    '''
+    Writes the detections of a frame, and the occupancy analysis of them, to a Thing when the
+    publish policy allows it. With batching enabled the detections of consecutive frames are written
+    together as DetectionBoxBatch samples, a frame with a distancing violation is written within the
+    latency cap. With a journal the detections of every frame are appended to it first, whether the
+    publish policy lets them through or not.
+
+    A frame that fails to publish is logged and counted in depthai_publish_failures_total rather than
+    raised, so one failed write does not stop the pipeline.
+
+    The occupancy, publish_policy and batching settings can be changed while publishing with
+    reconfigure(), the components whose settings changed are replaced before the next frame.
+    '''
+
+    SECTIONS = ('occupancy', 'publish_policy', 'batching')
+
+    def __init__(self, thing, app_config : dict, journal : 'DetectionJournal' = None):
+        self.__thing = thing
+        self.__journal = journal
+        self.__occupancy = None
+        self.__publish_policy = None
+        self.__batch_writer = None
+        self.__settings = {}
+        self.__pending = None
+        self.__pending_lock = threading.Lock()
+        self.__configure(app_config)
+
+    def __configure(self, app_config : dict) -> None:
+        changed = [section for section in Publisher.SECTIONS if app_config[section] != self.__settings.get(section)]
+        if 'occupancy' in changed:
+            occupancy_config = app_config['occupancy']
+            self.__occupancy = None
+            if occupancy_config['enabled']:
+                self.__occupancy = OccupancyEngine(float(occupancy_config['distance_threshold']),
+                                                   occupancy_config['class_label'],
+                                                   occupancy_config['grid_above'])
+        if 'publish_policy' in changed:
+            policy_config = app_config['publish_policy']
+            self.__publish_policy = None
+            if policy_config['enabled']:
+                self.__publish_policy = PublishPolicy(policy_config['max_rate'], policy_config['heartbeat'],
+                                                      policy_config['position_tolerance'],
+                                                      policy_config['box_tolerance'])
+        if 'batching' in changed:
+            batching_config = app_config['batching']
+            if self.__batch_writer is not None:
+                self.__batch_writer.close()
+            self.__batch_writer = None
+            if batching_config['enabled']:
+                latency_cap = batching_config['latency_cap_ms']
+                self.__batch_writer = BatchWriter(self.__thing, int(batching_config['max_frames']),
+                                                  float(batching_config['window_ms']) / 1000.0,
+                                                  float(latency_cap) / 1000.0 if latency_cap is not None else None)
+        self.__settings = {section: dict(app_config[section]) for section in Publisher.SECTIONS}
+
+    def reconfigure(self, app_config : dict) -> None:
+        '''Apply the occupancy, publish_policy and batching settings of app_config before the next frame.'''
+        with self.__pending_lock:
+            self.__pending = app_config
+
+    @property
+    def stats(self) -> dict:
+        '''Published and suppressed sample counters of the publish policy'''
+        return self.__publish_policy.stats if self.__publish_policy is not None else {}
+
+    @property
+    def batch_stats(self) -> dict:
+        '''Write counters of the batch writer'''
+        return self.__batch_writer.stats if self.__batch_writer is not None else {}
+
+    def publish(self, boxes : PyDepthDetectionBox, timestamp : float = None) -> bool:
+        '''
+        Publish the detections of a frame captured at timestamp (seconds since the epoch, defaults to
+        now), returns whether they were written.
+        '''
+        if self.__pending is not None:
+            with self.__pending_lock:
+                app_config, self.__pending = self.__pending, None
+            self.__configure(app_config)
+        if self.__journal is not None:
+            self.__append_journal(boxes, timestamp)
+        started = time.perf_counter()
+        try:
+            published = self.__publish(boxes, timestamp)
+        except Exception:
+            PUBLISH_FAILURES.labels(stream=boxes.stream_id).inc()
+            log.exception(f'Publishing frame {boxes.frame_id} of {boxes.stream_id} failed')
+            return False
+        STAGE_SECONDS.labels(stream=boxes.stream_id, stage='publish').observe(time.perf_counter() - started)
+        return published
+
+    def __append_journal(self, boxes : PyDepthDetectionBox, timestamp : float) -> None:
+        started = time.perf_counter()
+        try:
+            self.__journal.append(boxes, timestamp)
+        except Exception:
+            JOURNAL_FAILURES.labels(stream=boxes.stream_id).inc()
+            log.exception(f'Journaling frame {boxes.frame_id} of {boxes.stream_id} failed')
+            return
+        STAGE_SECONDS.labels(stream=boxes.stream_id, stage='journal').observe(time.perf_counter() - started)
+
+    def __publish(self, boxes : PyDepthDetectionBox, timestamp : float) -> bool:
+        if self.__publish_policy is not None and not self.__publish_policy.should_publish(boxes.batch):
+            return False
+        occupancy = None
+        if self.__occupancy is not None:
+            result = self.__occupancy.analyze(boxes.batch)
+            occupancy = PyOccupancy.from_result(result, boxes.engine_id, boxes.stream_id, boxes.frame_id)
+        if self.__batch_writer is not None:
+            self.__batch_writer.add(boxes, timestamp, urgent=occupancy is not None and len(occupancy.violations) > 0)
+        else:
+            write_tag(self.__thing, 'DetectionBoxData', boxes.dr_data)
+        if occupancy is not None:
+            write_tag(self.__thing, 'Occupancy', occupancy.dr_data)
+        return True
+
+    def close(self) -> None:
+        '''Write any detections still waiting to be batched and close the journal.'''
+        if self.__batch_writer is not None:
+            self.__batch_writer.close()
+        if self.__journal is not None:
+            self.__journal.close()
+            log.info(f'Detection journal: {self.__journal.stats}')
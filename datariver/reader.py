@@ -0,0 +1,208 @@
+import math
+from operator import attrgetter
+from typing import List
+
+import numpy as np
+
+from adlinktech.datariver import FlowState
+
+from datacls import DetectionBatch
+
+# The IotValue accessor each DepthDetectionBoxData field is read with.
+_KINDS = {np.int32: 'int32', np.float32: 'float32', np.float64: 'float64'}
+BOX_FIELDS = tuple((name, _KINDS[dtype]) for name, dtype in DetectionBatch.NUMERIC_FIELDS) + \
+             tuple((name, 'string') for name in DetectionBatch.STRING_FIELDS)
+_BOX_NAMES = tuple(name for name, _ in BOX_FIELDS)
+
+FRAME_FIELDS = (('frame_id', np.uint32), ('timestamp', np.float64), ('stream', np.int32),
+                ('first_box', np.int64), ('box_count', np.int32))
+
+
+class DetectionBoxColumns:
+    '''
+    The DepthDetectionBoxData of many samples decoded into one NumPy array per field, plus a frame
+    table. Box i belongs to frame frame_index[i]; frame j holds the boxes first_box[j] to
+    first_box[j] + box_count[j] and came from the stream streams[stream[j]].
+
+    The arrays are owned by this object, none of them refer to the Data River samples. They are
+    preallocated and grow as needed; clear() keeps them for the next read.
+    '''
+
+    def __init__(self, capacity: int = 256, frame_capacity: int = 32):
+        self.__size = 0
+        self.__frames = 0
+        self.__columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in DetectionBatch.NUMERIC_FIELDS}
+        self.__columns.update({name: np.empty(capacity, dtype=object) for name in DetectionBatch.STRING_FIELDS})
+        self.__columns['frame_index'] = np.zeros(capacity, dtype=np.int32)
+        self.__frame_columns = {name: np.zeros(frame_capacity, dtype=dtype) for name, dtype in FRAME_FIELDS}
+        self.__streams = []
+        self.__stream_index = {}
+
+    def __len__(self) -> int:
+        return self.__size
+
+    @property
+    def frame_count(self) -> int:
+        return self.__frames
+
+    @property
+    def streams(self) -> List[tuple]:
+        '''The (engine_id, stream_id) of every stream seen, indexed by the stream column of the frames'''
+        return list(self.__streams)
+
+    def column(self, name: str) -> np.ndarray:
+        '''A view of the decoded part of a box column (a DepthDetectionBoxData field or frame_index).'''
+        return self.__columns[name][:self.__size]
+
+    def frame_column(self, name: str) -> np.ndarray:
+        '''A view of the decoded part of a frame column (frame_id, timestamp, stream, first_box, box_count).'''
+        return self.__frame_columns[name][:self.__frames]
+
+    def copy(self) -> 'DetectionBoxColumns':
+        '''A copy that is not affected by later reads into this object.'''
+        copy = DetectionBoxColumns(max(self.__size, 1), max(self.__frames, 1))
+        copy.__append_from(self)
+        return copy
+
+    def clear(self) -> None:
+        self.__size = 0
+        self.__frames = 0
+        self.__streams = []
+        self.__stream_index = {}
+
+    @staticmethod
+    def __grow(columns: dict, used: int, size: int) -> None:
+        capacity = len(next(iter(columns.values())))
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        for name, column in columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype) if column.dtype != object else \
+                np.empty(capacity, dtype=object)
+            grown[:used] = column[:used]
+            columns[name] = grown
+
+    def __stream(self, engine_id: str, stream_id: str) -> int:
+        key = (engine_id, stream_id)
+        index = self.__stream_index.get(key)
+        if index is None:
+            index = self.__stream_index[key] = len(self.__streams)
+            self.__streams.append(key)
+        return index
+
+    def add_frame(self, engine_id: str, stream_id: str, frame_id: int, timestamp: float, rows: list) -> None:
+        '''Append a frame and its boxes, rows holds one tuple of BOX_FIELDS values per box.'''
+        frame, start, count = self.__frames, self.__size, len(rows)
+        self.__grow(self.__frame_columns, frame, frame + 1)
+        frames = self.__frame_columns
+        frames['frame_id'][frame] = frame_id
+        frames['timestamp'][frame] = timestamp
+        frames['stream'][frame] = self.__stream(engine_id, stream_id)
+        frames['first_box'][frame] = start
+        frames['box_count'][frame] = count
+        self.__frames = frame + 1
+        if count == 0:
+            return
+        self.__grow(self.__columns, start, start + count)
+        end = start + count
+        for name, values in zip(_BOX_NAMES, zip(*rows)):
+            self.__columns[name][start:end] = values
+        self.__columns['frame_index'][start:end] = frame
+        self.__size = end
+
+    def __append_from(self, other: 'DetectionBoxColumns') -> None:
+        for j in range(other.frame_count):
+            first, count = int(other.frame_column('first_box')[j]), int(other.frame_column('box_count')[j])
+            rows = list(zip(*(other.column(name)[first:first + count].tolist() for name in _BOX_NAMES)))
+            engine_id, stream_id = other.streams[other.frame_column('stream')[j]]
+            self.add_frame(engine_id, stream_id, int(other.frame_column('frame_id')[j]),
+                           float(other.frame_column('timestamp')[j]), rows)
+
+
+def _skip(value) -> None:
+    return None
+
+
+def _sample_timestamp(sample) -> float:
+    '''The source timestamp of a sample in seconds since the epoch, NaN when the binding has none.'''
+    timestamp = getattr(sample, 'timestamp', None)
+    if timestamp is None:
+        return math.nan
+    if hasattr(timestamp, 'sec'):
+        return timestamp.sec + timestamp.nanosec * 1e-9
+    return float(timestamp)
+
+
+class DetectionBoxReader:
+    '''
+    Drains the DepthDetectionBox (or DepthDetectionBoxBatch) samples available on an input of a
+    Thing and decodes all their boxes in one pass into a DetectionBoxColumns.
+
+    The boxes are decoded positionally: the accessor of each field is worked out from the field
+    names of the first box of a sample, and only recomputed when a sample orders them differently.
+    The samples are read with read_iot_nvp rather than in a notify_data_available listener, and
+    every value is copied out of them, so the columns remain valid after the read.
+    '''
+
+    def __init__(self, thing, input_name: str = 'DetectionBoxData', capacity: int = 256):
+        self.__thing = thing
+        self.__input = input_name
+        self.__columns = DetectionBoxColumns(capacity)
+        self.__names = _BOX_NAMES
+        self.__getters = self.__accessors(self.__names)
+        self.__samples = 0
+
+    @property
+    def samples(self) -> int:
+        '''Number of samples decoded'''
+        return self.__samples
+
+    @staticmethod
+    def __accessors(names: tuple) -> tuple:
+        kinds = dict(BOX_FIELDS)
+        return tuple(attrgetter(kinds[name]) if name in kinds else _skip for name in names)
+
+    def __rows(self, boxes) -> list:
+        if len(boxes) == 0:
+            return []
+        names = tuple(nvp.name for nvp in boxes[0].value.nvp_seq)
+        if names != self.__names:
+            self.__names, self.__getters = names, self.__accessors(names)
+        getters = self.__getters
+        rows = [tuple(get(nvp.value) for get, nvp in zip(getters, box.value.nvp_seq)) for box in boxes]
+        if names == _BOX_NAMES:
+            return rows
+        # Fields missing from the samples (e.g. dist_* in plain DetectionBox samples) are left at 0 or ''.
+        order = [(names.index(name), None) if name in names else (None, '' if kind == 'string' else 0)
+                 for name, kind in BOX_FIELDS]
+        return [tuple(row[i] if i is not None else default for i, default in order) for row in rows]
+
+    def decode(self, samples, columns: DetectionBoxColumns = None) -> DetectionBoxColumns:
+        '''Decode samples into columns (by default the reader's own, cleared first).'''
+        if columns is None:
+            columns = self.__columns
+            columns.clear()
+        for sample in samples:
+            if getattr(sample, 'flow_state', FlowState.ALIVE) != FlowState.ALIVE:
+                continue
+            fields = {nvp.name: nvp.value for nvp in sample.data}
+            engine_id, stream_id = fields['engine_id'].string, fields['stream_id'].string
+            if 'frames' in fields:
+                for frame in fields['frames'].nvp_seq:
+                    frame_fields = {nvp.name: nvp.value for nvp in frame.value.nvp_seq}
+                    columns.add_frame(engine_id, stream_id, frame_fields['frame_id'].uint32,
+                                      frame_fields['timestamp'].float64,
+                                      self.__rows(frame_fields['data'].nvp_seq))
+            else:
+                columns.add_frame(engine_id, stream_id, fields['frame_id'].uint32, _sample_timestamp(sample),
+                                  self.__rows(fields['data'].nvp_seq))
+            self.__samples += 1
+        return columns
+
+    def read(self, timeout: int = 0, columns: DetectionBoxColumns = None) -> DetectionBoxColumns:
+        '''
+        Read every sample available on the input, waiting at most timeout milliseconds for one, and
+        decode them. Unless columns is given the result is overwritten by the next read, copy() it to
+        keep it.
+        '''
+        return self.decode(self.__thing.read_iot_nvp(self.__input, timeout), columns)
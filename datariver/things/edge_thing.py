@@ -67,6 +67,18 @@ class EdgeThing(object):
         '''Access to the underlying Data River object'''
         return self.__dr
 
+    def read(self, input_name: str, timeout: int = 0):
+        '''
+        All the samples available on an input, waiting at most timeout milliseconds for the first.
+        Unlike the samples given to notify_data_available these remain valid after the call.
+        '''
+        return self.__thing.read_iot_nvp(input_name, timeout)
+
+    def detection_box_reader(self, input_name: str = 'DetectionBoxData', capacity: int = 256):
+        '''A reader decoding the DepthDetectionBox samples of an input into NumPy arrays.'''
+        from datariver.reader import DetectionBoxReader
+        return DetectionBoxReader(self.__thing, input_name, capacity)
+
     @property
     def terminate(self):
         '''Whether the Thing should terminate'''
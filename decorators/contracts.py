@@ -1,6 +1,7 @@
 # Inspired by https://github.com/akashg90
 from functools import wraps
 import inspect
+import os
 from collections import namedtuple
 
 class PreconditionError(TypeError):
@@ -8,12 +9,25 @@ class PreconditionError(TypeError):
 
 ConditionInfo = namedtuple('ConditionInfo', ['app_args', 'closure_args', 'condition'])
 
+# Whether functions decorated from now on check their preconditions. They are not checked when Python
+# runs with -O or DISABLE_PRECONDITIONS is set, the decorator then returns the function itself.
+enabled = __debug__ and os.environ.get('DISABLE_PRECONDITIONS', '') in ('', '0')
+
+_MISSING = object()
+
+def _stripped_source(obj):
+    try:
+        return inspect.getsource(obj).strip()
+    except (OSError, TypeError):
+        return repr(obj)
+
 def preconditions(*conditions):
-    stripped_source = lambda obj: inspect.getsource(obj).strip()
+    stripped_source = _stripped_source
 
-    if conditions is None:
+    if not enabled:
         def null_decorator(f):
             f.nopre = f
+            return f
         return null_decorator
 
     condition_info = []
@@ -42,22 +56,42 @@ def preconditions(*conditions):
                     raise PreconditionError(
                         f'Invalid precondition masks parameter {closure_arg}:\n    {stripped_source(ci.condition)}\n    Known parameters: {fspec.args}')
 
+        # Bind the condition parameters to f's once: each one is read from the positional arguments
+        # by index, else from the keyword arguments, else it takes f's default.
+        defaults = dict(zip(fspec.args[len(fspec.args) - len(fspec.defaults or ()):], fspec.defaults or ()))
+        bindings = [(ci, tuple((fspec.args.index(aa), aa, defaults.get(aa, _MISSING)) for aa in ci.app_args))
+                    for ci in condition_info]
+
+        def failed(ci, a, kw):
+            args = inspect.getcallargs(f, *a, **kw)
+            return PreconditionError(
+                f'Precondition failed in call {g}{inspect.formatargvalues(fspec.args, fspec.varargs, fspec.varkw, args)}\n    {stripped_source(ci.condition)}')
+
         @wraps(f)
         def g(*a, **kw):
-            args = inspect.getcallargs(f, *a, **kw)
-            for ci in condition_info:
-                cond_response = ci.condition(*[args[aa] for aa in ci.app_args])
+            n = len(a)
+            for ci, params in bindings:
+                values = []
+                for i, name, default in params:
+                    if i < n:
+                        values.append(a[i])
+                        continue
+                    value = kw.get(name, default)
+                    if value is _MISSING:
+                        # Raises the TypeError f would raise for the missing argument.
+                        inspect.getcallargs(f, *a, **kw)
+                    values.append(value)
+                cond_response = ci.condition(*values)
                 if isinstance(cond_response, tuple):
                     cond, err = cond_response
                 else:
-                    cond, err = cond_response, PreconditionError(
-                        f'Precondition failed in call {g}{inspect.formatargvalues(fspec.args, fspec.varargs, fspec.varkw, args)}\n    {stripped_source(ci.condition)}')
+                    cond, err = cond_response, None
 
-                if cond is None:
-                    raise err
+                if not cond:
+                    raise err if err is not None else failed(ci, a, kw)
 
             return f(*a, **kw)
 
         g.nopre = f
         return g
-    return decorate
\ No newline at end of file
+    return decorate
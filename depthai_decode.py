@@ -0,0 +1,67 @@
+import numpy as np
+
+# Order of the fields in a MobileNet-SSD output row. The `_depth` network configs append the
+# distance_x/y/z fields computed on the device.
+NNET_FIELDS = ('id', 'label', 'confidence', 'left', 'top', 'right', 'bottom',
+               'distance_x', 'distance_y', 'distance_z')
+NNET_FIELDS_NO_DEPTH = NNET_FIELDS[:7]
+
+ID, LABEL, CONFIDENCE, LEFT, TOP, RIGHT, BOTTOM, DISTANCE_X, DISTANCE_Y, DISTANCE_Z = range(len(NNET_FIELDS))
+
+# (width, height) of the MobileNet-SSD input, the object tracker reports its boxes in these pixels.
+NN_INPUT_SIZE = (300, 300)
+
+
+def nnet_tensor(nnet_packet, n_fields: int = len(NNET_FIELDS)) -> np.ndarray:
+    '''
+    A (rows, n_fields) float32 view of the raw output tensor of a MobileNet-SSD nnet packet. Falls back
+    to building the array from entries() when the packet does not expose the tensor.
+    '''
+    try:
+        tensor = np.asarray(nnet_packet.get_tensor(0))
+        if tensor.ndim == 2 and tensor.shape[1] >= n_fields:
+            return tensor[:, :n_fields].astype(np.float32, copy=False)
+        return tensor.reshape(-1, n_fields).astype(np.float32, copy=False)
+    except (AttributeError, IndexError, RuntimeError, TypeError, ValueError):
+        return entries_rows(nnet_packet, n_fields)
+
+
+def entries_rows(nnet_packet, n_fields: int = len(NNET_FIELDS)) -> np.ndarray:
+    '''Build the (rows, n_fields) array of a nnet packet from its entries().'''
+    entries = nnet_packet.entries()
+    rows = np.zeros((len(entries), n_fields), dtype=np.float32)
+    for i, e in enumerate(entries):
+        for j, field in enumerate(NNET_FIELDS[:n_fields]):
+            try:
+                rows[i, j] = e[0][field]
+            except (KeyError, IndexError, TypeError):
+                continue
+    return rows
+
+
+def decode_detections(nnet_packet, threshold: float, n_fields: int = len(NNET_FIELDS)) -> np.ndarray:
+    '''
+    The rows of a MobileNet-SSD nnet packet that are before the id == -1 terminator and whose
+    confidence is at least threshold, selected with a single vectorized mask.
+    '''
+    rows = nnet_tensor(nnet_packet, n_fields)
+    terminated = np.logical_or.accumulate(rows[:, ID] == -1.0)
+    return rows[~terminated & (rows[:, CONFIDENCE] >= threshold)]
+
+
+def decode_tracklets(packet, width: int = NN_INPUT_SIZE[0], height: int = NN_INPUT_SIZE[1]) -> list:
+    '''
+    The tracklets of an object_tracker packet as analytics.tracker.Tracklet, with their boxes scaled
+    from the pixels of the NN input (width x height) to the normalized coordinates of the detections.
+    '''
+    from analytics.tracker import Tracklet
+
+    try:
+        object_tracker = packet.getObjectTracker()
+        tracklets = [object_tracker.getTracklet(i) for i in range(object_tracker.getNrTracklets())]
+    except (AttributeError, RuntimeError):
+        return []
+    return [Tracklet(t.getId(), t.getLabel(), t.getStatus(),
+                     t.getLeftCoord() / width, t.getTopCoord() / height,
+                     t.getRightCoord() / width, t.getBottomCoord() / height)
+            for t in tracklets]
@@ -0,0 +1,78 @@
+import numpy as np
+
+
+def _merge_planes(planar: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    '''
+    The interleaved (HWC) image of planar (CHW) data, written to out when given. OpenCV is imported
+    on the first frame materialized, not when the capture is imported.
+    '''
+    import cv2
+
+    planes = [planar[i] for i in range(planar.shape[0])]
+    return cv2.merge(planes, out) if out is not None else cv2.merge(planes)
+
+
+class FrameBuffer:
+    '''
+    A preallocated interleaved (HWC) image buffer reused by every LazyFrame of a capture. The buffer
+    is only reallocated when the shape or type of the frames changes.
+    '''
+
+    def __init__(self):
+        self.__buffer = None
+        self.owner = None
+
+    def get(self, shape: tuple, dtype) -> np.ndarray:
+        if self.__buffer is None or self.__buffer.shape != shape or self.__buffer.dtype != dtype:
+            self.__buffer = np.empty(shape, dtype=dtype)
+            self.owner = None
+        return self.__buffer
+
+
+class LazyFrame:
+    '''
+    A previewout frame that keeps the planar (CHW) data of the packet and only builds the
+    interleaved (HWC) image when it is accessed through image (or np.asarray).
+
+    The image is written into the FrameBuffer shared by the capture, so it is only valid until the
+    image of another frame is accessed. Use copy() to keep a frame beyond that.
+    '''
+
+    def __init__(self, planar: np.ndarray, buffer: FrameBuffer = None):
+        self.__planar = planar
+        self.__buffer = buffer if buffer is not None else FrameBuffer()
+
+    @property
+    def planar(self) -> np.ndarray:
+        '''The planar (CHW) data as received from the device'''
+        return self.__planar
+
+    @property
+    def shape(self) -> tuple:
+        channels, height, width = self.__planar.shape
+        return height, width, channels
+
+    @property
+    def dtype(self):
+        return self.__planar.dtype
+
+    @property
+    def materialized(self) -> bool:
+        '''Whether the shared buffer currently holds the image of this frame'''
+        return self.__buffer.owner is self
+
+    @property
+    def image(self) -> np.ndarray:
+        buffer = self.__buffer.get(self.shape, self.__planar.dtype)
+        if self.__buffer.owner is not self:
+            _merge_planes(self.__planar, buffer)
+            self.__buffer.owner = self
+        return buffer
+
+    def copy(self) -> np.ndarray:
+        '''An interleaved (HWC) copy of the frame that is not shared with other frames'''
+        return _merge_planes(self.__planar)
+
+    def __array__(self, dtype=None, copy=None):
+        image = self.copy() if copy else self.image
+        return image if dtype is None else image.astype(dtype)
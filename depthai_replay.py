@@ -0,0 +1,338 @@
+import json
+import logging as log
+import struct
+import sys
+import time
+import zlib
+from typing import List
+
+import numpy as np
+
+from depthai_decode import NNET_FIELDS, entries_rows
+from packet_pairing import packet_key
+
+TRACE_MAGIC = b'DAITRACE'
+TRACE_VERSION = 1
+
+_HEADER = struct.Struct('<8sHI')
+_BATCH = struct.Struct('<dII')
+_NNET = struct.Struct('<qdI')
+_DATA = struct.Struct('<qdBBB?I')
+
+
+class TraceExhausted(EOFError):
+    '''Raised by a ReplayPipeline once every packet in the trace has been handed out.'''
+    pass
+
+
+class _ReplayMetadata:
+    def __init__(self, sequence_num: int, timestamp: float):
+        self.__sequence_num = sequence_num
+        self.__timestamp = timestamp
+
+    def getSequenceNum(self) -> int:
+        return self.__sequence_num
+
+    def getTimestamp(self) -> float:
+        return self.__timestamp
+
+
+class ReplayNNetPacket:
+    '''
+    Stand-in for a depthai NNetPacket read back from a trace. Provides the subset of the
+    depthai API used by DepthAI.capture; entries(), get_tensor() and getMetadata().
+    '''
+
+    def __init__(self, rows: np.ndarray, sequence_num: int = -1, timestamp: float = 0.0, fields=NNET_FIELDS):
+        self.__rows = rows
+        self.__fields = fields
+        self.__metadata = _ReplayMetadata(sequence_num, timestamp)
+
+    def entries(self):
+        return [(dict(zip(self.__fields, row.tolist())),) for row in self.__rows]
+
+    def get_tensor(self, index=0) -> np.ndarray:
+        return self.__rows
+
+    def getMetadata(self) -> _ReplayMetadata:
+        return self.__metadata
+
+
+class ReplayDataPacket:
+    '''Stand-in for a depthai DataPacket read back from a trace.'''
+
+    def __init__(self, stream_name: str, data, sequence_num: int = -1, timestamp: float = 0.0):
+        self.stream_name = stream_name
+        self.__data = data
+        self.__metadata = _ReplayMetadata(sequence_num, timestamp)
+
+    def getData(self):
+        return self.__data
+
+    def getMetadata(self) -> _ReplayMetadata:
+        return self.__metadata
+
+
+class TraceRecorder:
+    '''
+    Saves the nnet and data packets returned by a depthai pipeline to a compact binary
+    trace that can later be fed back into DepthAI.capture with a ReplayPipeline.
+
+    Only non-empty polls are recorded. Each batch keeps the host time at which it was
+    polled so that the replay can reproduce the original packet timing. The nnet rows keep
+    the nnet_fields, e.g. NNET_FIELDS_NO_DEPTH for a network without the distances.
+    '''
+
+    def __init__(self, path: str, labels: List[str] = None, streams: List[str] = None, compress: bool = True,
+                 nnet_fields: tuple = NNET_FIELDS):
+        self.__file = open(path, 'wb')
+        self.__compress = compress
+        self.__streams = streams
+        self.__nnet_fields = len(nnet_fields)
+        self.__start = None
+        header = json.dumps({'labels': labels, 'nnet_fields': nnet_fields}).encode('utf-8')
+        self.__file.write(_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, len(header)))
+        self.__file.write(header)
+        self.__batches = 0
+
+    @property
+    def batches(self) -> int:
+        '''Number of batches recorded so far'''
+        return self.__batches
+
+    def record(self, nnet_packets, data_packets, timestamp: float = None) -> None:
+        '''
+        Append a polled batch of packets to the trace. The timestamp (seconds since the start of the
+        trace) defaults to the time elapsed since the first recorded batch.
+        '''
+        if self.__streams is not None:
+            data_packets = [p for p in data_packets if p.stream_name in self.__streams]
+        if len(nnet_packets) == 0 and len(data_packets) == 0:
+            return
+        if timestamp is None:
+            now = time.monotonic()
+            if self.__start is None:
+                self.__start = now
+            timestamp = now - self.__start
+
+        out = self.__file
+        out.write(_BATCH.pack(timestamp, len(nnet_packets), len(data_packets)))
+        for nnet_packet in nnet_packets:
+            rows = entries_rows(nnet_packet, self.__nnet_fields)
+            out.write(_NNET.pack(*packet_key(nnet_packet), rows.shape[0]))
+            out.write(rows.tobytes())
+        for packet in data_packets:
+            self.__write_data_packet(packet)
+        self.__batches += 1
+
+    def __write_data_packet(self, packet) -> None:
+        name = packet.stream_name.encode('utf-8')
+        data = packet.getData()
+        if data is None:
+            data = np.zeros((0,), dtype=np.uint8)
+        data = np.ascontiguousarray(data)
+        dtype = data.dtype.str.encode('ascii')
+        payload = data.tobytes()
+        if self.__compress:
+            payload = zlib.compress(payload, 1)
+        self.__file.write(_DATA.pack(*packet_key(packet), len(name), len(dtype), data.ndim,
+                                     self.__compress, len(payload)))
+        self.__file.write(name)
+        self.__file.write(dtype)
+        self.__file.write(struct.pack(f'<{data.ndim}I', *data.shape))
+        self.__file.write(payload)
+
+    def close(self) -> None:
+        if not self.__file.closed:
+            self.__file.close()
+
+    def __del__(self):
+        self.close()
+
+
+class RecordingPipeline:
+    '''Wraps a depthai pipeline and records every packet it returns with a TraceRecorder.'''
+
+    def __init__(self, pipeline, recorder: TraceRecorder):
+        self.__pipeline = pipeline
+        self.__recorder = recorder
+
+    def get_available_nnet_and_data_packets(self, *args, **kwargs):
+        nnet_packets, data_packets = self.__pipeline.get_available_nnet_and_data_packets(*args, **kwargs)
+        self.__recorder.record(nnet_packets, data_packets)
+        return nnet_packets, data_packets
+
+    def __del__(self):
+        self.__recorder.close()
+        del self.__pipeline
+
+
+class TraceReader:
+    '''Iterates the (timestamp, nnet_packets, data_packets) batches stored in a trace.'''
+
+    def __init__(self, path: str):
+        self.__path = path
+        with open(path, 'rb') as f:
+            magic, version, header_len = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != TRACE_MAGIC:
+                raise ValueError(f'{path} is not a DepthAI packet trace')
+            if version != TRACE_VERSION:
+                raise ValueError(f'Unsupported trace version {version} in {path}')
+            self.__header = json.loads(f.read(header_len).decode('utf-8'))
+            self.__offset = f.tell()
+        # The columns of the nnet rows are those of the recorder, which may differ from NNET_FIELDS.
+        self.__nnet_fields = tuple(self.__header.get('nnet_fields') or NNET_FIELDS)
+
+    @property
+    def labels(self) -> List[str]:
+        return self.__header.get('labels')
+
+    @property
+    def nnet_fields(self) -> tuple:
+        '''The fields of the nnet rows stored in the trace'''
+        return self.__nnet_fields
+
+    def __iter__(self):
+        with open(self.__path, 'rb') as f:
+            f.seek(self.__offset)
+            while True:
+                raw = f.read(_BATCH.size)
+                if len(raw) < _BATCH.size:
+                    return
+                timestamp, n_nnet, n_data = _BATCH.unpack(raw)
+                nnet_packets = [self.__read_nnet_packet(f) for _ in range(n_nnet)]
+                data_packets = [self.__read_data_packet(f) for _ in range(n_data)]
+                yield timestamp, nnet_packets, data_packets
+
+    def __read_nnet_packet(self, f) -> ReplayNNetPacket:
+        sequence_num, timestamp, n_rows = _NNET.unpack(f.read(_NNET.size))
+        n_fields = len(self.__nnet_fields)
+        rows = np.frombuffer(f.read(n_rows * n_fields * 4), dtype=np.float32)
+        return ReplayNNetPacket(rows.reshape(n_rows, n_fields), sequence_num, timestamp, self.__nnet_fields)
+
+    @staticmethod
+    def __read_data_packet(f) -> ReplayDataPacket:
+        sequence_num, timestamp, name_len, dtype_len, ndim, compressed, payload_len = _DATA.unpack(f.read(_DATA.size))
+        name = f.read(name_len).decode('utf-8')
+        dtype = np.dtype(f.read(dtype_len).decode('ascii'))
+        shape = struct.unpack(f'<{ndim}I', f.read(4 * ndim))
+        payload = f.read(payload_len)
+        if compressed:
+            payload = zlib.decompress(payload)
+        data = np.frombuffer(payload, dtype=dtype).reshape(shape)
+        return ReplayDataPacket(name, data, sequence_num, timestamp)
+
+
+class ReplayPipeline:
+    '''
+    Feeds a recorded trace into DepthAI.capture in place of a device pipeline.
+
+    A speed of 1.0 replays the trace in real time, N replays it N times faster and 0 (or None)
+    replays it as fast as possible. Like a device pipeline the poll is non-blocking unless blocking
+    is set; until the next batch is due empty packet lists are returned, or a blocking poll sleeps
+    until it is. Once the trace is exhausted TraceExhausted
+    is raised, unless loop is set in which case the trace starts over.
+    '''
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False, preload: bool = True):
+        self.__reader = TraceReader(path)
+        self.__speed = speed if speed is not None and speed > 0 else None
+        self.__loop = loop
+        self.__batches = list(self.__reader) if preload else None
+        self.__iter = None
+        self.__pending = None
+        self.__start = None
+
+    @property
+    def labels(self) -> List[str]:
+        return self.__reader.labels
+
+    @property
+    def nnet_fields(self) -> tuple:
+        return self.__reader.nnet_fields
+
+    def __next_batch(self):
+        if self.__iter is None:
+            self.__iter = iter(self.__batches if self.__batches is not None else self.__reader)
+            self.__start = time.monotonic()
+        try:
+            return next(self.__iter)
+        except StopIteration:
+            self.__iter = None
+            if not self.__loop:
+                raise TraceExhausted('End of the DepthAI packet trace')
+            return self.__next_batch()
+
+    def rewind(self) -> None:
+        '''Start the replay over from the beginning of the trace.'''
+        self.__iter = None
+        self.__pending = None
+
+    def get_available_nnet_and_data_packets(self, blocking: bool = False):
+        if self.__pending is None:
+            self.__pending = self.__next_batch()
+        timestamp, nnet_packets, data_packets = self.__pending
+        if self.__speed is not None:
+            due = self.__start + timestamp / self.__speed - time.monotonic()
+            if due > 0:
+                if not blocking:
+                    return [], []
+                time.sleep(due)
+        self.__pending = None
+        return nnet_packets, data_packets
+
+
+class TraceConfig:
+    '''Minimal stand-in for DepthAIConfig when the only source of packets is a trace.'''
+
+    def __init__(self, labels: List[str], nnet_fields: tuple = NNET_FIELDS):
+        self.config = None
+        self.labels = labels if labels is not None else []
+        self.calc_dist_to_bb = len(nnet_fields) >= len(NNET_FIELDS)
+
+
+def replay_benchmark(path: str, speed: float = 0.0, loop_count: int = 1, mode: str = 'blocking') -> dict:
+    '''
+    Run DepthAI.capture over a trace and report the frame rate and CPU time per frame, waiting for
+    the packets as the acquisition mode does (see acquisition.Acquisition).
+    '''
+    from acquisition import Acquisition
+    from depthai_wrapper import DepthAI
+
+    pipeline = ReplayPipeline(path, speed=speed)
+    depthai = DepthAI(TraceConfig(pipeline.labels, pipeline.nnet_fields), 'replay', 'replay', 'people', pipeline=pipeline,
+                      acquisition=Acquisition(mode))
+    frames = 0
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(loop_count):
+        pipeline.rewind()
+        for _ in depthai.capture():
+            frames += 1
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    return {
+        'frames': frames,
+        'seconds': wall,
+        'fps': frames / wall if wall > 0 else 0.0,
+        'cpu_ms_per_frame': 1000.0 * cpu / frames if frames > 0 else 0.0,
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from benchmarks import datariver_standin
+
+    log.basicConfig(format='[ %(levelname)s ] %(message)s', level=log.INFO, stream=sys.stdout)
+    # The boxes are built as Data River samples, with the stand-in where the Edge SDK is not installed.
+    datariver_standin.install()
+    parser = argparse.ArgumentParser(description='Replay a DepthAI packet trace through DepthAI.capture')
+    parser.add_argument('trace', help='Trace file recorded with TraceRecorder')
+    parser.add_argument('-s', '--speed', type=float, default=0.0,
+                        help='Replay speed, 1.0 is real time and 0 is as fast as possible')
+    parser.add_argument('-n', '--loops', type=int, default=1, help='Number of times to replay the trace')
+    parser.add_argument('-m', '--mode', default='blocking', choices=('blocking', 'backoff', 'poll'),
+                        help='How the capture waits for packets')
+    args = parser.parse_args()
+    print(json.dumps(replay_benchmark(args.trace, args.speed, args.loops, args.mode), indent=2))
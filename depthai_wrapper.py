@@ -1,29 +1,69 @@
+import asyncio
+import json
 import logging as log
-import uuid
-from pathlib import Path
-from typing import List
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
 
-import cv2
+import numpy as np
 
-import consts.resource_paths
-import depthai
+from acquisition import Acquisition, BLOCKING
+from capture_stages import CaptureStage, by_stream, ordered
+from depthai_decode import decode_detections, NNET_FIELDS, NNET_FIELDS_NO_DEPTH, \
+    LABEL, CONFIDENCE, LEFT, TOP, RIGHT, BOTTOM, DISTANCE_X, DISTANCE_Y, DISTANCE_Z
+from depthai_frame import FrameBuffer, LazyFrame
+from depthai_replay import RecordingPipeline, TraceRecorder
+from packet_pairing import INFERENCE, LATEST, MODES as PAIRING_MODES, SEQUENCE, PacketPairer, packet_key
 
-import depthai
-from imutils.video import FPS
+from datacls import PyDepthDetectionBox, DetectionBatch
+from metrics import COUNT_BUCKETS, registry
+from rate_control import FrameDecimator, RateController
+from startup_timing import startup_timer
 
-from config import DepthAIConfig
-
-from datacls import PyDepthDetectionBox, PyDepthDetectionBoxData
+PACKETS_POLLED = registry.counter('depthai_packets_polled_total', 'Packets polled from the device', ('stream', 'kind'))
+EMPTY_POLLS = registry.counter('depthai_empty_polls_total', 'Polls of the device that returned no packets', ('stream',))
+FRAMES = registry.counter('depthai_frames_total', 'Frames yielded by the capture', ('stream',))
+DETECTIONS = registry.histogram('depthai_detections_per_frame', 'Detections above the threshold per frame',
+                                ('stream',), COUNT_BUCKETS)
+STAGE_SECONDS = registry.histogram('depthai_stage_seconds', 'Seconds spent per frame in each stage', ('stream', 'stage'))
+DECIMATED = registry.counter('depthai_frames_decimated_total', 'Frames dropped to keep to the rate control rate',
+                             ('stream',))
+DEVICE_TEMPERATURE = registry.gauge('depthai_device_temperature_celsius',
+                                    'Device temperatures reported on the meta_d2h stream', ('stream', 'sensor'))
+DEVICE_CPU_USAGE = registry.gauge('depthai_device_cpu_usage_percent',
+                                  'Device CPU usage reported on the meta_d2h stream', ('stream', 'cpu'))
+CAPTURE_CPU = registry.histogram('depthai_capture_cpu_seconds', 'CPU seconds the capture loop used per frame',
+                                 ('stream',))
+POLL_WAIT_SECONDS = registry.counter('depthai_poll_wait_seconds_total', 'Seconds slept backing off empty polls',
+                                     ('stream',))
+PIPELINE_REBUILDS = registry.counter('depthai_pipeline_rebuilds_total',
+                                     'Device pipelines rebuilt for a change of their settings', ('stream',))
+registry.function('process_cpu_seconds_total', 'CPU seconds used by the process', time.process_time, kind='counter')
 
 class DepthAI:
     @staticmethod
-    def create_pipeline(config):
-        if not depthai.init_device(consts.resource_paths.device_cmd_fpath):
+    def create_pipeline(config, device_id : str = ''):
+        '''
+        Initialize the device and create the pipeline. device_id selects the device by its USB port
+        path (e.g. '1.2'), the first device found is used when it is empty.
+        '''
+        # Imported here so a DepthAI replaying a trace runs without the depthai checkout.
+        import consts.resource_paths
+        import depthai
+
+        with startup_timer.phase('device init'):
+            if device_id:
+                initialized = depthai.init_device(consts.resource_paths.device_cmd_fpath, device_id)
+            else:
+                initialized = depthai.init_device(consts.resource_paths.device_cmd_fpath)
+        if not initialized:
             log.error('Failed to initialize device raising a RuntimeError')
             raise RuntimeError('Error initializing device. Try to reset it.')
         log.info('Creating DepthAI pipeline...')
 
-        pipeline = depthai.create_pipeline(config)
+        with startup_timer.phase('pipeline'):
+            pipeline = depthai.create_pipeline(config)
         if pipeline is None:
             log.error('Failed to create pipeline raising a RuntimeError.')
             raise RuntimeError('Pipeline was not created.')
@@ -31,84 +71,419 @@ class DepthAI:
         log.info('Pipeline created successfully.')
         return pipeline
 
-    def __init__(self, config:DepthAIConfig, stream_id : str,
+    def __init__(self, config:'DepthAIConfig', stream_id : str,
                  engine_id : str, model_label: str,
-                 threshold : float = 0.5):
+                 threshold : float = 0.5, pipeline=None, trace_recorder : TraceRecorder = None,
+                 yield_frames : bool = True, device_id : str = '', stages : List[CaptureStage] = (),
+                 rate_controller : RateController = None, acquisition : Acquisition = None,
+                 pairing : str = LATEST, pairer : PacketPairer = None, labels : List[str] = None):
+        '''
+        If a pipeline is provided (e.g. a depthai_replay.ReplayPipeline) it is used as the source
+        of packets instead of initializing the device and creating a pipeline from the config. If
+        a trace_recorder is provided every packet polled from the pipeline is also recorded.
+
+        When yield_frames is False capture() yields None in place of the frame and the preview data
+        is never read, for deployments that only publish the detections.
+
+        The optional host stages (e.g. the tracker, ROI depth, second stage and video recorder) are
+        given as stages, see capture_stages.CaptureStage. They take the packets of their data streams
+        and are applied to the boxes of every frame yielded, in capture_stages.STAGE_ORDER.
+
+        If a rate_controller is provided previewout frames above its rate are dropped before they are
+        decoded. The device keeps the max_fps the pipeline was created with, which depthai cannot
+        change without recreating the pipeline.
+
+        The acquisition sets how capture() waits for packets, by default it blocks in depthai (or
+        backs off on empty polls) rather than spinning, see acquisition.Acquisition.
+
+        The pairing sets which frames are yielded with which nnet results, see capture(). The
+        'sequence' and 'inference' pairings match them with the pairer (by default a PacketPairer).
+
+        The labels of the boxes are those of the model json unless labels are provided. The threshold,
+        labels, host stages and pipeline config can be changed while capturing with reconfigure().
+        '''
+        self.__yield_frames = yield_frames
+        self.__frame_buffer = FrameBuffer()
         self.__config = config
-        self.__pipeline = DepthAI.create_pipeline(config.config)
-        self.__network_results = []
+        self.__owns_device = pipeline is None
+        self.__device_id = device_id
+        self.__trace_recorder = trace_recorder
+        self.__pipeline = DepthAI.create_pipeline(config.config, device_id) if pipeline is None else pipeline
+        if trace_recorder is not None:
+            self.__pipeline = RecordingPipeline(self.__pipeline, trace_recorder)
+        self.__nnet_fields = len(NNET_FIELDS) if getattr(config, 'calc_dist_to_bb', True) else len(NNET_FIELDS_NO_DEPTH)
+        self.__network_results = np.zeros((0, self.__nnet_fields), dtype=np.float32)
         self.__threshold = threshold
         self.__model_label = model_label
-        self.__labels = config.labels
+        self.__labels = labels if labels is not None else config.labels
         log.info(f'Labels: {self.__labels}')
         log.info(f'Labels length: {len(self.__labels)}')
         self.__engine_id = engine_id
         self.__stream_id = stream_id
+        self.__nnet_polled = PACKETS_POLLED.labels(stream=stream_id, kind='nnet')
+        self.__data_polled = PACKETS_POLLED.labels(stream=stream_id, kind='data')
+        self.__empty_polls = EMPTY_POLLS.labels(stream=stream_id)
+        self.__frames = FRAMES.labels(stream=stream_id)
+        self.__detections = DETECTIONS.labels(stream=stream_id)
+        self.__decimator = FrameDecimator(rate_controller) if rate_controller is not None else None
+        self.__decimated = DECIMATED.labels(stream=stream_id)
+        if acquisition is None:
+            max_fps = config.stream_max_fps('previewout') if hasattr(config, 'stream_max_fps') else None
+            acquisition = Acquisition.for_fps(BLOCKING, float(max_fps or 30.0))
+        self.__acquisition = acquisition
+        if pairing not in PAIRING_MODES:
+            raise ValueError(f'Unknown pairing {pairing}, expected one of {", ".join(PAIRING_MODES)}')
+        self.__pairing = pairing
+        self.__pairer = pairer if pairer is not None else PacketPairer()
+        if pairing != LATEST:
+            # The registry outlives the DepthAI, the series must not keep it (and its device) alive.
+            for kind in ('frames', 'results'):
+                registry.function('depthai_unpaired_total', 'Frames and nnet results dropped without a match',
+                                  lambda kind=kind, pairer=self.__pairer: pairer.stats[f'unpaired_{kind}'],
+                                  kind='counter', stream=stream_id, packet=kind)
+        self.__poll_wait = POLL_WAIT_SECONDS.labels(stream=stream_id)
+        self.__capture_cpu = CAPTURE_CPU.labels(stream=stream_id)
+        self.__polled_at = None
+        self.__captured_at = None
+        self.__backlog = 0
+        self.__stage_seconds = {stage: STAGE_SECONDS.labels(stream=stream_id, stage=stage)
+                                for stage in ('poll', 'wait', 'decode', 'encode')}
+        # The stages by name, the last stage of every name replaced or removed is kept to carry over its state.
+        self.__stages = {}
+        self.__previous_stages = {}
+        self.__set_stages({stage.name: stage for stage in stages})
+        self.__changes = {}
+        self.__changes_lock = threading.Lock()
+        self.__pipeline_applied = None
+        self.__rebuilds = PIPELINE_REBUILDS.labels(stream=stream_id)
+
+    @property
+    def stream_id(self) -> str:
+        return self.__stream_id
+
+    @property
+    def engine_id(self) -> str:
+        return self.__engine_id
+
+    @property
+    def polled_at(self) -> float:
+        '''The time.monotonic() at which the packets of the frame last yielded were polled'''
+        return self.__polled_at
+
+    @property
+    def captured_at(self) -> float:
+        '''The time.time() at which the packets of the frame last yielded were polled, its capture time'''
+        return self.__captured_at
+
+    @property
+    def acquisition_stats(self) -> dict:
+        '''How capture() waited for packets, and the mean CPU milliseconds it used per frame'''
+        counts, cpu = self.__capture_cpu.snapshot()
+        frames = sum(counts)
+        stats = self.__acquisition.stats
+        stats['cpu_ms_per_frame'] = round(1000.0 * cpu / frames, 3) if frames else 0.0
+        return stats
+
+    @property
+    def pairing_stats(self) -> dict:
+        '''The frames and nnet results the pairing dropped unpaired, empty with the 'latest' pairing'''
+        return self.__pairer.stats if self.__pairing != LATEST else {}
+
+    @property
+    def backlog(self) -> int:
+        '''Frames completed by the poll of the frame last yielded, in excess of one'''
+        return self.__backlog
+
+    def decode_nnet_packet(self, nnet_packet) -> np.ndarray:
+        '''The rows of the nnet packet output above the threshold, see depthai_decode.decode_detections.'''
+        return decode_detections(nnet_packet, self.__threshold, self.__nnet_fields)
+
+    def frame_from_packet(self, packet) -> LazyFrame:
+        '''
+        Wrap the planar (CHW) data of a previewout packet in a LazyFrame, the interleaved (HWC)
+        image is only built (in a reused buffer) when it is accessed.
+        '''
+        data = packet.getData()
+        if data is None:
+            return None
+        return LazyFrame(data, self.__frame_buffer)
 
+    def encode_boxes(self, network_results : np.ndarray, frame_num : int) -> PyDepthDetectionBox:
+        '''Build the DepthDetectionBox sample for a frame from the decoded network output rows.'''
+        count = len(network_results)
+        batch = DetectionBatch(max(count, 1), self.__labels)
+        if count > 0:
+            columns = {
+                'class_id': network_results[:, LABEL],
+                'x1': network_results[:, LEFT],
+                'y1': network_results[:, TOP],
+                'x2': network_results[:, RIGHT],
+                'y2': network_results[:, BOTTOM],
+                'probability': network_results[:, CONFIDENCE],
+            }
+            if network_results.shape[1] > DISTANCE_Z:
+                columns['dist_x'] = network_results[:, DISTANCE_X]
+                columns['dist_y'] = network_results[:, DISTANCE_Y]
+                columns['dist_z'] = network_results[:, DISTANCE_Z]
+            batch.extend(count, **columns)
+        return PyDepthDetectionBox(self.__engine_id, self.__stream_id, frame_num, batch)
+
+
+    def update_device_health(self, packet) -> None:
+        '''Set the device temperature and CPU usage gauges from a meta_d2h packet.'''
+        try:
+            meta = json.loads(packet.getDataAsStr())
+        except (ValueError, TypeError):
+            return
+        for sensor, value in meta.get('sensors', {}).get('temperature', {}).items():
+            DEVICE_TEMPERATURE.labels(stream=self.__stream_id, sensor=sensor).set(float(value))
+        for cpu, value in meta.get('cpu', {}).items():
+            if isinstance(value, dict):
+                value = value.get('usage', 0.0)
+            DEVICE_CPU_USAGE.labels(stream=self.__stream_id, cpu=cpu).set(float(value))
 
     def capture(self):
+        '''
+        Yields a (frame, boxes) for every frame, as set by the pairing:
+
+        - 'latest': every previewout frame, with the results of the latest nnet packet. When the
+          preview runs faster than the NN the same results are yielded for several frames
+        - 'sequence': every previewout frame the NN ran on, with its own results (see PacketPairer).
+          The frames the NN skipped are not yielded
+        - 'inference': the results of every nnet packet, with their previewout frame when it has
+          already arrived (None otherwise), without waiting for it
+
+        The CPU time the loop used between two frames, polling and waiting included, is observed in
+        depthai_capture_cpu_seconds.
+        '''
         frame_num = 0
+        stages = self.__stage_seconds
+        acquisition = self.__acquisition
+        pairing, pairer = self.__pairing, self.__pairer
+        cpu_started = time.thread_time()
         while True:
-            nnet_packets, data_packets = self.__pipeline.get_available_nnet_and_data_packets()
-            for _, nnet_packet in enumerate(nnet_packets):
-                self.__network_results = []
-                for _, e in enumerate(nnet_packet.entries()):
-                    if e[0]['id'] == -1.0 or e[0]['confidence'] < self.__threshold:
-                        break
-
-                    self.__network_results.append(e[0])
+            if self.__changes:
+                self.__apply_changes()
+            # The previewout data is needed for the frames yielded and by the stages reading it.
+            needs_frames, stage_streams = self.__needs_frames, self.__stage_streams
+            started = time.perf_counter()
+            try:
+                nnet_packets, data_packets = acquisition.poll(self.__pipeline)
+            except EOFError:
+                log.info('Packet source exhausted, stopping capture.')
+                return
+            polled = time.perf_counter()
+            # A blocking poll mostly waits for the device, it is not the cost of polling.
+            stages['wait' if acquisition.blocking else 'poll'].observe(polled - started)
+            if len(nnet_packets) == 0 and len(data_packets) == 0:
+                self.__empty_polls.inc()
+                self.__poll_wait.inc(acquisition.idle())
+                continue
+            acquisition.active()
+            self.__nnet_polled.inc(len(nnet_packets))
+            self.__data_polled.inc(len(data_packets))
+            self.__polled_at = time.monotonic()
+            self.__captured_at = time.time()
+            # Only the results of the latest nnet packet are used, the older ones need not be decoded.
+            if pairing == LATEST and len(nnet_packets) > 0:
+                self.__network_results = self.decode_nnet_packet(nnet_packets[-1])
+                stages['decode'].observe(time.perf_counter() - polled)
+            # The (previewout, nnet) packets of the frames to yield, nnet is None for the latest results.
+            pairs = []
             for packet in data_packets:
                 if packet.stream_name == 'previewout':
-                    boxes = PyDepthDetectionBox()
-                    boxes.stream_id = 'foo'
-                    boxes.engine_id = 'engine'
-                    boxes.frame_id = frame_num
-                    data = packet.getData()
-                    if data is None:
+                    if pairing == INFERENCE:
+                        if needs_frames:
+                            pairer.keep_frame(packet)
+                    elif self.__keep(packet):
+                        pairs.extend(pairer.add_frame(packet) if pairing == SEQUENCE else [(packet, None)])
+                elif packet.stream_name == 'meta_d2h':
+                    self.update_device_health(packet)
+                else:
+                    for stage in stage_streams.get(packet.stream_name, ()):
+                        stage.packet(packet)
+            if pairing != LATEST:
+                for nnet_packet in nnet_packets:
+                    if pairing == SEQUENCE:
+                        pairs.extend(pairer.add_result(nnet_packet))
+                    elif self.__keep(nnet_packet):
+                        pairs.append((pairer.frame_for(nnet_packet) if needs_frames else None, nnet_packet))
+            self.__backlog = max(len(pairs) - 1, 0)
+            for frame_packet, nnet_packet in pairs:
+                frame = None
+                if self.__yield_frames and frame_packet is not None:
+                    frame = self.frame_from_packet(frame_packet)
+                    if frame is None and pairing != INFERENCE:
                         continue
-                    data0 = data[0,:,:]
-                    data1 = data[1, :, :]
-                    data2 = data[2, :, :]
-                    frame = cv2.merge([data0, data1, data2])
-
-                    img_h = frame.shape[0]
-                    img_w = frame.shape[1]
-
-                    for e in self.__network_results:
-                        try:
-                            box = PyDepthDetectionBoxData()
-                            box.x1 = float(e['left'])
-                            box.y1 = float(e['top'])
-                            box.x2 = float(e['right'])
-                            box.y2 = float(e['bottom'])
-                            box.class_id = e['label']
-                            if box.class_id <= len(self.__labels):
-                                box.class_label = self.__labels[box.class_id]
-                            print(e['confidence'])
-                            box.probability = e['confidence']
-                            box.dist_x = e['distance_x']
-                            box.dist_y = e['distance_y']
-                            box.dist_z = e['distance_z']
-                            boxes.add_data(box)
-                            # boxes.append({
-                            #     'id': uuid.uuid4(),
-                            #     'detector': self.__model_label,
-                            #     'label': e['label'],
-                            #     'conf': e['confidence'],
-                            #     'left': int(e['left'] * img_w),
-                            #     'top': int(e['top'] * img_h),
-                            #     'right': int(e['right'] * img_w),
-                            #     'bottom': int(e['bottom'] * img_h),
-                            #     'distance_x': e['distance_x'],
-                            #     'distance_y': e['distance_y'],
-                            #     'distance_z': e['distance_z'],
-                            # })
-                        except :
-                            continue
-                    yield frame, boxes
-                    frame_num += 1
+                network_results = self.__network_results
+                if nnet_packet is not None:
+                    decode_started = time.perf_counter()
+                    network_results = self.decode_nnet_packet(nnet_packet)
+                    stages['decode'].observe(time.perf_counter() - decode_started)
+                _, timestamp = packet_key(frame_packet if frame_packet is not None else nnet_packet)
+                encode_started = time.perf_counter()
+                boxes = self.encode_boxes(network_results, frame_num)
+                stage_started = time.perf_counter()
+                stages['encode'].observe(stage_started - encode_started)
+                for stage, seconds in self.__frame_stages:
+                    stage.process(boxes.batch, frame_packet, timestamp)
+                    stage_done = time.perf_counter()
+                    seconds.observe(stage_done - stage_started)
+                    stage_started = stage_done
+                self.__frames.inc()
+                self.__detections.observe(len(boxes.batch))
+                cpu = time.thread_time()
+                self.__capture_cpu.observe(cpu - cpu_started)
+                yield frame, boxes
+                cpu_started = time.thread_time()
+                frame_num += 1
+
+    def reconfigure(self, changes : dict, pipeline_applied : Callable[[dict], None] = None) -> None:
+        '''
+        Change settings while capturing, from any thread. changes maps any of 'threshold', 'labels',
+        'stages' and 'pipeline' (the device pipeline config) to its new value; 'stages' maps the name of
+        a stage to the stage replacing it, or None to remove it. They are applied by capture() before its
+        next poll; the device pipeline is rebuilt with the new config, which restarts the streams of the
+        device. A new stage carries over the state of the previous one of its name (see
+        CaptureStage.replaces), e.g. a tracker continues the obj_ids.
+
+        pipeline_applied is called from the capture thread with the pipeline config in effect after
+        a change of it, the previous one when the new one could not be applied.
+        '''
+        with self.__changes_lock:
+            self.__changes.update(changes)
+            if pipeline_applied is not None:
+                self.__pipeline_applied = pipeline_applied
+
+    def __apply_changes(self) -> None:
+        with self.__changes_lock:
+            changes, self.__changes = self.__changes, {}
+        if 'threshold' in changes:
+            self.__threshold = changes['threshold']
+        if 'labels' in changes:
+            self.__labels = changes['labels']
+        if 'stages' in changes:
+            self.__set_stages(changes['stages'])
+        if 'pipeline' in changes:
+            self.__rebuild_pipeline(changes['pipeline'])
+            if self.__pipeline_applied is not None:
+                self.__pipeline_applied(self.__config.config)
+
+    def __set_stages(self, stages : dict) -> None:
+        '''Replace, add or (for None) remove the stages of the names of stages.'''
+        for name, stage in stages.items():
+            previous = self.__stages.pop(name, None)
+            if previous is not None:
+                self.__previous_stages[name] = previous
+            if stage is not None:
+                if name in self.__previous_stages:
+                    stage.replaces(self.__previous_stages[name])
+                self.__stages[name] = stage
+        active = ordered(self.__stages.values())
+        self.__frame_stages = [(stage, STAGE_SECONDS.labels(stream=self.__stream_id, stage=stage.name))
+                               for stage in active if stage.per_frame]
+        self.__stage_streams = by_stream(active)
+        self.__needs_frames = self.__yield_frames or any(stage.needs_frames for stage in active)
+
+    def __rebuild_pipeline(self, pipeline_config : dict) -> bool:
+        '''
+        Recreate the pipeline of the device with a new config, returns whether it was applied. When it
+        cannot be the previous config is restored, see __restore_pipeline.
+        '''
+        if not self.__owns_device:
+            log.warning('The packets do not come from a device, the pipeline settings are not applied')
+            return False
+        import depthai
+
+        started = time.perf_counter()
+        # The pipeline must be released before the device is deinitialized.
+        self.__pipeline = None
+        depthai.deinit_device()
+        try:
+            pipeline = DepthAI.create_pipeline(pipeline_config, self.__device_id)
+        except RuntimeError:
+            log.exception('Rebuilding the pipeline with the new settings failed, restoring the previous ones')
+            pipeline = None
+        applied = pipeline is not None
+        if not applied:
+            pipeline_config = self.__config.config
+            pipeline = self.__restore_pipeline(pipeline_config)
+        if self.__trace_recorder is not None:
+            pipeline = RecordingPipeline(pipeline, self.__trace_recorder)
+        self.__pipeline = pipeline
+        self.__config.config = pipeline_config
+        self.__nnet_fields = len(NNET_FIELDS) if pipeline_config.get('ai', {}).get('calc_dist_to_bb', True) \
+            else len(NNET_FIELDS_NO_DEPTH)
+        self.__network_results = np.zeros((0, self.__nnet_fields), dtype=np.float32)
+        # The sequence numbers of the new pipeline start over, the packets waiting will not pair.
+        self.__pairer.clear()
+        for stage in self.__stages.values():
+            stage.reset()
+        if applied:
+            self.__rebuilds.inc()
+            log.info(f'Rebuilt the device pipeline in {time.perf_counter() - started:.1f} s')
+        return applied
+
+    def __restore_pipeline(self, pipeline_config : dict, attempts : int = 5, max_delay : float = 30.0):
+        '''
+        Recreate the pipeline of the device with its previous config, retrying with a backoff. Raises a
+        RuntimeError when the device is still not back after the attempts (e.g. it was unplugged), which
+        ends capture() so the application can exit or restart it.
+        '''
+        import depthai
+
+        delay = 1.0
+        for attempt in range(1, attempts + 1):
+            depthai.deinit_device()
+            try:
+                return DepthAI.create_pipeline(pipeline_config, self.__device_id)
+            except RuntimeError:
+                if attempt == attempts:
+                    break
+                log.exception(f'Restoring the pipeline failed, retrying in {delay:.0f} s')
+                time.sleep(delay)
+                delay = min(delay * 2, max_delay)
+        log.error(f'Restoring the pipeline failed {attempts} times raising a RuntimeError')
+        raise RuntimeError('The device pipeline could not be restored. Try to reset the device.')
+
+    def __keep(self, packet) -> bool:
+        '''Whether the frame of a packet is kept at the rate of the rate controller.'''
+        if self.__decimator is None or self.__decimator.keep(packet_key(packet)[1]):
+            return True
+        self.__decimated.inc()
+        return False
+
+
+    async def capture_async(self, executor : ThreadPoolExecutor = None):
+        '''
+        capture() as an asynchronous generator, for an asyncio application. The packets are polled
+        and decoded on the executor (by default a thread of its own), so waiting for the device does
+        not hold up the event loop.
+        '''
+        loop = asyncio.get_running_loop()
+        owns_executor = executor is None
+        if owns_executor:
+            executor = ThreadPoolExecutor(1, thread_name_prefix=f'depthai-capture-{self.__stream_id}')
+        frames = self.capture()
+        try:
+            while True:
+                item = await loop.run_in_executor(executor, next, frames, None)
+                if item is None:
+                    return
+                yield item
+        finally:
+            try:
+                frames.close()
+            except ValueError:
+                # Cancelled while the executor is still waiting for packets, the generator is left to it.
+                pass
+            if owns_executor:
+                executor.shutdown(wait=False)
 
 
     def __del__(self):
         del self.__pipeline
-        depthai.deinit_device()
\ No newline at end of file
+        if self.__owns_device:
+            import depthai
+
+            depthai.deinit_device()
\ No newline at end of file
@@ -0,0 +1,451 @@
+import json
+import logging as log
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+from typing import Iterator, List
+
+import numpy as np
+
+JOURNAL_MAGIC = b'DETJRNL1'
+JOURNAL_VERSION = 1
+SEGMENT_SUFFIX = '.djl'
+INDEX_SUFFIX = '.idx'
+
+# magic, version, frame record size, box record size, reserved, bytes used, creation time, metadata length.
+# The JSON metadata (streams and labels) follows, the records start at HEADER_SIZE.
+_HEADER = struct.Struct('<8sHHHHQdI')
+_USED = struct.Struct('<Q')
+_USED_OFFSET = 16
+HEADER_SIZE = 4096
+
+FRAME_DTYPE = np.dtype([('frame_id', '<u4'), ('stream', '<u2'), ('box_count', '<u2'), ('timestamp', '<f8')])
+BOX_DTYPE = np.dtype([('obj_id', '<i4'), ('class_id', '<i4'),
+                      ('x1', '<f4'), ('y1', '<f4'), ('x2', '<f4'), ('y2', '<f4'), ('probability', '<f4'),
+                      ('dist_x', '<f4'), ('dist_y', '<f4'), ('dist_z', '<f4')])
+# An index entry is the frame record plus its offset in the segment.
+INDEX_DTYPE = np.dtype(FRAME_DTYPE.descr + [('offset', '<u8')])
+# The frames read back; first_box is the position of the frame's first box in the boxes array.
+READ_DTYPE = np.dtype(FRAME_DTYPE.descr + [('first_box', '<i8')])
+MAX_BOXES = np.iinfo(np.uint16).max
+
+# The frames and boxes read from a segment, with the (engine_id, stream_id) indexed by the stream
+# field of the frames and the class labels of the class_id of the boxes.
+JournalFrames = namedtuple('JournalFrames', ['frames', 'boxes', 'streams', 'labels'])
+
+
+def _segment_name(prefix: str, sequence: int) -> str:
+    return f'{prefix}-{sequence:06d}{SEGMENT_SUFFIX}'
+
+
+def _segments(directory: Path, prefix: str) -> List[Path]:
+    '''The segments of a journal, oldest first.'''
+    return sorted(directory.glob(f'{prefix}-[0-9][0-9][0-9][0-9][0-9][0-9]{SEGMENT_SUFFIX}'))
+
+
+class DetectionJournal:
+    '''
+    Appends the detections of every frame to a local journal of fixed-size binary records, for audits
+    and reprocessing of what was (or would have been) published.
+
+    A frame is a FRAME_DTYPE record (frame_id, stream, box count and capture timestamp) followed by a
+    BOX_DTYPE record per box; the string fields of the boxes are not kept, class labels are recovered
+    from the class_id. The records are copied straight into a memory-mapped segment file of
+    segment_bytes, preallocated when it is created, and the number of bytes used is updated in its
+    header after every frame, so a frame costs a couple of memory copies and no system call. Every
+    frame also gets an INDEX_DTYPE entry in the sidecar .idx file of the segment, mapping its
+    frame_id and timestamp to its offset.
+
+    The mapped pages are flushed to storage every flush_interval seconds. A new segment is started
+    when the current one is full or segment_seconds old, the oldest segments are deleted beyond
+    max_segments or max_total_bytes.
+    '''
+
+    def __init__(self, directory: str, prefix: str = 'detections', segment_bytes: int = 64 << 20,
+                 segment_seconds: float = 3600.0, max_segments: int = 48, max_total_bytes: int = None,
+                 flush_interval: float = 5.0, labels: List[str] = None):
+        self.directory = Path(directory)
+        self.prefix = prefix
+        self.segment_bytes = max(segment_bytes, HEADER_SIZE + FRAME_DTYPE.itemsize)
+        self.segment_seconds = segment_seconds
+        self.max_segments = max_segments
+        self.max_total_bytes = max_total_bytes
+        self.flush_interval = flush_interval
+        self.labels = list(labels) if labels is not None else None
+        self.__streams = []
+        self.__stream_index = {}
+        self.__lock = threading.Lock()
+        self.__file = None
+        self.__mmap = None
+        self.__index = None
+        self.__entry = np.zeros(1, dtype=INDEX_DTYPE)
+        self.__used = 0
+        self.__size = 0
+        self.__opened = 0.0
+        self.__opened_at = 0.0
+        self.__flushed = 0.0
+        self.__frames = 0
+        self.__boxes = 0
+        self.__segments = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+        existing = _segments(self.directory, prefix)
+        self.__sequence = int(existing[-1].stem.rsplit('-', 1)[1]) if existing else 0
+
+    @property
+    def stats(self) -> dict:
+        return {'frames': self.__frames, 'boxes': self.__boxes, 'segments': self.__segments}
+
+    def __metadata(self) -> bytes:
+        metadata = json.dumps({'streams': self.__streams, 'labels': self.labels}).encode('utf-8')
+        if _HEADER.size + len(metadata) > HEADER_SIZE:
+            raise ValueError('The journal streams and labels do not fit in the segment header')
+        return metadata
+
+    def __write_header(self) -> None:
+        metadata = self.__metadata()
+        _HEADER.pack_into(self.__mmap, 0, JOURNAL_MAGIC, JOURNAL_VERSION, FRAME_DTYPE.itemsize, BOX_DTYPE.itemsize,
+                          0, self.__used, self.__opened_at, len(metadata))
+        self.__mmap[_HEADER.size:_HEADER.size + len(metadata)] = metadata
+
+    def __open_segment(self, needed: int) -> None:
+        self.__close_segment()
+        self.__sequence += 1
+        path = self.directory / _segment_name(self.prefix, self.__sequence)
+        size = max(self.segment_bytes, HEADER_SIZE + needed)
+        self.__file = open(path, 'w+b')
+        # Allocate the whole segment up front, so appending never extends (and fragments) the file.
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(self.__file.fileno(), 0, size)
+        else:
+            self.__file.truncate(size)
+        self.__mmap = mmap.mmap(self.__file.fileno(), size)
+        self.__index = open(path.with_suffix(INDEX_SUFFIX), 'wb', buffering=1 << 16)
+        self.__size = size
+        self.__used = HEADER_SIZE
+        self.__opened = time.monotonic()
+        self.__opened_at = time.time()
+        self.__flushed = self.__opened
+        self.__write_header()
+        self.__segments += 1
+        self.__apply_retention()
+
+    def __close_segment(self) -> None:
+        if self.__mmap is None:
+            return
+        self.__mmap.flush()
+        self.__mmap.close()
+        # Give back the preallocated space the segment did not use.
+        self.__file.truncate(self.__used)
+        self.__file.close()
+        self.__index.close()
+        self.__file = self.__mmap = self.__index = None
+
+    def __apply_retention(self) -> None:
+        segments = _segments(self.directory, self.prefix)
+        sizes = [s.stat().st_size for s in segments]
+        total = sum(sizes)
+        count = len(segments)
+        # The segment being written is the newest and is never removed.
+        for segment, size in zip(segments[:-1], sizes[:-1]):
+            over_count = self.max_segments is not None and count > self.max_segments
+            over_size = self.max_total_bytes is not None and total > self.max_total_bytes
+            if not over_count and not over_size:
+                break
+            for path in (segment, segment.with_suffix(INDEX_SUFFIX)):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    log.warning(f'Could not remove journal file {path}: {e}')
+            count -= 1
+            total -= size
+
+    def __stream(self, engine_id: str, stream_id: str) -> int:
+        key = (engine_id, stream_id)
+        index = self.__stream_index.get(key)
+        if index is None:
+            index = self.__stream_index[key] = len(self.__streams)
+            self.__streams.append(key)
+            if self.__mmap is not None:
+                self.__write_header()
+        return index
+
+    def append(self, boxes, timestamp: float = None) -> None:
+        '''
+        Journal the detections of a frame (a PyDepthDetectionBox) captured at timestamp, in seconds
+        since the epoch (now by default).
+        '''
+        timestamp = time.time() if timestamp is None else timestamp
+        batch = boxes.batch
+        count = len(batch)
+        if count > MAX_BOXES:
+            log.warning(f'Only journaling {MAX_BOXES} of the {count} boxes of frame {boxes.frame_id}')
+            count = MAX_BOXES
+        needed = FRAME_DTYPE.itemsize + count * BOX_DTYPE.itemsize
+        with self.__lock:
+            if self.labels is None and batch.labels is not None:
+                self.labels = list(batch.labels)
+                if self.__mmap is not None:
+                    self.__write_header()
+            now = time.monotonic()
+            if self.__mmap is None or self.__used + needed > self.__size or \
+                    now - self.__opened >= self.segment_seconds:
+                self.__open_segment(needed)
+            entry = self.__entry[0]
+            entry['frame_id'] = boxes.frame_id
+            entry['stream'] = self.__stream(boxes.engine_id, boxes.stream_id)
+            entry['box_count'] = count
+            entry['timestamp'] = timestamp
+            entry['offset'] = self.__used
+            offset = self.__used
+            self.__mmap[offset:offset + FRAME_DTYPE.itemsize] = self.__entry.tobytes()[:FRAME_DTYPE.itemsize]
+            if count > 0:
+                records = np.ndarray(count, dtype=BOX_DTYPE, buffer=self.__mmap,
+                                     offset=offset + FRAME_DTYPE.itemsize)
+                for name in BOX_DTYPE.names:
+                    records[name] = batch.column(name)[:count]
+                del records
+            self.__used = offset + needed
+            _USED.pack_into(self.__mmap, _USED_OFFSET, self.__used)
+            self.__index.write(self.__entry.tobytes())
+            self.__frames += 1
+            self.__boxes += count
+            if now - self.__flushed >= self.flush_interval:
+                self.__flush(now)
+
+    def __flush(self, now: float) -> None:
+        self.__mmap.flush()
+        self.__index.flush()
+        self.__flushed = now
+
+    def flush(self) -> None:
+        '''Write the journaled frames through to storage.'''
+        with self.__lock:
+            if self.__mmap is not None:
+                self.__flush(time.monotonic())
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__close_segment()
+
+
+class _Segment:
+    '''The header and index of a journal segment.'''
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < _HEADER.size:
+            raise ValueError(f'{path} is not a detection journal segment')
+        magic, version, frame_size, box_size, _, used, created, metadata_len = _HEADER.unpack_from(header)
+        if magic != JOURNAL_MAGIC:
+            raise ValueError(f'{path} is not a detection journal segment')
+        if version != JOURNAL_VERSION or frame_size != FRAME_DTYPE.itemsize or box_size != BOX_DTYPE.itemsize:
+            raise ValueError(f'Unsupported journal version {version} in {path}')
+        metadata = json.loads(header[_HEADER.size:_HEADER.size + metadata_len].decode('utf-8'))
+        self.used = used
+        self.created = created
+        self.streams = [tuple(s) for s in metadata['streams']]
+        self.labels = metadata['labels']
+        self.index = self.__load_index()
+
+    def __load_index(self) -> np.ndarray:
+        '''The index entries of the frames in the segment, completed from the records if it is behind.'''
+        index_path = self.path.with_suffix(INDEX_SUFFIX)
+        index = np.zeros(0, dtype=INDEX_DTYPE)
+        if index_path.exists():
+            raw = index_path.read_bytes()
+            index = np.frombuffer(raw[:len(raw) - len(raw) % INDEX_DTYPE.itemsize], dtype=INDEX_DTYPE)
+        # Entries past the bytes used were written after the last header update survived a crash.
+        index = index[index['offset'] + FRAME_DTYPE.itemsize + index['box_count'].astype(np.uint64) *
+                      BOX_DTYPE.itemsize <= self.used]
+        offset = int(index['offset'][-1]) + FRAME_DTYPE.itemsize + int(index['box_count'][-1]) * BOX_DTYPE.itemsize \
+            if len(index) else HEADER_SIZE
+        if offset >= self.used:
+            return index
+        # The index is flushed less often than the records, rebuild the entries it is missing.
+        entries = []
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            while offset + FRAME_DTYPE.itemsize <= self.used:
+                frame = np.frombuffer(f.read(FRAME_DTYPE.itemsize), dtype=FRAME_DTYPE)[0]
+                size = FRAME_DTYPE.itemsize + int(frame['box_count']) * BOX_DTYPE.itemsize
+                if offset + size > self.used:
+                    break
+                entries.append((frame['frame_id'], frame['stream'], frame['box_count'], frame['timestamp'], offset))
+                offset += size
+                f.seek(offset)
+        return np.concatenate((index, np.array(entries, dtype=INDEX_DTYPE)))
+
+    def read(self, selected: np.ndarray) -> JournalFrames:
+        '''The frames and boxes of the selected index entries.'''
+        counts = selected['box_count'].astype(np.int64)
+        frames = np.zeros(len(selected), dtype=READ_DTYPE)
+        for name in FRAME_DTYPE.names:
+            frames[name] = selected[name]
+        frames['first_box'] = np.cumsum(counts) - counts
+        total = int(counts.sum())
+        if total == 0:
+            return JournalFrames(frames, np.zeros(0, dtype=BOX_DTYPE), self.streams, self.labels)
+        data = np.memmap(self.path, dtype=np.uint8, mode='r', shape=(self.used,))
+        try:
+            # The byte offset of every box record, then every byte of them, gathered in one indexing.
+            starts = np.repeat(selected['offset'].astype(np.int64) + FRAME_DTYPE.itemsize, counts) + \
+                (np.arange(total) - np.repeat(frames['first_box'], counts)) * BOX_DTYPE.itemsize
+            boxes = data[starts[:, None] + np.arange(BOX_DTYPE.itemsize)].view(BOX_DTYPE).reshape(total)
+        finally:
+            del data
+        return JournalFrames(frames, boxes, self.streams, self.labels)
+
+
+class DetectionJournalReader:
+    '''
+    Reads back the frames of a DetectionJournal, selected by time range, frame_id and stream through
+    the segment indexes, as NumPy arrays or as PyDepthDetectionBox samples to re-publish. The segment
+    being written can be read too, up to its last frame recorded in the header.
+    '''
+
+    def __init__(self, directory: str, prefix: str = 'detections'):
+        self.directory = Path(directory)
+        self.prefix = prefix
+
+    def segments(self) -> List[Path]:
+        return _segments(self.directory, self.prefix)
+
+    def __selected(self, segment: _Segment, start: float, end: float, frame_ids, stream_id: str) -> np.ndarray:
+        index = segment.index
+        mask = np.ones(len(index), dtype=bool)
+        if start is not None:
+            mask &= index['timestamp'] >= start
+        if end is not None:
+            mask &= index['timestamp'] < end
+        if frame_ids is not None:
+            mask &= np.isin(index['frame_id'], np.asarray(frame_ids, dtype=np.uint32))
+        if stream_id is not None:
+            streams = [i for i, (_, s) in enumerate(segment.streams) if s == stream_id]
+            mask &= np.isin(index['stream'], streams)
+        return index[mask]
+
+    def read(self, start: float = None, end: float = None, frame_ids=None, stream_id: str = None) -> \
+            Iterator[JournalFrames]:
+        '''
+        The frames captured in [start, end) (seconds since the epoch), with one of frame_ids and from
+        stream_id when given, one JournalFrames per segment that has any.
+        '''
+        for path in self.segments():
+            try:
+                segment = _Segment(path)
+            except (OSError, ValueError) as e:
+                # The oldest segment can be deleted by the journal while it is being read.
+                log.warning(f'Skipping journal segment {path}: {e}')
+                continue
+            index = segment.index
+            if len(index) == 0 or (start is not None and index['timestamp'].max() < start) or \
+                    (end is not None and index['timestamp'].min() >= end):
+                continue
+            selected = self.__selected(segment, start, end, frame_ids, stream_id)
+            if len(selected) > 0:
+                yield segment.read(selected)
+
+    def samples(self, start: float = None, end: float = None, frame_ids=None, stream_id: str = None) -> Iterator:
+        '''The (timestamp, PyDepthDetectionBox) of the frames selected as for read().'''
+        from datacls import DetectionBatch, PyDepthDetectionBox
+
+        for chunk in self.read(start, end, frame_ids, stream_id):
+            for frame in chunk.frames:
+                first, count = int(frame['first_box']), int(frame['box_count'])
+                batch = DetectionBatch(max(count, 1), chunk.labels)
+                boxes = chunk.boxes[first:first + count]
+                batch.extend(count, **{name: boxes[name] for name in BOX_DTYPE.names})
+                engine_id, stream_id_ = chunk.streams[frame['stream']]
+                yield float(frame['timestamp']), PyDepthDetectionBox(engine_id, stream_id_, int(frame['frame_id']),
+                                                                     batch)
+
+    def republish(self, thing, start: float = None, end: float = None, frame_ids=None, stream_id: str = None,
+                  speed: float = 0.0, output: str = 'DetectionBoxData') -> int:
+        '''
+        Write the selected frames to an output of a Thing again, at speed times the pace they were
+        captured at (0 is as fast as possible). Returns the number of frames written.
+        '''
+        from datariver.utils import write_tag
+
+        written = 0
+        first = None
+        for timestamp, boxes in self.samples(start, end, frame_ids, stream_id):
+            if speed > 0:
+                if first is None:
+                    first = (timestamp, time.monotonic())
+                delay = (timestamp - first[0]) / speed - (time.monotonic() - first[1])
+                if delay > 0:
+                    time.sleep(delay)
+            write_tag(thing, output, boxes.dr_data)
+            written += 1
+        return written
+
+
+def main(argv: List[str]) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Summarize, export or re-publish a detection journal')
+    parser.add_argument('directory', help='Journal directory')
+    parser.add_argument('--prefix', default='detections', help='Segment file name prefix')
+    parser.add_argument('--start', type=float, default=None, help='First capture time (seconds since the epoch)')
+    parser.add_argument('--end', type=float, default=None, help='Capture time to stop at (seconds since the epoch)')
+    parser.add_argument('--stream', default=None, help='Only the frames of this stream_id')
+    parser.add_argument('--export', default=None, help='Save the frames and boxes to this .npz file')
+    parser.add_argument('--republish', action='store_true', help='Write the frames to the Data River again')
+    parser.add_argument('--speed', type=float, default=1.0, help='Republish pace, 0 is as fast as possible')
+    args = parser.parse_args(argv)
+    log.basicConfig(format='[ %(levelname)s ] %(message)s', level=log.INFO, stream=sys.stdout)
+
+    reader = DetectionJournalReader(args.directory, args.prefix)
+    if args.republish:
+        from adl_depthai_app import init_edge_thing
+        written = reader.republish(init_edge_thing().thing, args.start, args.end, stream_id=args.stream,
+                                   speed=args.speed)
+        log.info(f'Republished {written} frames')
+        return 0
+
+    chunks = list(reader.read(args.start, args.end, stream_id=args.stream))
+    frames = sum(len(c.frames) for c in chunks)
+    boxes = sum(len(c.boxes) for c in chunks)
+    if frames > 0:
+        first = min(c.frames['timestamp'].min() for c in chunks)
+        last = max(c.frames['timestamp'].max() for c in chunks)
+        log.info(f'{frames} frames and {boxes} boxes in {len(chunks)} segments, captured from '
+                 f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(first))} to '
+                 f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(last))}')
+    else:
+        log.info('No frames selected')
+    if args.export:
+        # The first_box of the frames of every segment is offset by the boxes of the segments before it,
+        # and their stream by the table of all the streams.
+        streams, boxes_before = [], 0
+        all_frames = [np.zeros(0, dtype=READ_DTYPE)]
+        for chunk in chunks:
+            frames = chunk.frames.copy()
+            for stream in chunk.streams:
+                if stream not in streams:
+                    streams.append(stream)
+            remap = np.array([streams.index(s) for s in chunk.streams], dtype=np.uint16)
+            frames['stream'] = remap[frames['stream']]
+            frames['first_box'] += boxes_before
+            boxes_before += len(chunk.boxes)
+            all_frames.append(frames)
+        all_boxes = np.concatenate([np.zeros(0, dtype=BOX_DTYPE)] + [c.boxes for c in chunks])
+        np.savez(args.export, frames=np.concatenate(all_frames), boxes=all_boxes,
+                 streams=np.array(streams, dtype=str).reshape(-1, 2),
+                 labels=np.array(chunks[-1].labels if chunks and chunks[-1].labels else [], dtype=str))
+        log.info(f'Exported to {args.export}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
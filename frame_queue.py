@@ -0,0 +1,125 @@
+import threading
+from collections import deque
+from enum import Enum
+
+
+class DropPolicy(Enum):
+    '''What a FrameQueue does with a new item when it is full'''
+    DROP_OLDEST = 'drop-oldest'
+    DROP_NEWEST = 'drop-newest'
+    BLOCK = 'block'
+
+
+class QueueClosed(Exception):
+    pass
+
+
+class FrameQueue:
+    '''
+    A bounded queue between the capture and the publish stages.
+
+    When the queue is full a put either discards the oldest queued item (DROP_OLDEST), discards the
+    item being put (DROP_NEWEST) or waits for room (BLOCK). The number of dropped items and the
+    depth of the queue are kept as counters.
+    '''
+
+    def __init__(self, maxsize: int = 4, policy: DropPolicy = DropPolicy.DROP_OLDEST):
+        if maxsize < 1:
+            raise ValueError('FrameQueue maxsize must be at least 1')
+        self.__maxsize = maxsize
+        self.__policy = DropPolicy(policy)
+        self.__items = deque()
+        self.__lock = threading.Lock()
+        self.__not_empty = threading.Condition(self.__lock)
+        self.__not_full = threading.Condition(self.__lock)
+        self.__closed = False
+        self.__put = 0
+        self.__dropped = 0
+        self.__max_depth = 0
+
+    @property
+    def policy(self) -> DropPolicy:
+        return self.__policy
+
+    @property
+    def maxsize(self) -> int:
+        return self.__maxsize
+
+    @property
+    def depth(self) -> int:
+        '''Number of items currently queued'''
+        with self.__lock:
+            return len(self.__items)
+
+    @property
+    def dropped(self) -> int:
+        '''Number of items dropped because the queue was full'''
+        return self.__dropped
+
+    @property
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                'depth': len(self.__items),
+                'max_depth': self.__max_depth,
+                'put': self.__put,
+                'dropped': self.__dropped,
+            }
+
+    def put(self, item, timeout: float = None) -> bool:
+        '''
+        Queue an item, returns False if the item (or, for DROP_OLDEST, an older item) was dropped.
+        Raises QueueClosed once the queue has been closed.
+        '''
+        with self.__lock:
+            if self.__closed:
+                raise QueueClosed()
+            self.__put += 1
+            accepted = True
+            if len(self.__items) >= self.__maxsize:
+                if self.__policy == DropPolicy.DROP_NEWEST:
+                    self.__dropped += 1
+                    return False
+                elif self.__policy == DropPolicy.DROP_OLDEST:
+                    self.__items.popleft()
+                    self.__dropped += 1
+                    accepted = False
+                else:
+                    if not self.__not_full.wait_for(lambda: self.__closed or len(self.__items) < self.__maxsize,
+                                                    timeout):
+                        self.__dropped += 1
+                        return False
+                    if self.__closed:
+                        raise QueueClosed()
+            self.__items.append(item)
+            self.__max_depth = max(self.__max_depth, len(self.__items))
+            self.__not_empty.notify()
+            return accepted
+
+    def get(self, timeout: float = None):
+        '''
+        Remove and return the oldest item, waiting for one if the queue is empty. Raises QueueClosed
+        once the queue is closed and drained.
+        '''
+        with self.__lock:
+            if not self.__not_empty.wait_for(lambda: self.__closed or len(self.__items) > 0, timeout):
+                raise TimeoutError('No item available in the FrameQueue')
+            if len(self.__items) == 0:
+                raise QueueClosed()
+            item = self.__items.popleft()
+            self.__not_full.notify()
+            return item
+
+    def close(self) -> None:
+        '''Stop accepting items and wake up any waiting producer or consumer.'''
+        with self.__lock:
+            self.__closed = True
+            self.__not_empty.notify_all()
+            self.__not_full.notify_all()
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.get()
+            except QueueClosed:
+                return
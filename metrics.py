@@ -0,0 +1,257 @@
+import bisect
+import logging as log
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple
+
+# Upper bounds, in seconds, of the latency histogram buckets; 100us to 2.5s.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Counter:
+    '''A value that only goes up, e.g. the number of frames captured.'''
+
+    def __init__(self):
+        self.__value = 0.0
+        self.__lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self.__lock:
+            self.__value += amount
+
+    @property
+    def value(self) -> float:
+        return self.__value
+
+
+class Gauge:
+    '''A value that goes up and down, either set or read from a function when the metrics are collected.'''
+
+    def __init__(self, function: Callable[[], float] = None):
+        self.__value = 0.0
+        self.__function = function
+
+    def set(self, value: float) -> None:
+        self.__value = value
+
+    @property
+    def value(self) -> float:
+        if self.__function is not None:
+            try:
+                return float(self.__function())
+            except Exception:
+                return math.nan
+        return self.__value
+
+
+class Histogram:
+    '''Counts of the observations per bucket and their sum, rendered cumulatively as Prometheus expects.'''
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.__counts = [0] * (len(self.buckets) + 1)
+        self.__sum = 0.0
+        self.__lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self.__lock:
+            self.__counts[i] += 1
+            self.__sum += value
+
+    @contextmanager
+    def time(self):
+        '''Observe the seconds the block took.'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        '''The (non-cumulative) count of every bucket, the last one being +Inf, and the sum.'''
+        with self.__lock:
+            return list(self.__counts), self.__sum
+
+    @property
+    def count(self) -> int:
+        return sum(self.__counts)
+
+    def quantile(self, q: float, since: Tuple[List[int], float] = None) -> float:
+        '''
+        An estimate of the q-quantile of the observations (since an earlier snapshot), interpolated
+        within the bucket it falls in. NaN when there are none.
+        '''
+        counts, _ = self.snapshot()
+        if since is not None:
+            counts = [c - s for c, s in zip(counts, since[0])]
+        total = sum(counts)
+        if total == 0:
+            return math.nan
+        rank = q * total
+        seen = 0
+        for i, c in enumerate(counts):
+            if c > 0 and seen + c >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else lower
+                return lower + (upper - lower) * (rank - seen) / c
+            seen += c
+        return self.buckets[-1]
+
+
+class MetricFamily:
+    '''The series of a metric, one per combination of label values.'''
+
+    def __init__(self, name: str, kind: str, help: str, labels: Tuple[str, ...], factory: Callable):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.label_names = labels
+        self.__factory = factory
+        self.__series = {}
+        self.__lock = threading.Lock()
+
+    def labels(self, **labels):
+        '''The series for the label values, created the first time they are used.'''
+        key = tuple(str(labels[name]) for name in self.label_names)
+        series = self.__series.get(key)
+        if series is None:
+            with self.__lock:
+                series = self.__series.setdefault(key, self.__factory())
+        return series
+
+    def add(self, series, **labels) -> None:
+        '''Use series for the label values, e.g. a Gauge read from a function.'''
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self.__lock:
+            self.__series[key] = series
+
+    @property
+    def series(self) -> Dict[tuple, object]:
+        with self.__lock:
+            return dict(self.__series)
+
+
+def _format_labels(names, values, extra: str = '') -> str:
+    escape = lambda v: v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    pairs = [f'{n}="{escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class MetricsRegistry:
+    '''
+    The metrics of the application, rendered in the Prometheus text exposition format.
+
+    Metrics are registered once by name; registering a name again returns the existing family so
+    every module can declare the metrics it updates.
+    '''
+
+    def __init__(self):
+        self.__families = {}
+        self.__lock = threading.Lock()
+
+    def __family(self, name: str, kind: str, help: str, labels: Tuple[str, ...], factory: Callable) -> MetricFamily:
+        with self.__lock:
+            family = self.__families.get(name)
+            if family is None:
+                family = self.__families[name] = MetricFamily(name, kind, help, tuple(labels), factory)
+            elif family.kind != kind:
+                raise ValueError(f'Metric {name} is already registered as a {family.kind}')
+            return family
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> MetricFamily:
+        return self.__family(name, 'counter', help, labels, Counter)
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> MetricFamily:
+        return self.__family(name, 'gauge', help, labels, Gauge)
+
+    def function(self, name: str, help: str, function: Callable[[], float], kind: str = 'gauge', **labels) -> Gauge:
+        '''
+        A gauge (or counter) read from function whenever the metrics are collected, for values another
+        object already keeps such as the depth of a queue.
+        '''
+        gauge = Gauge(function)
+        self.__family(name, kind, help, tuple(labels), Counter if kind == 'counter' else Gauge).add(gauge, **labels)
+        return gauge
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> MetricFamily:
+        return self.__family(name, 'histogram', help, labels, lambda: Histogram(buckets))
+
+    def get(self, name: str) -> MetricFamily:
+        return self.__families.get(name)
+
+    def render(self) -> str:
+        lines = []
+        with self.__lock:
+            families = sorted(self.__families.values(), key=lambda f: f.name)
+        for family in families:
+            lines.append(f'# HELP {family.name} {family.help}')
+            lines.append(f'# TYPE {family.name} {family.kind}')
+            for key, series in sorted(family.series.items()):
+                if family.kind == 'histogram':
+                    counts, total = series.snapshot()
+                    cumulative = 0
+                    for bound, count in zip(series.buckets + (math.inf,), counts):
+                        cumulative += count
+                        le = _format_labels(family.label_names, key, f'le="{_format_value(bound)}"')
+                        lines.append(f'{family.name}_bucket{le} {cumulative}')
+                    labels = _format_labels(family.label_names, key)
+                    lines.append(f'{family.name}_sum{labels} {_format_value(total)}')
+                    lines.append(f'{family.name}_count{labels} {cumulative}')
+                else:
+                    lines.append(f'{family.name}{_format_labels(family.label_names, key)} '
+                                 f'{_format_value(series.value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    '''Serves the metrics of a registry at http://host:port/metrics from a daemon thread.'''
+
+    def __init__(self, registry: 'MetricsRegistry', host: str = '127.0.0.1', port: int = 9108):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.__server = ThreadingHTTPServer((host, port), Handler)
+        self.__server.daemon_threads = True
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name='metrics-server', daemon=True)
+        self.__thread.start()
+        log.info(f'Serving metrics on http://{host}:{self.port}/metrics')
+
+    @property
+    def port(self) -> int:
+        return self.__server.server_address[1]
+
+    def close(self) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+
+
+# The metrics of the running application.
+registry = MetricsRegistry()
@@ -0,0 +1,316 @@
+import logging as log
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+from typing import List
+
+MOVIDIUS_VENDOR_ID = '03e7'
+USB_DEVICES_PATH = '/sys/bus/usb/devices'
+
+# A camera driven by a worker process; device_id is the USB port path of the device.
+DeviceSpec = namedtuple('DeviceSpec', ['device_id', 'stream_id', 'engine_id'])
+
+
+def enumerate_devices(usb_devices_path: str = USB_DEVICES_PATH) -> List[str]:
+    '''
+    The USB port paths (e.g. '1.2') of the Movidius devices attached to the host, found by their vendor
+    id in sysfs. The port path is what depthai.init_device accepts to select a device.
+    '''
+    devices = []
+    for device in sorted(Path(usb_devices_path).glob('*-*')):
+        vendor = device / 'idVendor'
+        if ':' in device.name or not vendor.exists():
+            continue
+        if vendor.read_text().strip() == MOVIDIUS_VENDOR_ID:
+            devices.append(device.name.split('-', 1)[1])
+    return devices
+
+
+def device_specs(devices_config: dict) -> List[DeviceSpec]:
+    '''
+    The devices to drive from the devices section of the app config. ids is either 'auto' to use
+    every attached device or a list of USB port paths, or of objects with device_id and optionally
+    stream_id and engine_id.
+    '''
+    ids = devices_config['ids']
+    if ids == 'auto':
+        ids = enumerate_devices()
+    specs = []
+    for n, device in enumerate(ids, start=1):
+        if isinstance(device, str):
+            device = {'device_id': device}
+        specs.append(DeviceSpec(device['device_id'],
+                                device.get('stream_id', f'mcclean.home.oakd-{n}'),
+                                device.get('engine_id', f'oakd-{n}')))
+    return specs
+
+
+class DeviceStats:
+    '''Counters of a capture worker, sent to the parent process periodically.'''
+
+    def __init__(self, spec: DeviceSpec):
+        self.device_id = spec.device_id
+        self.stream_id = spec.stream_id
+        self.frames = 0
+        self.detections = 0
+        self.dropped = 0
+        self.published = 0
+        self.started = time.monotonic()
+        self.last_frame = None
+        self.__window_start = self.started
+        self.__window_frames = 0
+        self.fps = 0.0
+
+    def frame(self, detections: int) -> None:
+        now = time.monotonic()
+        self.frames += 1
+        self.detections += detections
+        self.last_frame = now
+        self.__window_frames += 1
+        if now - self.__window_start >= 1.0:
+            self.fps = self.__window_frames / (now - self.__window_start)
+            self.__window_start = now
+            self.__window_frames = 0
+
+    def as_dict(self) -> dict:
+        return {
+            'device_id': self.device_id,
+            'stream_id': self.stream_id,
+            'frames': self.frames,
+            'detections': self.detections,
+            'dropped': self.dropped,
+            'published': self.published,
+            'fps': round(self.fps, 2),
+            'uptime': round(time.monotonic() - self.started, 1),
+        }
+
+
+def _publish_frames(frames: 'FrameQueue', publisher: 'Publisher', stats: DeviceStats,
+                    rate_controller: 'RateController') -> None:
+    '''Publish the frames a per-device worker captured until the queue is closed and drained.'''
+    for boxes, polled_at, captured_at, backlog in frames:
+        if publisher.publish(boxes, captured_at):
+            stats.published += 1
+        if rate_controller is not None:
+            rate_controller.observe(time.monotonic() - polled_at, backlog + frames.depth)
+
+
+def _capture_worker(spec: DeviceSpec, args: dict, model_label: str, app_config: dict, shared: bool,
+                    results, stop, metrics_port_offset: int = 0) -> None:
+    '''
+    Entry point of a capture worker process. With a shared Thing the detections are sent to the parent
+    to be published, otherwise the worker publishes through its own Thing, on a thread joined to the
+    capture by a FrameQueue as in Main so that a slow Data River write does not stall the device. The
+    worker serves the metrics of its process on the configured port plus metrics_port_offset, and
+    applies the changes of the runtime settings to its device (and Thing).
+    '''
+    log.basicConfig(format=f'[ %(levelname)s ] [{spec.engine_id}] %(message)s', level=log.INFO, stream=sys.stdout)
+    from adl_depthai_app import apply_runtime_change, init_acquisition, init_edge_thing, init_health_reporter, \
+        init_journal, init_metrics_server, init_pairer, init_rate_controller, init_runtime_config, init_stages, \
+        init_video_recorder, load_properties
+    from datariver.publisher import Publisher
+    from config import DepthAIConfig
+    from depthai_wrapper import DepthAI
+    from frame_queue import DropPolicy, FrameQueue
+
+    stats = DeviceStats(spec)
+    depthai = None
+    publisher = None
+    frames = None
+    publish_thread = None
+    health = None
+    video_recorder = None
+    metrics_server = init_metrics_server(app_config, metrics_port_offset)
+    try:
+        config = DepthAIConfig(args)
+        runtime_config = init_runtime_config(app_config, config)
+        if runtime_config is not None:
+            app_config = runtime_config.app_config
+        # With a shared Thing the lag of publishing is not seen by the worker, the rate is only controlled
+        # from the backlog of the device.
+        rate_controller = init_rate_controller(app_config, config)
+        video_recorder = init_video_recorder(app_config, config, spec.engine_id)
+        depthai = DepthAI(config, spec.stream_id, spec.engine_id, model_label, yield_frames=False,
+                          device_id=spec.device_id, stages=init_stages(app_config, config, video_recorder),
+                          rate_controller=rate_controller, acquisition=init_acquisition(app_config, config),
+                          pairing=app_config['pairing']['mode'], pairer=init_pairer(app_config),
+                          threshold=float(app_config['detection']['threshold']),
+                          labels=app_config['detection']['labels'])
+        if not shared:
+            properties = load_properties()
+            properties['contextId'] = f'{properties["contextId"]}.{spec.engine_id}'
+            thing = init_edge_thing(properties).thing
+            publisher = Publisher(thing, app_config, init_journal(app_config, spec.engine_id))
+            health = init_health_reporter(app_config, thing, spec.engine_id, spec.stream_id)
+            queue_config = app_config['publish_queue']
+            frames = FrameQueue(int(queue_config['size']), DropPolicy(queue_config['drop_policy']))
+            publish_thread = threading.Thread(target=_publish_frames, name='depthai-publish', daemon=True,
+                                              args=(frames, publisher, stats, rate_controller))
+            publish_thread.start()
+
+        stats_interval = float(app_config['devices']['stats_interval'])
+        next_stats = time.monotonic() + stats_interval
+        for _, boxes in depthai.capture():
+            if stop.is_set():
+                break
+            stats.frame(len(boxes.batch))
+            if shared:
+                try:
+                    results.put_nowait(('frame', spec, (boxes.frame_id, boxes.batch, depthai.captured_at)))
+                except queue.Full:
+                    stats.dropped += 1
+                if rate_controller is not None:
+                    rate_controller.observe(0.0, depthai.backlog)
+            else:
+                frames.put((boxes, depthai.polled_at, depthai.captured_at, depthai.backlog))
+                stats.dropped = frames.dropped
+            if time.monotonic() >= next_stats:
+                # The next stats replace these, they are not worth stalling the capture for.
+                try:
+                    results.put_nowait(('stats', spec, stats.as_dict()))
+                except queue.Full:
+                    pass
+                next_stats += stats_interval
+            change = runtime_config.poll() if runtime_config is not None else None
+            if change is not None:
+                try:
+                    apply_runtime_change(runtime_config, change, config, depthai,
+                                         (publisher,) if publisher is not None else ())
+                except Exception:
+                    log.exception('Applying the runtime settings failed')
+    except Exception:
+        log.exception(f'Capture worker for device {spec.device_id} failed')
+    finally:
+        if frames is not None:
+            frames.close()
+            publish_thread.join(timeout=5.0)
+        if publisher is not None:
+            publisher.close()
+        if health is not None:
+            health.close()
+        if video_recorder is not None:
+            video_recorder.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        # The parent may have stopped reading, it notices the worker exited without the message.
+        for message in (('stats', spec, stats.as_dict()), ('exit', spec, None)):
+            try:
+                results.put(message, timeout=1.0)
+            except queue.Full:
+                pass
+        del depthai
+
+
+class MultiDeviceMain:
+    '''
+    Drives several DepthAI devices from one application. Each device is captured by its own worker
+    process so the workers do not contend for the GIL, and depthai's per-process device state is
+    kept separate. The detections are either published by the parent through a single shared Thing
+    ('shared') or by each worker through a Thing of its own ('per-device').
+    '''
+
+    def __init__(self, args: dict, model_label: str, app_config: dict):
+        self.__args = args
+        self.__model_label = model_label
+        self.__app_config = app_config
+        devices_config = app_config['devices']
+        self.__shared = devices_config['publish'] == 'shared'
+        self.__specs = device_specs(devices_config)
+        if len(self.__specs) == 0:
+            raise RuntimeError('No DepthAI devices found or configured')
+        log.info(f'Driving {len(self.__specs)} DepthAI devices: {[s.device_id for s in self.__specs]}')
+        self.__context = multiprocessing.get_context('spawn')
+        queue_size = int(app_config['publish_queue']['size']) * len(self.__specs)
+        self.__results = self.__context.Queue(queue_size)
+        self.__stop = self.__context.Event()
+        self.__stats = {spec.device_id: {} for spec in self.__specs}
+        self.__published = {spec.device_id: 0 for spec in self.__specs}
+        self.__edge_thing = None
+        self.__publishers = {}
+        self.__frames = {}
+        self.__health = []
+        self.__runtime_config = None
+        if self.__shared:
+            from adl_depthai_app import init_edge_thing, init_health_reporter, init_journal, init_runtime_config
+            from datariver.publisher import Publisher
+            from metrics import registry
+            # The workers apply the runtime settings of the devices, the parent those of the shared publishers.
+            self.__runtime_config = init_runtime_config(app_config)
+            if self.__runtime_config is not None:
+                app_config = self.__runtime_config.app_config
+            self.__edge_thing = init_edge_thing()
+            self.__publishers = {spec.device_id: Publisher(self.__edge_thing.thing, app_config,
+                                                           init_journal(app_config, spec.engine_id))
+                                 for spec in self.__specs}
+            # The Health samples of the devices are written to the shared Thing, the frames are counted
+            # as they reach the parent.
+            frames = registry.counter('depthai_frames_total', 'Frames yielded by the capture', ('stream',))
+            self.__frames = {spec.device_id: frames.labels(stream=spec.stream_id) for spec in self.__specs}
+            self.__health = [init_health_reporter(app_config, self.__edge_thing.thing, spec.engine_id, spec.stream_id)
+                             for spec in self.__specs]
+            self.__health = [health for health in self.__health if health is not None]
+
+    @property
+    def stats(self) -> dict:
+        '''The latest stats reported by each device worker, keyed by device id'''
+        return dict(self.__stats)
+
+    def __publish(self, spec: DeviceSpec, frame_id: int, batch, captured_at: float) -> None:
+        from datacls import PyDepthDetectionBox
+
+        self.__frames[spec.device_id].inc()
+        boxes = PyDepthDetectionBox(spec.engine_id, spec.stream_id, frame_id, batch)
+        if self.__publishers[spec.device_id].publish(boxes, captured_at):
+            self.__published[spec.device_id] += 1
+
+    def run(self):
+        from adl_depthai_app import init_metrics_server
+
+        # The parent serves the publish metrics on the configured port, worker n those of its device on the next ones.
+        workers = [self.__context.Process(target=_capture_worker, name=f'depthai-{spec.engine_id}',
+                                          args=(spec, self.__args, self.__model_label, self.__app_config,
+                                                self.__shared, self.__results, self.__stop, n))
+                   for n, spec in enumerate(self.__specs, start=1)]
+        exited = set()
+        metrics_server = init_metrics_server(self.__app_config)
+        try:
+            for worker in workers:
+                worker.start()
+            log.info('Setup complete, processing frames')
+            while len(exited) < len(workers):
+                try:
+                    kind, spec, payload = self.__results.get(timeout=1.0)
+                except queue.Empty:
+                    # A worker that could not send its exit message is only seen to have exited.
+                    exited.update(spec.device_id for spec, worker in zip(self.__specs, workers)
+                                  if worker.exitcode is not None)
+                    continue
+                if kind == 'frame':
+                    self.__publish(spec, *payload)
+                    change = self.__runtime_config.poll() if self.__runtime_config is not None else None
+                    if change is not None:
+                        for publisher in self.__publishers.values():
+                            publisher.reconfigure(change.app_config)
+                elif kind == 'stats':
+                    if self.__shared:
+                        payload['published'] = self.__published[spec.device_id]
+                    self.__stats[spec.device_id] = payload
+                    log.info(f'Device {spec.device_id}: {payload}')
+                elif kind == 'exit':
+                    exited.add(spec.device_id)
+        finally:
+            self.__stop.set()
+            for worker in workers:
+                worker.join(timeout=5.0)
+                if worker.is_alive():
+                    worker.terminate()
+            for publisher in self.__publishers.values():
+                publisher.close()
+            for health in self.__health:
+                health.close()
+            if metrics_server is not None:
+                metrics_server.close()
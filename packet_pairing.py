@@ -0,0 +1,109 @@
+from collections import deque, namedtuple
+
+LATEST = 'latest'
+SEQUENCE = 'sequence'
+INFERENCE = 'inference'
+MODES = (LATEST, SEQUENCE, INFERENCE)
+
+# A preview frame or NN result waiting to be paired; its device sequence number (-1 when unknown),
+# device timestamp in seconds and the packet.
+Pending = namedtuple('Pending', ['sequence_num', 'timestamp', 'packet'])
+
+
+def packet_key(packet) -> (int, float):
+    '''The device (sequence number, timestamp) of a packet, (-1, 0.0) when it has no metadata.'''
+    try:
+        metadata = packet.getMetadata()
+        return int(metadata.getSequenceNum()), float(metadata.getTimestamp())
+    except (AttributeError, RuntimeError):
+        return -1, 0.0
+
+
+class PacketPairer:
+    '''
+    Pairs every NN result with the preview frame the NN ran on, through a reorder buffer of up to
+    window frames and window results, as the nnet and previewout packets of a frame do not always
+    arrive in the same poll.
+
+    A frame and a result are paired by their device sequence number, or when either has none by
+    their timestamps being less than tolerance seconds apart. Both streams arrive in order, so a
+    frame older than the oldest result waiting will never get one (the NN skipped it) and is dropped,
+    as is a result older than the oldest frame waiting (its frame was dropped, e.g. by the rate
+    control). The oldest entries are also dropped when more than window are waiting.
+    '''
+
+    def __init__(self, window: int = 16, tolerance: float = 0.015):
+        self.window = window
+        self.tolerance = tolerance
+        self.__frames = deque()
+        self.__results = deque()
+        self.__unpaired_frames = 0
+        self.__unpaired_results = 0
+
+    @property
+    def stats(self) -> dict:
+        return {'unpaired_frames': self.__unpaired_frames, 'unpaired_results': self.__unpaired_results,
+                'waiting_frames': len(self.__frames), 'waiting_results': len(self.__results)}
+
+    def __compare(self, frame: Pending, result: Pending) -> int:
+        '''Negative when the frame is older than the result, positive when newer, 0 when they pair.'''
+        if frame.sequence_num >= 0 and result.sequence_num >= 0:
+            return frame.sequence_num - result.sequence_num
+        if frame.timestamp < result.timestamp - self.tolerance:
+            return -1
+        if frame.timestamp > result.timestamp + self.tolerance:
+            return 1
+        return 0
+
+    def add_frame(self, packet) -> list:
+        '''Add a preview frame, returns the (frame, result) packet pairs completed.'''
+        self.__frames.append(Pending(*packet_key(packet), packet))
+        return self.__pair()
+
+    def add_result(self, packet) -> list:
+        '''Add a NN result, returns the (frame, result) packet pairs completed.'''
+        self.__results.append(Pending(*packet_key(packet), packet))
+        return self.__pair()
+
+    def keep_frame(self, packet) -> None:
+        '''Keep a preview frame for frame_for() only, beyond window the oldest are dropped uncounted.'''
+        self.__frames.append(Pending(*packet_key(packet), packet))
+        if len(self.__frames) > self.window:
+            self.__frames.popleft()
+
+    def clear(self) -> None:
+        '''Drop the frames and results waiting uncounted, e.g. when the sequence numbers start over.'''
+        self.__frames.clear()
+        self.__results.clear()
+
+    def frame_for(self, packet):
+        '''The preview frame waiting that the NN result packet ran on, None when it has not arrived.'''
+        result = Pending(*packet_key(packet), packet)
+        for frame in reversed(self.__frames):
+            order = self.__compare(frame, result)
+            if order == 0:
+                return frame.packet
+            if order < 0:
+                break
+        return None
+
+    def __pair(self) -> list:
+        frames, results = self.__frames, self.__results
+        pairs = []
+        while frames and results:
+            order = self.__compare(frames[0], results[0])
+            if order == 0:
+                pairs.append((frames.popleft().packet, results.popleft().packet))
+            elif order < 0:
+                frames.popleft()
+                self.__unpaired_frames += 1
+            else:
+                results.popleft()
+                self.__unpaired_results += 1
+        while len(frames) > self.window:
+            frames.popleft()
+            self.__unpaired_frames += 1
+        while len(results) > self.window:
+            results.popleft()
+            self.__unpaired_results += 1
+        return pairs
@@ -0,0 +1,110 @@
+import threading
+import time
+
+
+class RateController:
+    '''
+    Adjusts the frame rate the pipeline processes within [min_fps, max_fps] from how far the host
+    lags behind the device (additive increase, multiplicative decrease).
+
+    observe() is given, for every frame published, the seconds from the packet being polled to the
+    publish completing and the backlog (frames polled together in excess of one, plus the frames
+    waiting in the publish queue). Every interval seconds the rate is lowered by the decrease factor
+    when the mean lag was above target_lag or the backlog reached max_backlog, and raised by increase
+    frames per second when the lag was below half the target with no backlog.
+    '''
+
+    def __init__(self, min_fps: float = 5.0, max_fps: float = 30.0, target_lag: float = 0.2, max_backlog: int = 2,
+                 decrease: float = 0.75, increase: float = 1.0, interval: float = 1.0):
+        if not 0 < min_fps <= max_fps:
+            raise ValueError('RateController needs 0 < min_fps <= max_fps')
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.target_lag = target_lag
+        self.max_backlog = max_backlog
+        self.decrease = decrease
+        self.increase = increase
+        self.interval = interval
+        self.__rate = max_fps
+        self.__window_start = None
+        self.__lag_sum = 0.0
+        self.__samples = 0
+        self.__backlog = 0
+        self.__decreases = 0
+        self.__increases = 0
+        self.__lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        '''The frames per second to process'''
+        return self.__rate
+
+    @property
+    def limiting(self) -> bool:
+        '''Whether the rate is below max_fps'''
+        return self.__rate < self.max_fps
+
+    @property
+    def stats(self) -> dict:
+        return {'rate': round(self.__rate, 2), 'decreases': self.__decreases, 'increases': self.__increases}
+
+    def observe(self, lag: float, backlog: int = 0, now: float = None) -> float:
+        '''Record the lag and backlog of a frame, returns the (possibly adjusted) rate.'''
+        now = time.monotonic() if now is None else now
+        with self.__lock:
+            if self.__window_start is None:
+                self.__window_start = now
+            self.__lag_sum += lag
+            self.__samples += 1
+            self.__backlog = max(self.__backlog, backlog)
+            if now - self.__window_start >= self.interval:
+                self.__adjust(self.__lag_sum / self.__samples, self.__backlog)
+                self.__window_start, self.__lag_sum, self.__samples, self.__backlog = now, 0.0, 0, 0
+            return self.__rate
+
+    def __adjust(self, lag: float, backlog: int) -> None:
+        if lag > self.target_lag or backlog >= self.max_backlog:
+            rate = max(self.min_fps, self.__rate * self.decrease)
+            if rate < self.__rate:
+                self.__decreases += 1
+        elif lag < self.target_lag / 2 and backlog == 0:
+            rate = min(self.max_fps, self.__rate + self.increase)
+            if rate > self.__rate:
+                self.__increases += 1
+        else:
+            return
+        self.__rate = rate
+
+
+class FrameDecimator:
+    '''
+    Keeps the frames of a stream at a RateController's rate, by their device timestamps, so the
+    frames above it are dropped before they are decoded, encoded or published.
+    '''
+
+    # A frame up to this fraction of a period early is kept, for the jitter of the device timestamps.
+    TOLERANCE = 0.1
+
+    def __init__(self, controller: RateController):
+        self.controller = controller
+        self.__next_due = None
+        self.__dropped = 0
+
+    @property
+    def dropped(self) -> int:
+        return self.__dropped
+
+    def keep(self, timestamp: float) -> bool:
+        if not self.controller.limiting:
+            self.__next_due = None
+            return True
+        period = 1.0 / self.controller.rate
+        if self.__next_due is not None and timestamp < self.__next_due - self.TOLERANCE * period:
+            self.__dropped += 1
+            return False
+        # Catch up rather than bursting when frames were missing for more than a period.
+        if self.__next_due is None or timestamp - self.__next_due > period:
+            self.__next_due = timestamp + period
+        else:
+            self.__next_due += period
+        return True
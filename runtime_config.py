@@ -0,0 +1,158 @@
+import copy
+import json
+import logging as log
+import os
+import time
+from collections import namedtuple
+from typing import List
+
+from metrics import registry
+
+PIPELINE = 'pipeline'
+# The app settings sections the running application applies between frames, the others need a restart.
+LIVE_SECTIONS = ('detection', 'occupancy', 'publish_policy', 'batching', 'tracker', 'roi_depth', 'second_stage')
+
+SETTING_CHANGES = registry.counter('depthai_setting_changes_total',
+                                   'Settings changed in the runtime config file, by how they were applied', ('applied',))
+
+# A change of the runtime settings; the new app settings and device pipeline config, and the dotted
+# names of the settings changed that are applied live, need the device pipeline to be rebuilt, or
+# need a restart (those keep their previous value).
+RuntimeChange = namedtuple('RuntimeChange', ['app_config', 'pipeline', 'live', 'rebuild', 'restart'])
+
+
+def merged(base: dict, overrides: dict) -> dict:
+    '''A copy of base with the values of overrides, nested dicts are merged key by key.'''
+    result = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = merged(result[key], value)
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+
+def changed_settings(old: dict, new: dict, prefix: str = '') -> List[str]:
+    '''The dotted names of the settings that differ between two nested dicts of settings.'''
+    changed = []
+    for key in sorted(set(old) | set(new), key=str):
+        name = f'{prefix}{key}'
+        old_value, new_value = old.get(key), new.get(key)
+        if isinstance(old_value, dict) and isinstance(new_value, dict):
+            changed.extend(changed_settings(old_value, new_value, f'{name}.'))
+        elif old_value != new_value or key not in old or key not in new:
+            changed.append(name)
+    return changed
+
+
+class RuntimeConfig:
+    '''
+    Watches a JSON file of settings to change while the application runs. The file has the sections
+    of app.json, any setting it holds overrides that of the app settings, and a 'pipeline' section
+    whose settings override those of the device pipeline config (as -co does), e.g.
+
+        {"detection": {"threshold": 0.6}, "pipeline": {"depth": {"confidence_threshold": 0.7}}}
+
+    The overrides are read once when it is created, app_config and pipeline are the settings to
+    start with. poll() then checks the modification time and size of the file every interval
+    seconds, and when it changed returns the settings changed, sorted by how they can be applied:
+
+    - live: the settings of the LIVE_SECTIONS, applied on the host between frames
+    - rebuild: the settings of the pipeline, applied by rebuilding the device pipeline
+    - restart: the other app settings, which are not applied and keep their value
+
+    Removing a setting from the file (or the file) reverts it to its value at startup. A file that
+    cannot be read or parsed is logged and ignored until it changes again. When pipeline is None the
+    pipeline section is ignored, for a process that does not drive a device.
+    '''
+
+    def __init__(self, path: str, app_config: dict, pipeline: dict = None, interval: float = 1.0):
+        self.path = path
+        self.interval = interval
+        self.__base_app_config = copy.deepcopy(app_config)
+        self.__base_pipeline = copy.deepcopy(pipeline) if pipeline is not None else None
+        self.__stamp = self.__file_stamp()
+        self.__next_check = time.monotonic() + interval
+        overrides = self.__load() if self.__stamp is not None else {}
+        self.app_config, self.pipeline = self.__settings(overrides or {})
+
+    def __file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def __load(self) -> dict:
+        '''The overrides of the file, None when it cannot be used.'''
+        try:
+            with open(self.path) as f:
+                overrides = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning(f'Could not read the runtime settings {self.path}: {e}')
+            return None
+        if not isinstance(overrides, dict) or not all(isinstance(v, dict) for v in overrides.values()):
+            log.warning(f'The runtime settings {self.path} must be an object of sections, ignoring them')
+            return None
+        return overrides
+
+    def __settings(self, overrides: dict) -> (dict, dict):
+        app_overrides = {section: values for section, values in overrides.items() if section != PIPELINE}
+        app_config = merged(self.__base_app_config, app_overrides)
+        if self.__base_pipeline is None:
+            return app_config, None
+        return app_config, merged(self.__base_pipeline, overrides.get(PIPELINE, {}))
+
+    def poll(self, now: float = None) -> RuntimeChange:
+        '''The change of the settings since the previous poll, None when there is none.'''
+        now = time.monotonic() if now is None else now
+        if now < self.__next_check:
+            return None
+        self.__next_check = now + self.interval
+        stamp = self.__file_stamp()
+        if stamp == self.__stamp:
+            return None
+        self.__stamp = stamp
+        overrides = self.__load() if stamp is not None else {}
+        if overrides is None:
+            return None
+        app_config, pipeline = self.__settings(overrides)
+        live, restart = [], []
+        for name in changed_settings(self.app_config, app_config):
+            (live if name.split('.')[0] in LIVE_SECTIONS else restart).append(name)
+        rebuild = []
+        if pipeline is not None:
+            rebuild = [f'{PIPELINE}.{name}' for name in changed_settings(self.pipeline, pipeline)]
+        for section in {name.split('.')[0] for name in restart}:
+            if section in self.app_config:
+                app_config[section] = self.app_config[section]
+            else:
+                del app_config[section]
+        if not (live or rebuild or restart):
+            return None
+        self.app_config, self.pipeline = app_config, pipeline
+        change = RuntimeChange(app_config, pipeline, live, rebuild, restart)
+        self.__report(change)
+        return change
+
+    def pipeline_applied(self, pipeline: dict) -> None:
+        '''
+        Record the pipeline config in effect after a rebuild. When the config changed to could not be
+        applied it is rolled back, so the next change of the file is compared to (and retries) it.
+        '''
+        if pipeline is None or self.pipeline is None or pipeline == self.pipeline:
+            return
+        log.warning(f'Rolled back the runtime settings not applied: '
+                    f'{", ".join(f"{PIPELINE}.{name}" for name in changed_settings(pipeline, self.pipeline))}')
+        self.pipeline = copy.deepcopy(pipeline)
+
+    def __report(self, change: RuntimeChange) -> None:
+        if change.live:
+            log.info(f'Applying the runtime settings changed between frames: {", ".join(change.live)}')
+            SETTING_CHANGES.labels(applied='live').inc(len(change.live))
+        if change.rebuild:
+            log.info(f'Rebuilding the device pipeline for the runtime settings changed: {", ".join(change.rebuild)}')
+            SETTING_CHANGES.labels(applied='rebuild').inc(len(change.rebuild))
+        if change.restart:
+            log.warning(f'Not applying the runtime settings changed that need a restart: {", ".join(change.restart)}')
+            SETTING_CHANGES.labels(applied='restart').inc(len(change.restart))
@@ -0,0 +1,77 @@
+import logging as log
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+def process_start() -> float:
+    '''
+    The time.monotonic() at which the process started, so the report includes the interpreter startup.
+    Falls back to now where /proc is not available.
+    '''
+    try:
+        with open('/proc/self/stat') as f:
+            # The fields after the command name, which may contain spaces, start at its closing bracket.
+            started_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        age = uptime - started_ticks / os.sysconf('SC_CLK_TCK')
+        return time.monotonic() - max(age, 0.0)
+    except (OSError, ValueError, IndexError):
+        return time.monotonic()
+
+
+class StartupTimer:
+    '''
+    Records how long each phase of the startup took and when it started, relative to the start of the
+    process. Phases may run on different threads and overlap. Milestones (e.g. the first frame) are
+    recorded with mark().
+    '''
+
+    def __init__(self, start: float = None):
+        self.start = process_start() if start is None else start
+        self.__phases = []
+        self.__marks = {}
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        began = time.monotonic()
+        try:
+            yield
+        finally:
+            ended = time.monotonic()
+            with self.__lock:
+                self.__phases.append((name, began - self.start, ended - began, threading.current_thread().name))
+
+    def mark(self, name: str) -> bool:
+        '''Record a milestone the first time it is reached, returns whether this call recorded it.'''
+        with self.__lock:
+            if name in self.__marks:
+                return False
+            self.__marks[name] = time.monotonic() - self.start
+            return True
+
+    @property
+    def report(self) -> dict:
+        '''The start and duration (seconds since the process started) of every phase, and the milestones'''
+        with self.__lock:
+            phases = sorted(self.__phases, key=lambda phase: phase[1])
+            return {
+                'phases': [{'name': name, 'start': round(start, 4), 'seconds': round(seconds, 4), 'thread': thread}
+                           for name, start, seconds, thread in phases],
+                'marks': {name: round(at, 4) for name, at in self.__marks.items()},
+            }
+
+    def log_report(self) -> None:
+        report = self.report
+        for phase in report['phases']:
+            log.info(f'Startup {phase["name"]:<12} at {phase["start"]:7.3f}s took {phase["seconds"]:7.3f}s '
+                     f'({phase["thread"]})')
+        for name, at in report['marks'].items():
+            log.info(f'Startup {name} at {at:.3f}s')
+
+
+# The timer of the running application, started when the process started.
+startup_timer = StartupTimer()
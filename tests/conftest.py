@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The modules of the application are imported from the root of the repository, as when it runs.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import datariver_standin
+
+# The datacls import adlinktech.datariver, the stand-in is used where the Edge SDK is not installed.
+datariver_standin.install()
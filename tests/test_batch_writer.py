@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+from benchmarks.datariver_standin import Thing
+from datacls import DetectionBatch, PyDepthDetectionBox
+from datariver.batch_writer import BatchWriter
+
+
+class FailingThing(Thing):
+    '''Fails the first failures writes.'''
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def write(self, output, *args):
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError('Data River write failed')
+        super().write(output, *args)
+
+
+def boxes(frame_id, stream_id='camera-1'):
+    batch = DetectionBatch(labels=['background', 'person'])
+    batch.append(class_id=1, x1=0.1, y1=0.2, x2=0.3, y2=0.6, probability=0.9, dist_z=2.0)
+    return PyDepthDetectionBox('oakd', stream_id, frame_id, batch)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def test_flush_by_count():
+    thing = Thing()
+    writer = BatchWriter(thing, max_frames=3, window=None)
+    assert [writer.add(boxes(i)) for i in range(7)] == [0, 0, 3, 0, 0, 3, 0]
+    assert thing.writes == 2
+    assert writer.stats['pending'] == 1
+    # A frame of another stream writes the pending batch first.
+    assert writer.add(boxes(7, 'camera-2')) == 1
+    writer.close()
+    assert writer.stats == {'writes': 4, 'frames': 8, 'frames_per_write': 2.0, 'failed_frames': 0, 'pending': 0,
+                            'flushes': {'full': 2, 'window': 0, 'urgent': 0, 'stream': 1, 'flush': 0, 'close': 1}}
+
+
+def test_flush_by_time():
+    thing = Thing()
+    writer = BatchWriter(thing, max_frames=10, window=0.05)
+    started = time.monotonic()
+    writer.add(boxes(0))
+    writer.add(boxes(1))
+    assert wait_for(lambda: thing.writes == 1)
+    assert time.monotonic() - started >= 0.04
+    assert writer.stats['flushes']['window'] == 1
+    assert writer.stats['frames'] == 2
+    writer.close()
+
+
+def test_flush_by_latency_cap():
+    thing = Thing()
+    writer = BatchWriter(thing, max_frames=10, window=5.0, latency_cap=0.0)
+    writer.add(boxes(0))
+    assert writer.add(boxes(1), urgent=True) == 2
+    assert writer.stats['flushes']['urgent'] == 1
+
+    # An urgent frame brings the deadline of the pending batch forward.
+    writer.latency_cap = 0.05
+    writer.add(boxes(2))
+    writer.add(boxes(3), urgent=True)
+    assert thing.writes == 1
+    assert wait_for(lambda: thing.writes == 2, timeout=1.0)
+    assert writer.stats['flushes']['urgent'] == 2
+
+    writer.latency_cap = None
+    writer.add(boxes(4), urgent=True)
+    assert writer.stats['pending'] == 1
+    writer.close()
+
+
+def test_timer_survives_a_failing_write():
+    thing = FailingThing(1)
+    writer = BatchWriter(thing, max_frames=10, window=0.02)
+    writer.add(boxes(0))
+    assert wait_for(lambda: writer.stats['failed_frames'] == 1)
+    writer.add(boxes(1))
+    assert wait_for(lambda: thing.writes == 1)
+    assert writer.stats['frames'] == 1
+    writer.close()
+
+
+def test_add_raises_its_write_errors():
+    writer = BatchWriter(FailingThing(1), max_frames=1, window=None)
+    with pytest.raises(RuntimeError):
+        writer.add(boxes(0))
+    writer.close()
+    with pytest.raises(RuntimeError, match='closed'):
+        writer.add(boxes(1))
@@ -0,0 +1,73 @@
+import os
+
+from blob_cache import BlobCache
+
+
+class Compiler:
+    '''Writes a blob of size bytes whose content depends on the model file, counting the compilations.'''
+
+    def __init__(self, size=100):
+        self.size = size
+        self.compiled = []
+
+    def __call__(self, model, shaves, cmx_slices, nn_engines, output):
+        self.compiled.append((model, shaves, cmx_slices, nn_engines))
+        with open(output, 'wb') as f:
+            f.write(f'{model}:{shaves}:{len(self.compiled)}'.encode().ljust(self.size, b'\0'))
+        return True
+
+
+def test_hit_and_miss_on_content_change(tmp_path):
+    model_file = tmp_path / 'model.blob'
+    model_file.write_bytes(b'weights v1')
+    compiler = Compiler()
+    cache = BlobCache(str(tmp_path / 'cache'), max_bytes=10000, compiler=compiler)
+
+    path = cache.get_or_compile('mobilenet-ssd', 14, 14, 2, str(model_file))
+    assert cache.get_or_compile('mobilenet-ssd', 14, 14, 2, str(model_file)) == path
+    assert len(compiler.compiled) == 1
+    # Other resources, or a changed model, are compiled again.
+    assert cache.get_or_compile('mobilenet-ssd', 12, 12, 2, str(model_file)) != path
+    model_file.write_bytes(b'weights v2')
+    assert cache.get_or_compile('mobilenet-ssd', 14, 14, 2, str(model_file)) != path
+    assert len(compiler.compiled) == 3
+    assert len(cache.entries()) == 3
+
+
+def test_corrupt_entry_is_compiled_again(tmp_path):
+    compiler = Compiler()
+    cache = BlobCache(str(tmp_path), max_bytes=10000, compiler=compiler)
+    path = cache.get_or_compile('mobilenet-ssd', 14, 14, 2)
+    key = cache.entries()[0]['key']
+    assert cache.verify(key)
+
+    # Same size, other content.
+    with open(path, 'r+b') as f:
+        f.write(b'X')
+    assert not cache.verify(key)
+    assert cache.get(key) is None
+    assert not os.path.exists(path)
+    assert cache.get_or_compile('mobilenet-ssd', 14, 14, 2) == path
+    assert len(compiler.compiled) == 2
+    assert cache.verify(key)
+
+
+def test_failed_compilation_is_not_cached(tmp_path):
+    cache = BlobCache(str(tmp_path), max_bytes=10000, compiler=lambda *args: False)
+    assert cache.get_or_compile('mobilenet-ssd', 14, 14, 2) is None
+    assert cache.entries() == []
+
+
+def test_least_recently_used_evicted(tmp_path):
+    cache = BlobCache(str(tmp_path), max_bytes=250, compiler=Compiler(100))
+    first = cache.get_or_compile('a', 14, 14, 2)
+    second = cache.get_or_compile('b', 14, 14, 2)
+    # Used long ago, the first blob is then used again.
+    os.utime(first, (100, 100))
+    os.utime(second, (200, 200))
+    assert cache.get_or_compile('a', 14, 14, 2) == first
+
+    third = cache.get_or_compile('c', 14, 14, 2)
+    assert {entry['path'] for entry in cache.entries()} == {first, third}
+    assert not os.path.exists(second)
+    assert cache.size == 200
@@ -0,0 +1,82 @@
+import numpy as np
+
+from capture_stages import CaptureStage
+from depthai_replay import ReplayDataPacket, ReplayNNetPacket
+from depthai_wrapper import DepthAI
+
+
+class Packets:
+    '''A pipeline polling a previewout frame with a person, a depth_raw frame and a nnet packet per frame.'''
+
+    def __init__(self):
+        self.sequence_num = 0
+
+    def get_available_nnet_and_data_packets(self, blocking=False):
+        i = self.sequence_num
+        self.sequence_num += 1
+        rows = np.array([[0, 1, 0.9, 0.1, 0.2, 0.3, 0.6, 0.0, 0.0, 2.0]], dtype=np.float32)
+        return [ReplayNNetPacket(rows, i, i / 30)], [
+            ReplayDataPacket('depth_raw', np.full((4, 4), i, dtype=np.uint16), i, i / 30),
+            ReplayDataPacket('previewout', np.zeros((3, 4, 4), dtype=np.uint8), i, i / 30)]
+
+
+class Config:
+    config = {}
+    labels = ['background', 'person']
+
+
+class Recorder(CaptureStage):
+    '''Records the calls it gets, in the log shared by the stages.'''
+
+    streams = ('depth_raw',)
+
+    def __init__(self, name, calls, per_frame=True):
+        self.name = name
+        self.calls = calls
+        self.per_frame = per_frame
+        self.frames = 0
+
+    def packet(self, packet):
+        self.calls.append((self.name, 'packet', int(packet.getData()[0, 0])))
+
+    def process(self, batch, frame_packet, timestamp):
+        self.frames += 1
+        self.calls.append((self.name, 'process', len(batch)))
+
+    def replaces(self, previous):
+        self.frames = previous.frames
+
+
+def capture(depthai, frames):
+    captured = depthai.capture()
+    return [next(captured) for _ in range(frames)]
+
+
+def test_stages_in_order():
+    calls = []
+    stages = [Recorder('track', calls), Recorder('video', calls, per_frame=False), Recorder('roi_depth', calls)]
+    depthai = DepthAI(Config(), 's', 'e', 'people', pipeline=Packets(), stages=stages)
+    capture(depthai, 1)
+    assert calls == [('video', 'packet', 0), ('roi_depth', 'packet', 0), ('track', 'packet', 0),
+                     ('roi_depth', 'process', 1), ('track', 'process', 1)]
+
+
+def test_reconfigured_stages_carry_over():
+    calls = []
+    first = Recorder('track', calls)
+    depthai = DepthAI(Config(), 's', 'e', 'people', pipeline=Packets(), stages=[first])
+    captured = depthai.capture()
+    for _ in range(3):
+        next(captured)
+    second = Recorder('track', calls)
+    depthai.reconfigure({'stages': {'track': second}})
+    next(captured)
+    assert (first.frames, second.frames) == (3, 4)
+
+    depthai.reconfigure({'stages': {'track': None}})
+    next(captured)
+    assert second.frames == 4
+    third = Recorder('track', calls)
+    depthai.reconfigure({'stages': {'track': third}})
+    next(captured)
+    assert third.frames == 5
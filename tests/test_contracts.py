@@ -0,0 +1,87 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from decorators.contracts import PreconditionError, preconditions
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@preconditions(lambda name: isinstance(name, str) and len(name) > 0,
+               lambda count, limit=10: 0 <= count < limit)
+def tag(name, count=1, flow=None):
+    return f'{name}:{count}:{flow}'
+
+
+def test_conditions_bound_to_the_arguments():
+    assert tag('person') == 'person:1:None'
+    assert tag('person', 9, flow='f') == 'person:9:f'
+    assert tag(count=2, name='box') == 'box:2:None'
+    with pytest.raises(PreconditionError, match='Precondition failed in call'):
+        tag('')
+    with pytest.raises(PreconditionError):
+        tag('person', count=10)
+    # The TypeError of the function for a missing argument.
+    with pytest.raises(TypeError, match='name'):
+        tag(count=2)
+    assert tag.nopre('', 99) == ':99:None'
+
+
+def test_falsy_result_fails():
+    @preconditions(lambda items: items)
+    def first(items):
+        return items[0]
+
+    assert first([1]) == 1
+    for falsy in ([], 0, None, ''):
+        with pytest.raises(PreconditionError):
+            first(falsy)
+
+
+def test_condition_error_raised():
+    @preconditions(lambda value: (value > 0, ValueError(f'{value} is not positive')))
+    def root(value):
+        return value ** 0.5
+
+    assert root(4) == 2.0
+    with pytest.raises(ValueError, match='-1 is not positive'):
+        root(-1)
+
+
+def test_invalid_conditions():
+    with pytest.raises(PreconditionError, match='unknown parameter'):
+        preconditions(lambda other: True)(lambda value: value)
+    with pytest.raises(PreconditionError, match='masks parameter'):
+        preconditions(lambda value, limit=1: True)(lambda value, limit: value)
+    with pytest.raises(PreconditionError, match='must not'):
+        preconditions(lambda *args: True)
+
+
+CHECK = '''
+from decorators.contracts import enabled, preconditions
+def f(value):
+    return value
+g = preconditions(lambda value: value > 0)(f)
+print(enabled, g is f, g(-1))
+'''
+
+
+@pytest.mark.parametrize('flags, env, output', [
+    ([], {}, None),
+    (['-O'], {}, 'False True -1'),
+    ([], {'DISABLE_PRECONDITIONS': '1'}, 'False True -1'),
+    ([], {'DISABLE_PRECONDITIONS': '0'}, None),
+])
+def test_disabled_with_optimizations_or_the_environment(flags, env, output):
+    environ = dict(os.environ, **env)
+    environ.pop('PYTHONOPTIMIZE', None)
+    if 'DISABLE_PRECONDITIONS' not in env:
+        environ.pop('DISABLE_PRECONDITIONS', None)
+    result = subprocess.run([sys.executable] + flags + ['-c', CHECK], cwd=ROOT, env=environ,
+                            capture_output=True, text=True)
+    if output is None:
+        assert result.returncode != 0 and 'PreconditionError' in result.stderr
+    else:
+        assert result.stdout.strip() == output
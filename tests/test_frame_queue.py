@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+from frame_queue import DropPolicy, FrameQueue, QueueClosed
+
+
+def fill(queue, items):
+    return [queue.put(item) for item in items]
+
+
+def test_drop_oldest():
+    queue = FrameQueue(2, DropPolicy.DROP_OLDEST)
+    assert fill(queue, [1, 2, 3, 4]) == [True, True, False, False]
+    assert [queue.get(), queue.get()] == [3, 4]
+    assert queue.dropped == 2
+    assert queue.stats == {'depth': 0, 'max_depth': 2, 'put': 4, 'dropped': 2}
+
+
+def test_drop_newest():
+    queue = FrameQueue(2, DropPolicy.DROP_NEWEST)
+    assert fill(queue, [1, 2, 3, 4]) == [True, True, False, False]
+    assert [queue.get(), queue.get()] == [1, 2]
+    assert queue.stats == {'depth': 0, 'max_depth': 2, 'put': 4, 'dropped': 2}
+
+
+def test_policy_from_its_value():
+    assert FrameQueue(1, 'drop-newest').policy == DropPolicy.DROP_NEWEST
+    with pytest.raises(ValueError):
+        FrameQueue(0)
+
+
+def test_block_waits_for_room():
+    queue = FrameQueue(1, DropPolicy.BLOCK)
+    queue.put(1)
+    # Nothing is taken, the put gives up after the timeout and counts the item as dropped.
+    assert not queue.put(2, timeout=0.05)
+    assert queue.dropped == 1
+
+    consumer = threading.Timer(0.05, queue.get)
+    consumer.start()
+    started = time.monotonic()
+    assert queue.put(3, timeout=5.0)
+    assert time.monotonic() - started >= 0.04
+    consumer.join()
+    assert queue.get() == 3
+    assert queue.stats == {'depth': 0, 'max_depth': 1, 'put': 3, 'dropped': 1}
+
+
+def test_close_wakes_a_blocked_producer():
+    queue = FrameQueue(1, DropPolicy.BLOCK)
+    queue.put(1)
+    threading.Timer(0.05, queue.close).start()
+    with pytest.raises(QueueClosed):
+        queue.put(2, timeout=5.0)
+
+
+def test_close_drains_the_queue():
+    queue = FrameQueue(4)
+    fill(queue, [1, 2, 3])
+    queue.close()
+    with pytest.raises(QueueClosed):
+        queue.put(4)
+    assert list(queue) == [1, 2, 3]
+    with pytest.raises(QueueClosed):
+        queue.get(timeout=0.01)
+
+
+def test_get_times_out():
+    with pytest.raises(TimeoutError):
+        FrameQueue().get(timeout=0.01)
@@ -0,0 +1,81 @@
+import numpy as np
+
+from depthai_replay import ReplayDataPacket, ReplayNNetPacket
+from packet_pairing import PacketPairer
+
+ROWS = np.zeros((1, 10), dtype=np.float32)
+
+
+def frame(sequence_num, timestamp=None):
+    timestamp = sequence_num / 30 if timestamp is None else timestamp
+    return ReplayDataPacket('previewout', np.zeros((3, 2, 2), dtype=np.uint8), sequence_num, timestamp)
+
+
+def result(sequence_num, timestamp=None):
+    timestamp = sequence_num / 30 if timestamp is None else timestamp
+    return ReplayNNetPacket(ROWS, sequence_num, timestamp)
+
+
+def test_pairs_by_sequence_number():
+    pairer = PacketPairer()
+    frames = [frame(i) for i in range(4)]
+    results = [result(1), result(3)]
+    assert pairer.add_frame(frames[0]) == []
+    assert pairer.add_frame(frames[1]) == []
+    # The result of frame 1 arrives a poll late, frame 0 was skipped by the NN.
+    assert pairer.add_result(results[0]) == [(frames[1], results[0])]
+    assert pairer.add_result(results[1]) == []
+    assert pairer.add_frame(frames[2]) == []
+    assert pairer.add_frame(frames[3]) == [(frames[3], results[1])]
+    assert pairer.stats == {'unpaired_frames': 2, 'unpaired_results': 0, 'waiting_frames': 0, 'waiting_results': 0}
+
+
+def test_result_without_its_frame_is_dropped():
+    pairer = PacketPairer()
+    pairer.add_result(result(5))
+    late = frame(6)
+    assert pairer.add_frame(late) == []
+    assert pairer.stats['unpaired_results'] == 1
+    assert pairer.add_result(result(6))[0][0] is late
+
+
+def test_pairs_by_timestamp_within_tolerance():
+    pairer = PacketPairer(tolerance=0.015)
+    near = frame(-1, 1.0)
+    assert pairer.add_frame(near) == []
+    paired = result(-1, 1.01)
+    assert pairer.add_result(paired) == [(near, paired)]
+
+    pairer.add_frame(frame(-1, 2.0))
+    # 20 ms after the frame, the result is for a newer frame.
+    assert pairer.add_result(result(-1, 2.02)) == []
+    assert pairer.stats['unpaired_frames'] == 1
+    assert pairer.stats['waiting_results'] == 1
+    later = frame(-1, 2.025)
+    assert len(pairer.add_frame(later)) == 1
+
+
+def test_window_evicts_the_oldest():
+    pairer = PacketPairer(window=3)
+    for i in range(5):
+        pairer.add_frame(frame(i))
+    assert pairer.stats == {'unpaired_frames': 2, 'unpaired_results': 0, 'waiting_frames': 3, 'waiting_results': 0}
+    assert pairer.add_result(result(1)) == []
+    assert pairer.stats['unpaired_results'] == 1
+
+    pairer.clear()
+    for i in range(10, 15):
+        pairer.add_result(result(i))
+    assert pairer.stats == {'unpaired_frames': 2, 'unpaired_results': 3, 'waiting_frames': 0, 'waiting_results': 3}
+
+
+def test_frame_for_a_result():
+    pairer = PacketPairer(window=2)
+    frames = [frame(i) for i in range(3)]
+    for packet in frames:
+        pairer.keep_frame(packet)
+    assert pairer.frame_for(result(2)) is frames[2]
+    # Frame 0 is beyond the window, frame 3 has not arrived.
+    assert pairer.frame_for(result(0)) is None
+    assert pairer.frame_for(result(3)) is None
+    assert pairer.stats['unpaired_frames'] == 0
@@ -0,0 +1,61 @@
+from datacls import DetectionBatch
+from datariver.publish_policy import PublishPolicy
+
+
+def frame(*people, obj_ids=None):
+    '''A batch of person boxes at the given (x, z) positions in metres, the box follows x.'''
+    batch = DetectionBatch(labels=['background', 'person'])
+    for i, (x, z) in enumerate(people):
+        left = 0.5 + x / 10
+        batch.append(obj_id=obj_ids[i] if obj_ids else 0, class_id=1, x1=left, y1=0.2, x2=left + 0.05, y2=0.6,
+                     probability=0.9, dist_x=x, dist_y=0.0, dist_z=z)
+    return batch
+
+
+def test_max_rate():
+    policy = PublishPolicy(max_rate=10.0, heartbeat=None, position_tolerance=None)
+    published = [policy.should_publish(frame((i / 10, 2.0)), i * 0.04) for i in range(30)]
+    # One frame in three at 25 frames per second.
+    assert published == [True, False, False] * 10
+    assert policy.stats == {'published': 10, 'suppressed_rate': 20, 'suppressed_unchanged': 0, 'suppressed': 20}
+
+
+def test_unchanged_frames_are_suppressed_until_the_heartbeat():
+    policy = PublishPolicy(heartbeat=1.0)
+    published = [policy.should_publish(frame((0.0, 2.0), (1.0, 3.0)), i / 10) for i in range(21)]
+    assert published == [True] + [False] * 9 + [True] + [False] * 9 + [True]
+    assert policy.stats['suppressed_unchanged'] == 18
+
+    policy = PublishPolicy(heartbeat=None)
+    assert [policy.should_publish(frame(), i * 10.0) for i in range(3)] == [True, False, False]
+
+
+def test_delta_tolerance():
+    policy = PublishPolicy(heartbeat=None, position_tolerance=0.05, box_tolerance=0.01)
+    assert policy.should_publish(frame((0.0, 2.0)), 0.0)
+    # 3 cm is within the tolerances, moving the box 0.3% of the frame.
+    assert not policy.should_publish(frame((0.03, 2.0)), 0.1)
+    # Compared with the last frame published, not the last one seen.
+    assert policy.should_publish(frame((0.06, 2.0)), 0.2)
+    assert not policy.should_publish(frame((0.06, 2.04)), 0.3)
+    # Someone arrives, or the same number of boxes of another class.
+    assert policy.should_publish(frame((0.06, 2.0), (3.0, 3.0)), 0.4)
+    other = frame((0.06, 2.0), (3.0, 3.0))
+    other.class_id[1] = 2
+    assert policy.should_publish(other, 0.5)
+    assert policy.stats == {'published': 4, 'suppressed_rate': 0, 'suppressed_unchanged': 2, 'suppressed': 2}
+
+
+def test_boxes_matched_by_obj_id():
+    policy = PublishPolicy(heartbeat=None)
+    assert policy.should_publish(frame((0.0, 2.0), (1.0, 2.0), obj_ids=[1, 2]), 0.0)
+    # Listed in another order, the same people did not move.
+    assert not policy.should_publish(frame((1.0, 2.0), (0.0, 2.0), obj_ids=[2, 1]), 0.1)
+    # The two swapped places.
+    assert policy.should_publish(frame((1.0, 2.0), (0.0, 2.0), obj_ids=[1, 2]), 0.2)
+
+
+def test_delta_check_disabled():
+    policy = PublishPolicy(heartbeat=None, position_tolerance=None)
+    assert all(policy.should_publish(frame((0.0, 2.0)), i / 30) for i in range(5))
+    assert policy.stats['suppressed'] == 0
@@ -0,0 +1,129 @@
+import time
+
+import numpy as np
+import pytest
+
+from depthai_decode import NNET_FIELDS, NNET_FIELDS_NO_DEPTH
+from depthai_replay import ReplayPipeline, TraceConfig, TraceExhausted, TraceReader, TraceRecorder
+from depthai_wrapper import DepthAI
+from packet_pairing import packet_key
+
+
+class Metadata:
+    def __init__(self, sequence_num, timestamp):
+        self.sequence_num, self.timestamp = sequence_num, timestamp
+
+    def getSequenceNum(self):
+        return self.sequence_num
+
+    def getTimestamp(self):
+        return self.timestamp
+
+
+class NNetPacket:
+    def __init__(self, rows, sequence_num):
+        self.rows = rows
+        self.metadata = Metadata(sequence_num, sequence_num / 30)
+
+    def entries(self):
+        return [(dict(zip(NNET_FIELDS, row)),) for row in self.rows]
+
+    def getMetadata(self):
+        return self.metadata
+
+
+class DataPacket:
+    stream_name = 'previewout'
+
+    def __init__(self, data, sequence_num):
+        self.data = data
+        self.metadata = Metadata(sequence_num, sequence_num / 30)
+
+    def getData(self):
+        return self.data
+
+    def getMetadata(self):
+        return self.metadata
+
+
+def detection(confidence):
+    return [0, 1, confidence, 0.1, 0.2, 0.3, 0.6, 0.5, 0.0, 2.0]
+
+
+def record(path, batches=3, timestep=0.0, nnet_fields=NNET_FIELDS):
+    '''A trace of batches frames, each with a nnet packet of a detection above 0.5 and one below.'''
+    recorder = TraceRecorder(str(path), labels=['background', 'person'], nnet_fields=nnet_fields)
+    frames = []
+    for i in range(batches):
+        frame = np.full((3, 4, 6), i, dtype=np.uint8)
+        frames.append(frame)
+        recorder.record([NNetPacket([detection(0.9), detection(0.4), [-1] + [0] * 9], i)],
+                        [DataPacket(frame, i)], timestamp=i * timestep)
+    recorder.close()
+    return frames
+
+
+def test_trace_round_trip(tmp_path):
+    frames = record(tmp_path / 'trace.dait')
+    reader = TraceReader(str(tmp_path / 'trace.dait'))
+    assert reader.labels == ['background', 'person']
+    batches = list(reader)
+    assert len(batches) == 3
+    for i, (timestamp, nnet_packets, data_packets) in enumerate(batches):
+        assert timestamp == 0.0
+        rows = nnet_packets[0].get_tensor()
+        assert rows.shape == (3, len(NNET_FIELDS))
+        np.testing.assert_allclose(rows[0], detection(0.9), rtol=1e-6)
+        assert nnet_packets[0].entries()[0][0]['confidence'] == pytest.approx(0.9)
+        assert packet_key(nnet_packets[0]) == (i, pytest.approx(i / 30))
+        assert data_packets[0].stream_name == 'previewout'
+        np.testing.assert_array_equal(data_packets[0].getData(), frames[i])
+        assert packet_key(data_packets[0]) == (i, pytest.approx(i / 30))
+
+
+def test_trace_keeps_its_nnet_fields(tmp_path):
+    record(tmp_path / 'trace.dait', nnet_fields=NNET_FIELDS_NO_DEPTH)
+    reader = TraceReader(str(tmp_path / 'trace.dait'))
+    assert reader.nnet_fields == NNET_FIELDS_NO_DEPTH
+    _, nnet_packets, _ = next(iter(reader))
+    rows = nnet_packets[0].get_tensor()
+    assert rows.shape == (3, len(NNET_FIELDS_NO_DEPTH))
+    np.testing.assert_allclose(rows[0], detection(0.9)[:len(NNET_FIELDS_NO_DEPTH)], rtol=1e-6)
+    assert set(nnet_packets[0].entries()[0][0]) == set(NNET_FIELDS_NO_DEPTH)
+
+
+def test_replay_through_capture(tmp_path):
+    frames = record(tmp_path / 'trace.dait')
+    pipeline = ReplayPipeline(str(tmp_path / 'trace.dait'), speed=0)
+    depthai = DepthAI(TraceConfig(pipeline.labels, pipeline.nnet_fields), 'replay', 'replay', 'people',
+                      pipeline=pipeline)
+    captured = list(depthai.capture())
+    assert len(captured) == 3
+    for (frame, boxes), planar in zip(captured, frames):
+        np.testing.assert_array_equal(frame.copy(), planar.transpose(1, 2, 0))
+        assert len(boxes.batch) == 1
+
+
+def test_replay_exhausted_unless_looped(tmp_path):
+    record(tmp_path / 'trace.dait')
+    pipeline = ReplayPipeline(str(tmp_path / 'trace.dait'), speed=0)
+    for _ in range(3):
+        pipeline.get_available_nnet_and_data_packets()
+    with pytest.raises(TraceExhausted):
+        pipeline.get_available_nnet_and_data_packets()
+
+    pipeline = ReplayPipeline(str(tmp_path / 'trace.dait'), speed=0, loop=True)
+    sequence = [packet_key(pipeline.get_available_nnet_and_data_packets()[1][0])[0] for _ in range(7)]
+    assert sequence == [0, 1, 2, 0, 1, 2, 0]
+
+
+def test_replay_speed(tmp_path):
+    record(tmp_path / 'trace.dait', batches=2, timestep=0.2)
+    pipeline = ReplayPipeline(str(tmp_path / 'trace.dait'), speed=2.0)
+    assert len(pipeline.get_available_nnet_and_data_packets()[0]) == 1
+    started = time.monotonic()
+    # The second batch is due 0.1 s after the first at twice the speed.
+    assert pipeline.get_available_nnet_and_data_packets() == ([], [])
+    nnet_packets, _ = pipeline.get_available_nnet_and_data_packets(blocking=True)
+    assert len(nnet_packets) == 1
+    assert 0.05 < time.monotonic() - started < 0.5
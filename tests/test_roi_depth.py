@@ -0,0 +1,74 @@
+import numpy as np
+
+from analytics.roi_depth import RoiDepth
+
+
+def depth_frame(rng, h=400, w=640):
+    '''A wall at 6 m with two people in front of it, noise and holes without depth.'''
+    depth = rng.normal(6000.0, 50.0, (h, w))
+    depth[100:380, 100:200] = rng.normal(1800.0, 40.0, (280, 100))
+    depth[60:390, 350:470] = rng.normal(3500.0, 80.0, (330, 120))
+    depth[rng.random((h, w)) < 0.2] = 0
+    depth[:, :20] = 0
+    return depth.astype(np.uint16)
+
+
+def brute_force(roi_depth, depth, boxes, q):
+    '''The quantiles and valid ratio of every ROI from its pixels; binned as RoiDepth and exact.'''
+    sampled = depth[::roi_depth.stride, ::roi_depth.stride].astype(np.float64)
+    top, left, bottom, right = roi_depth.rois(*boxes.T)
+    binned, exact, valid_ratio = [], [], []
+    for t, l, b, r in zip(top, left, bottom, right):
+        roi = sampled[t:b, l:r].ravel()
+        valid = roi[(roi >= roi_depth.edges[0]) & (roi < roi_depth.edges[-1])]
+        valid_ratio.append(len(valid) / roi.size if roi.size else 0.0)
+        if len(valid) == 0:
+            binned.append(np.nan)
+            exact.append(np.nan)
+            continue
+        counts, _ = np.histogram(valid, roi_depth.edges)
+        cumulative = np.cumsum(counts)
+        rank = q * len(valid)
+        i = min(int(np.sum(cumulative < rank)), roi_depth.bins - 1)
+        before = cumulative[i - 1] if i > 0 else 0
+        fraction = np.clip((rank - before) / counts[i], 0, 1) if counts[i] > 0 else 0.5
+        lower, upper = roi_depth.edges[i], roi_depth.edges[i + 1]
+        binned.append((lower + (upper - lower) * fraction) / 1000.0)
+        exact.append(np.percentile(valid, 100 * q) / 1000.0)
+    return np.array(binned), np.array(exact), np.array(valid_ratio)
+
+
+def test_stats_match_brute_force():
+    rng = np.random.default_rng(3)
+    depth = depth_frame(rng)
+    boxes = np.array([
+        [100 / 640, 100 / 400, 200 / 640, 380 / 400],   # the near person
+        [350 / 640, 60 / 400, 470 / 640, 390 / 400],    # the far person
+        [0.9, 0.1, 0.99, 0.2],                          # the wall
+        [0.0, 0.0, 0.03, 1.0],                          # no depth
+        [0.5, 0.5, 0.5, 0.6],                           # empty
+    ])
+    for stride in (1, 4, 8):
+        roi_depth = RoiDepth(stride=stride, padding=0.3, percentile=25.0)
+        roi_depth.build(depth)
+        stats = roi_depth.stats(*boxes.T)
+        for field, q in (('median', 0.5), ('percentile', 0.25)):
+            binned, exact, valid_ratio = brute_force(roi_depth, depth, boxes, q)
+            np.testing.assert_allclose(getattr(stats, field), binned, rtol=1e-9, equal_nan=True)
+            # Within the width of a bin, about 8.5% of the depth, of the exact quantile.
+            np.testing.assert_allclose(getattr(stats, field), exact, rtol=0.09, equal_nan=True)
+        np.testing.assert_allclose(stats.valid_ratio, valid_ratio, rtol=1e-9)
+
+    assert abs(stats.median[0] - 1.8) < 0.1 and abs(stats.median[1] - 3.5) < 0.2 and abs(stats.median[2] - 6.0) < 0.3
+    assert np.isnan(stats.median[3]) and stats.valid_ratio[3] == 0.0
+    assert np.isnan(stats.median[4]) and stats.valid_ratio[4] == 0.0
+
+
+def test_tables_rebuilt_per_frame():
+    roi_depth = RoiDepth(stride=2)
+    roi_depth.build(np.full((40, 60), 2000, dtype=np.uint16))
+    roi_depth.build(np.full((40, 60), 4000, dtype=np.uint16))
+    stats = roi_depth.stats([0.2], [0.2], [0.8], [0.8])
+    assert abs(stats.median[0] - 4.0) < 0.35
+    assert stats.valid_ratio[0] == 1.0
+    assert len(roi_depth.stats([], [], [], []).median) == 0
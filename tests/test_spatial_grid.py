@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from analytics.spatial_grid import SpatialGrid
+
+
+def brute_force(keys, positions, distance):
+    pairs = set()
+    for i in range(len(keys)):
+        for j in range(i + 1, len(keys)):
+            if np.linalg.norm(positions[i] - positions[j]) < distance:
+                pairs.add(frozenset((keys[i], keys[j])))
+    return pairs
+
+
+def found(grid, distance=None):
+    result = grid.pairs_within(distance)
+    return {frozenset(pair) for pair in zip(result.a, result.b)}
+
+
+def people(rng, n, size=6.0):
+    positions = rng.uniform(-size, size, (n, 3))
+    positions[:, 1] = 0.0
+    return positions
+
+
+def test_pairs_match_brute_force():
+    rng = np.random.default_rng(1)
+    grid = SpatialGrid(1.5)
+    for n in (0, 1, 2, 50, 200):
+        keys = list(range(n))
+        positions = people(rng, n)
+        grid.update(keys, positions)
+        assert found(grid) == brute_force(keys, positions, 1.5)
+        assert found(grid, 0.5) == brute_force(keys, positions, 0.5)
+
+
+def test_min_distance():
+    grid = SpatialGrid(1.0)
+    grid.update(['a', 'b', 'c'], [[0.0, 0.0, 0.0], [0.3, 0.0, 0.4], [5.0, 0.0, 5.0]])
+    result = grid.pairs_within()
+    assert result.min_distance == pytest.approx(0.5)
+    assert (result.a, result.b) == (['a'], ['b'])
+    grid.update(['a'], [[0.0, 0.0, 0.0]])
+    assert grid.pairs_within().min_distance == -1.0
+    with pytest.raises(ValueError):
+        grid.pairs_within(2.0)
+
+
+def test_update_moved_added_and_removed():
+    rng = np.random.default_rng(2)
+    keys = [f'id{i}' for i in range(100)]
+    positions = people(rng, 100)
+    grid = SpatialGrid(1.0)
+    grid.update(keys, positions)
+    assert grid.moved == 100
+
+    for step in range(20):
+        # Everyone walks a little, some leave and some arrive.
+        positions = positions + rng.normal(0.0, 0.2, positions.shape) * [1.0, 0.0, 1.0]
+        leaving = set(rng.choice(len(keys), 5, replace=False).tolist())
+        keys = [key for i, key in enumerate(keys) if i not in leaving] + [f'new{step}-{i}' for i in range(5)]
+        positions = np.concatenate([np.delete(positions, sorted(leaving), axis=0), people(rng, 5)])
+        order = rng.permutation(len(keys))
+        keys, positions = [keys[i] for i in order], positions[order]
+
+        grid.update(keys, positions)
+        assert len(grid) == len(keys)
+        assert found(grid) == brute_force(keys, positions, 1.0)
+        rebuilt = SpatialGrid(1.0)
+        rebuilt.update(keys, positions)
+        assert found(grid) == found(rebuilt)
+
+
+def test_moved_counts_changed_cells():
+    grid = SpatialGrid(1.0)
+    positions = np.array([[0.5, 0.0, 0.5], [2.5, 0.0, 0.5], [4.5, 0.0, 0.5]])
+    grid.update([1, 2, 3], positions)
+    positions[0, 0] = 0.9
+    grid.update([1, 2, 3], positions)
+    assert grid.moved == 0
+    positions[1, 0] = 3.5
+    grid.update([1, 2, 3], positions)
+    assert grid.moved == 1
+    assert found(grid) == set()
+    # 2 is removed, 4 added next to 3 and 1 moved next to 3 as well.
+    grid.update([3, 4, 1], [[4.5, 0.0, 0.5], [4.9, 0.0, 0.5], [4.0, 0.0, 0.5]])
+    assert grid.moved == 2
+    assert found(grid) == {frozenset((3, 4)), frozenset((3, 1)), frozenset((4, 1))}
+    grid.clear()
+    assert len(grid) == 0 and found(grid) == set()
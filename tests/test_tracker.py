@@ -0,0 +1,54 @@
+from analytics.tracker import Tracker, TrackerStage
+from datacls import DetectionBatch
+
+FRAME = 1 / 30
+
+
+def frame(*people):
+    '''A batch of person boxes at the given (x, z) positions in metres, the box follows x.'''
+    batch = DetectionBatch(labels=['background', 'person'])
+    for x, z in people:
+        left = 0.5 + x / 10
+        batch.append(class_id=1, x1=left, y1=0.2, x2=left + 0.05, y2=0.6, probability=0.9,
+                     dist_x=x, dist_y=0.0, dist_z=z)
+    return batch
+
+
+def test_reidentified_after_occlusion():
+    '''A person walking who stops behind an occluder keeps their id when they reappear.'''
+    tracker = Tracker()
+    now = 0.0
+    for i in range(30):
+        ids = tracker.update(frame((i * FRAME, 3.0), (-1.0, 2.0)), now)
+        now += FRAME
+    walker, bystander = ids
+    # Nobody is detected for a second, the walker has stopped when they reappear.
+    for _ in range(30):
+        tracker.update(frame(), now)
+        now += FRAME
+    ids = tracker.update(frame((1.0, 3.0), (-1.0, 2.0)), now)
+    assert list(ids) == [walker, bystander]
+    assert tracker.stats['reidentified'] == 2
+
+
+def test_missed_tracks_are_not_active():
+    tracker = Tracker()
+    tracker.update(frame((0.0, 3.0), (2.0, 3.0)), 0.0)
+    tracker.update(frame((0.0, 3.0)), FRAME)
+    assert tracker.stats['active'] == 1
+    assert tracker.stats['lost'] == 1
+    tracker.update(frame(), 2 * FRAME)
+    assert tracker.stats['active'] == 0
+    assert tracker.stats['lost'] == 2
+
+
+def test_stage_continues_the_ids_it_replaces():
+    first = TrackerStage(Tracker())
+    batch = frame((0.0, 3.0), (2.0, 3.0))
+    first.process(batch, None, 0.0)
+    assert list(batch.obj_id) == [1, 2]
+    second = TrackerStage(Tracker())
+    second.replaces(first)
+    batch = frame((0.0, 3.0))
+    second.process(batch, None, FRAME)
+    assert list(batch.obj_id) == [3]
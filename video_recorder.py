@@ -0,0 +1,187 @@
+import logging as log
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from capture_stages import CaptureStage
+
+H264 = 'h264'
+H265 = 'h265'
+
+# NAL unit types that start an independently decodable access unit: SPS and IDR slices for H.264,
+# VPS, SPS and IDR/CRA slices for H.265.
+_KEYFRAME_NALS = {H264: {5, 7}, H265: {16, 17, 18, 19, 20, 21, 32, 33}}
+
+
+def codec_for(path: str) -> str:
+    '''The codec of an encoded video file from its suffix, H.264 unless it is .h265 or .hevc.'''
+    return H265 if Path(path).suffix.lower() in ('.h265', '.hevc') else H264
+
+
+def is_keyframe(data: bytes, codec: str = H264) -> bool:
+    '''Whether an Annex B encoded packet holds a NAL unit a decoder can start from.'''
+    keyframe_nals = _KEYFRAME_NALS[codec]
+    i = data.find(b'\x00\x00\x01')
+    while 0 <= i < len(data) - 3:
+        header = data[i + 3]
+        nal = header & 0x1f if codec == H264 else (header >> 1) & 0x3f
+        if nal in keyframe_nals:
+            return True
+        i = data.find(b'\x00\x00\x01', i + 3)
+    return False
+
+
+class VideoRecorder(CaptureStage):
+    '''
+    Writes the encoded packets of the device video stream to rotating segment files on a background
+    thread, so recording never blocks the capture loop.
+
+    write() only queues the packet. When more than max_queue bytes are waiting (the disk cannot keep
+    up) packets are dropped, up to the next keyframe so the segment stays decodable. Segments are
+    written with buffer_size buffered writes and named <stem>-<start time>-<n><suffix> after path. A
+    new segment is started at the first keyframe once the current one holds segment_bytes or is
+    segment_seconds old. The oldest segments are deleted beyond max_segments or max_total_bytes.
+    As a stage of DepthAI.capture() it writes the packets of the video stream.
+    '''
+
+    name = 'video'
+    streams = ('video',)
+    per_frame = False
+
+    def __init__(self, path: str, segment_bytes: int = 256 << 20, segment_seconds: float = 600.0,
+                 max_segments: int = 24, max_total_bytes: int = None, buffer_size: int = 1 << 20,
+                 max_queue: int = 32 << 20, codec: str = None):
+        self.__path = Path(path)
+        self.__codec = codec if codec is not None else codec_for(path)
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.max_segments = max_segments
+        self.max_total_bytes = max_total_bytes
+        self.__buffer_size = buffer_size
+        self.__max_queue = max_queue
+        self.__pending = deque()
+        self.__queued = 0
+        self.__waiting_keyframe = True
+        self.__closed = False
+        self.__lock = threading.Condition()
+        self.__file = None
+        self.__segment_start = None
+        self.__segment_size = 0
+        self.__flushed = time.monotonic()
+        self.__sequence = 0
+        self.__segments = 0
+        self.__packets = 0
+        self.__bytes = 0
+        self.__dropped = 0
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        self.__thread = threading.Thread(target=self.__run, name='video-recorder', daemon=True)
+        self.__thread.start()
+
+    @property
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                'segments': self.__segments,
+                'packets': self.__packets,
+                'bytes': self.__bytes,
+                'dropped': self.__dropped,
+                'queued_bytes': self.__queued,
+            }
+
+    def write(self, data) -> bool:
+        '''Queue an encoded packet, returns False when it was dropped.'''
+        data = bytes(data)
+        keyframe = is_keyframe(data, self.__codec)
+        with self.__lock:
+            if self.__closed:
+                return False
+            if self.__waiting_keyframe and not keyframe:
+                self.__dropped += 1
+                return False
+            if self.__queued + len(data) > self.__max_queue:
+                self.__dropped += 1
+                self.__waiting_keyframe = True
+                return False
+            self.__waiting_keyframe = False
+            self.__pending.append((data, keyframe))
+            self.__queued += len(data)
+            self.__lock.notify()
+            return True
+
+    def packet(self, packet) -> None:
+        self.write(packet.getData())
+
+    def segments(self) -> list:
+        '''The segment files of this recorder on disk, oldest first.'''
+        return sorted(self.__path.parent.glob(f'{self.__path.stem}-*{self.__path.suffix}'))
+
+    def __open_segment(self) -> None:
+        if self.__file is not None:
+            self.__file.close()
+        self.__sequence += 1
+        name = f'{self.__path.stem}-{time.strftime("%Y%m%d-%H%M%S")}-{self.__sequence:04d}{self.__path.suffix}'
+        self.__file = open(self.__path.parent / name, 'wb', buffering=self.__buffer_size)
+        self.__segment_start = time.monotonic()
+        self.__segment_size = 0
+        self.__segments += 1
+        self.__apply_retention()
+
+    def __apply_retention(self) -> None:
+        segments = self.segments()
+        sizes = [s.stat().st_size for s in segments]
+        total = sum(sizes)
+        # The segment being written is the newest and is never removed.
+        for segment, size in zip(segments[:-1], sizes[:-1]):
+            over_count = self.max_segments is not None and len(segments) > self.max_segments
+            over_size = self.max_total_bytes is not None and total > self.max_total_bytes
+            if not over_count and not over_size:
+                break
+            try:
+                segment.unlink()
+            except OSError as e:
+                log.warning(f'Could not remove video segment {segment}: {e}')
+            segments = segments[1:]
+            total -= size
+
+    def __rotate_due(self) -> bool:
+        return self.__file is None or self.__segment_size >= self.segment_bytes or \
+            time.monotonic() - self.__segment_start >= self.segment_seconds
+
+    def __run(self) -> None:
+        while True:
+            with self.__lock:
+                while not self.__pending and not self.__closed:
+                    self.__lock.wait()
+                if not self.__pending and self.__closed:
+                    break
+                packets, self.__pending = self.__pending, deque()
+            written = 0
+            try:
+                for data, keyframe in packets:
+                    if keyframe and self.__rotate_due():
+                        self.__open_segment()
+                    self.__file.write(data)
+                    self.__segment_size += len(data)
+                    written += len(data)
+                # Bound what a crash can lose to about a second of video.
+                if self.__file is not None and time.monotonic() - self.__flushed >= 1.0:
+                    self.__file.flush()
+                    self.__flushed = time.monotonic()
+            except Exception:
+                log.exception('Writing the video failed')
+            with self.__lock:
+                self.__queued -= sum(len(data) for data, _ in packets)
+                self.__packets += len(packets)
+                self.__bytes += written
+        if self.__file is not None:
+            self.__file.close()
+
+    def close(self) -> None:
+        '''Write the queued packets and close the segment.'''
+        with self.__lock:
+            if self.__closed:
+                return
+            self.__closed = True
+            self.__lock.notify()
+        self.__thread.join()